@@ -0,0 +1,674 @@
+#!/usr/bin/env python
+
+"""Time how long various parts of khan-linter take.
+
+USAGE:
+   benchmark.py [options] [benchmark] ...
+
+With no arguments, runs all the benchmarks.  Each benchmark works on
+synthetic data -- a made-up tree of files, say -- that we generate
+from a fixed random seed, so runs are comparable to each other.
+
+The benchmarks:
+   blacklist: check each path in a tree of --num-paths paths against
+      a blacklist with --num-blacklist-entries entries, as runlint
+      does when deciding what files to lint.
+   walk: make a tree of --num-paths (empty) files on disk, with that
+      blacklist at the top, and time finding the files to lint in it,
+      using --discovery.  The tree is a git repository, with all the
+      files added to it, except for another --num-paths/2 files of
+      build output that git ignores (and the blacklist doesn't).
+   end-to-end: make a synthetic corpus of --num-files files on disk
+      (see write_synthetic_corpus()) and time runlint.main() linting
+      all of it, with --jobs, and without the lint cache.
+   python-parse, pep8, pyflakes, git, static-content-refs: time one
+      linter (or, for python-parse, the parsing the python linters
+      share) on the files of that corpus that it lints.  We make the
+      file contents afresh for every file, so pep8 and pyflakes each
+      include the time to parse.  We take the best of --repeat runs.
+
+Use --save to append the results to a file, and --compare to compare
+them against the last results saved there (with the same options).
+Any timing more than --threshold percent worse than before is
+flagged as a regression, and we exit 1.
+"""
+
+import collections
+import json
+import optparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import content_source
+import linters
+import lint_result
+import python_parse
+import runlint
+import static_content_refs
+
+
+# The pieces we make paths, and blacklist entries, out of.
+_DIR_NAMES = ('api', 'javascript', 'stylesheets', 'templates', 'tools',
+              'content', 'shared', 'third_party', 'build', 'gen', 'exercises',
+              'coaches', 'profiles', 'badges', 'search', 'video', 'util')
+_FILE_EXTENSIONS = ('.py', '.js', '.jsx', '.less', '.html', '.txt', '.json')
+
+# At most what fraction of the synthetic blacklist entries are about
+# paths in the tree; the rest are about directories that aren't in it.
+_BLACKLIST_MATCH_RATE = 0.1
+
+
+def _synthetic_paths(num_paths, rng):
+    """Return num_paths different relative paths of made-up files.
+
+    Like in a real source tree, there are about 10 files per directory,
+    and directories are up to 6 deep.
+    """
+    dirs = ['']
+    while len(dirs) < max(1, num_paths // 10):
+        parent = rng.choice(dirs)
+        if parent.count('/') < 6:
+            dirs.append('%s%s%d/' % (parent, rng.choice(_DIR_NAMES),
+                                     rng.randint(0, 99)))
+    paths = set()
+    while len(paths) < num_paths:
+        paths.add('%sfile_%d%s' % (rng.choice(dirs), rng.randint(0, 999),
+                                   rng.choice(_FILE_EXTENSIONS)))
+    return sorted(paths)
+
+
+def _synthetic_blacklist(num_entries, paths, rng):
+    """Return num_entries blacklist entries, of all the kinds we support.
+
+    As in real life, most of them don't match any of paths.  The few
+    that do are about files in directories without subdirectories, so
+    each matches only a handful of paths, and together they match a
+    few percent of the tree, whatever its size.
+    """
+    ancestors = set()
+    for path in paths:
+        dirname = os.path.dirname(path)
+        while dirname:
+            dirname = os.path.dirname(dirname)
+            ancestors.add(dirname)
+    leaf_paths = [path for path in paths
+                  if os.path.dirname(path) not in ancestors]
+    num_matching = min(int(num_entries * _BLACKLIST_MATCH_RATE),
+                       len(paths) // 100)
+
+    entries = []
+    while len(entries) < num_entries:
+        if len(entries) < num_matching:
+            path = rng.choice(leaf_paths)
+        else:
+            path = 'not_in_tree%d/%s' % (len(entries), rng.choice(paths))
+        (dirname, basename) = os.path.split(path)
+        (root, ext) = os.path.splitext(basename)
+        kind = rng.randint(0, 5)
+        if kind == 0:            # a file
+            entries.append(path)
+        elif kind == 1 and dirname:      # a directory
+            entries.append(dirname + '/')
+        elif kind == 2 and dirname:      # files of a type in a directory
+            entries.append('%s/*%s' % (dirname, ext))
+        elif kind == 3:          # files with a name anywhere
+            entries.append('**/%s-*%s' % (root, ext))
+        elif kind == 4 and dirname:      # directories with a prefix
+            entries.append('%s*/' % dirname.rstrip('0123456789'))
+        else:                    # something that matches nothing
+            entries.append('no_such_dir%d/*.py' % len(entries))
+    rng.shuffle(entries)
+    return entries
+
+
+# The synthetic corpus: what kinds of files are in it, and how often.
+_CORPUS_FILE_KINDS = (('.py', 45), ('.js', 20), ('.jsx', 10), ('.less', 10),
+                      ('.html', 15))
+
+# What fraction of the chunks (functions, rules, ...) we generate get
+# a lint error.
+_CORPUS_ERROR_RATE = 0.1
+
+_PYTHON_MODULES = ('collections', 'json', 'logging', 'os', 're', 'sys',
+                   'time', 'urllib')
+
+_PYTHON_STATEMENTS = (
+    'result = [x * 2 for x in range(10) if x %% 3]',
+    'result = %(module)s.__name__',
+    'if arg is not None:\n        result = arg',
+    'result = {"key": arg, "other": other_arg, "count": len(str(arg))}',
+    'for item in (other_arg or []):\n        result = (result, item)',
+    'logging_message = "Handled %%s" %% (result,)  # a comment',
+)
+
+# Each of these is one lint error (or one we know to suppress).
+_PYTHON_ERRORS = (
+    'result=arg',                                          # pep8
+    'result = "%s"' % ('x' * 90),                          # pep8: too long
+    'unused = arg',                                        # pyflakes
+    'result = undefined_name',                             # pyflakes
+    'result = undefined_name  # @Nolint',                  # suppressed
+    'result = "http://www.khanacademy.org/%s"' % ('x' * 70),  # allowed
+)
+
+_JS_STATEMENTS = (
+    'const total = values.reduce((sum, value) => sum + value, 0);',
+    'if (options.verbose) {\n        console.log("total", total);\n    }',
+    'const label = `item-${index}`;',
+    'const copy = Object.assign({}, options, {index: index});',
+)
+
+_JS_ERRORS = (
+    'var old = values.length;',        # no-var, unused
+    'const missing = values.length',   # missing semicolon, unused
+    'const extra = values.length;;',   # extra semicolon, unused
+)
+
+
+def _corpus_chunks(rng, statements, errors, num_statements):
+    """Return num_statements statements, with some errors mixed in."""
+    return [rng.choice(errors) if rng.random() < _CORPUS_ERROR_RATE
+            else rng.choice(statements)
+            for _ in xrange(num_statements)]
+
+
+def _synthetic_python(rng):
+    modules = rng.sample(_PYTHON_MODULES, rng.randint(1, 4))
+    lines = ['"""A made-up module, for benchmarking."""', '']
+    lines.extend('import %s' % module for module in sorted(modules))
+    for i in xrange(rng.randint(1, 15)):
+        lines.extend(['', '',
+                      'def function_%d(arg, other_arg=None):' % i,
+                      '    """Do something made-up with arg."""',
+                      '    result = arg'])
+        for statement in _corpus_chunks(rng, _PYTHON_STATEMENTS,
+                                        _PYTHON_ERRORS, rng.randint(2, 20)):
+            lines.append('    ' + statement % {'module': rng.choice(modules)})
+        lines.append('    return result')
+    if rng.random() < _CORPUS_ERROR_RATE / 10:
+        # A bad merge: this is both a git and a syntax error.
+        lines[-1:-1] = ['<<<<<<< HEAD', '    result = None', '>>>>>>> theirs']
+    return '\n'.join(lines) + '\n'
+
+
+def _synthetic_js(rng):
+    lines = ['/* A made-up module, for benchmarking. */', '']
+    names = []
+    for i in xrange(rng.randint(1, 10)):
+        names.append('compute%d' % i)
+        lines.append('const compute%d = (values, options, index) => {' % i)
+        lines.extend('    ' + statement for statement in _corpus_chunks(
+            rng, _JS_STATEMENTS, _JS_ERRORS, rng.randint(2, 12)))
+        lines.extend(['    return values.length;', '};', ''])
+    lines.append('module.exports = {%s};' % ', '.join(names))
+    return '\n'.join(lines) + '\n'
+
+
+def _synthetic_jsx(rng):
+    lines = ['/* A made-up component, for benchmarking. */',
+             'const React = require("react");',
+             '',
+             'class Widget extends React.Component {',
+             '    render() {',
+             '        const values = this.props.values;',
+             '        const options = this.props;',
+             '        const index = 0;']
+    lines.extend('        ' + statement for statement in _corpus_chunks(
+        rng, _JS_STATEMENTS, _JS_ERRORS, rng.randint(1, 6)))
+    lines.extend(['        return <div className="widget">',
+                  '            {this.props.label}',
+                  '        </div>;',
+                  '    }',
+                  '}',
+                  '',
+                  'module.exports = Widget;'])
+    return '\n'.join(lines) + '\n'
+
+
+def _synthetic_less(rng):
+    lines = ['// A made-up stylesheet, for benchmarking.', '']
+    for i in xrange(rng.randint(1, 20)):
+        lines.extend(['.widget-%d {' % i,
+                      '    margin: %dpx;' % rng.randint(0, 20),
+                      '    .title {',
+                      '        font-weight: bold;',
+                      '    }'])
+        if rng.random() < _CORPUS_ERROR_RATE:
+            lines.append('    color: #ffffff;')      # an inline color
+        lines.extend(['}', ''])
+    return '\n'.join(lines)
+
+
+def _synthetic_html(rng):
+    lines = ['{# A made-up template, for benchmarking. #}',
+             '<div class="page">']
+    for i in xrange(rng.randint(1, 30)):
+        if rng.random() < _CORPUS_ERROR_RATE:        # not |static_url
+            lines.append('  <img src="/images/image_%d.png">' % i)
+        else:
+            lines.append('  <img src="{{ "/images/image_%d.png"|static_url }}'
+                         '">' % i)
+        lines.append('  <p class="caption">{{ captions[%d] }}</p>' % i)
+    lines.append('</div>')
+    return '\n'.join(lines) + '\n'
+
+
+_CORPUS_GENERATORS = {
+    '.py': _synthetic_python,
+    '.js': _synthetic_js,
+    '.jsx': _synthetic_jsx,
+    '.less': _synthetic_less,
+    '.html': _synthetic_html,
+}
+
+
+def synthetic_corpus(num_files, rng):
+    """Return a list of (relative path, contents) for a synthetic corpus.
+
+    The corpus is num_files files, of the kinds in _CORPUS_FILE_KINDS,
+    with lint errors of various kinds sprinkled through them.  html
+    files are all in 'templates' directories, since that's the only
+    place we lint them.  About a tenth of the files are in directories
+    the corpus's blacklists (see write_synthetic_corpus()) skip.
+    """
+    extensions = []
+    for (extension, weight) in _CORPUS_FILE_KINDS:
+        extensions.extend([extension] * weight)
+
+    dirs = _synthetic_paths(max(1, num_files // 10), rng)
+    dirs = sorted(set(os.path.dirname(path) for path in dirs))
+    files = {}
+    while len(files) < num_files:
+        extension = rng.choice(extensions)
+        directory = rng.choice(dirs)
+        if extension == '.html':
+            directory = os.path.join(directory, 'templates')
+        elif rng.random() < 0.1:
+            directory = os.path.join(rng.choice(('third_party', 'genfiles')),
+                                     directory)
+        path = os.path.join(directory, 'file_%d%s' % (rng.randint(0, 9999),
+                                                       extension))
+        if path not in files:
+            files[path] = _CORPUS_GENERATORS[extension](rng)
+    return sorted(files.iteritems())
+
+
+def write_synthetic_corpus(rootdir, num_files, rng):
+    """Write synthetic_corpus(num_files, rng) under rootdir.
+
+    We also write a blacklist at the top, and make the top, and a
+    few of the directories under it, into git repositories, some
+    with blacklists of their own.
+
+    Returns the (relative path, contents) pairs we wrote.
+    """
+    corpus = synthetic_corpus(num_files, rng)
+    for (path, contents) in corpus:
+        abspath = os.path.join(rootdir, path)
+        if not os.path.isdir(os.path.dirname(abspath)):
+            os.makedirs(os.path.dirname(abspath))
+        with open(abspath, 'w') as f:
+            f.write(contents)
+
+    with open(os.path.join(rootdir, 'lint_blacklist.txt'), 'w') as f:
+        f.write('third_party/\ngenfiles/\n')
+    subprocess.check_call(['git', 'init', '-q', rootdir])
+    top_dirs = sorted(set(path.split('/', 1)[0] for (path, _) in corpus
+                          if '/' in path))
+    for top_dir in rng.sample(top_dirs, max(1, len(top_dirs) // 10)):
+        subprocess.check_call(['git', 'init', '-q',
+                               os.path.join(rootdir, top_dir)])
+        if rng.random() < 0.5:
+            with open(os.path.join(rootdir, top_dir, 'lint_blacklist.txt'),
+                      'w') as f:
+                f.write('**/*_generated.py\ngenfiles/\n')
+    return corpus
+
+
+def blacklist_benchmark(options, rng):
+    """Time runlint._file_in_blacklist() on every path in a synthetic tree.
+
+    Returns a list of (label, value) pairs.
+    """
+    paths = _synthetic_paths(options.num_paths, rng)
+    entries = _synthetic_blacklist(options.num_blacklist_entries, paths, rng)
+
+    # The paths don't have to exist, but the blacklist file does.
+    rootdir = tempfile.mkdtemp(prefix='khan-linter-benchmark-')
+    try:
+        with open(os.path.join(rootdir, 'lint_blacklist.txt'), 'w') as f:
+            f.write('\n'.join(entries) + '\n')
+        abspaths = [os.path.join(rootdir, path) for path in paths]
+        blacklist_pattern = '<ancestor>/lint_blacklist.txt'
+
+        start_time = time.time()
+        num_blacklisted = sum(
+            1 for path in abspaths
+            if runlint._file_in_blacklist(path, blacklist_pattern))
+        elapsed = time.time() - start_time
+    finally:
+        shutil.rmtree(rootdir)
+        runlint._BLACKLIST_CACHE.clear()
+        runlint._ANCESTOR_DIR_CACHE.clear()
+
+    return [('paths', len(paths)),
+            ('blacklist entries', len(entries)),
+            ('paths blacklisted', num_blacklisted),
+            ('seconds', elapsed),
+            ('microseconds per path', elapsed * 1e6 / len(paths))]
+
+
+def walk_benchmark(options, rng):
+    """Time runlint.find_files_to_lint() on a synthetic tree on disk.
+
+    Returns a list of (label, value) pairs.
+    """
+    paths = _synthetic_paths(options.num_paths, rng)
+    entries = _synthetic_blacklist(options.num_blacklist_entries, paths, rng)
+
+    rootdir = tempfile.mkdtemp(prefix='khan-linter-benchmark-')
+    try:
+        with open(os.path.join(rootdir, 'lint_blacklist.txt'), 'w') as f:
+            f.write('\n'.join(entries) + '\n')
+        with open(os.path.join(rootdir, '.gitignore'), 'w') as f:
+            f.write('build_output/\n')
+        build_paths = ['build_output/' + path
+                       for path in _synthetic_paths(len(paths) // 2, rng)]
+        for path in paths + build_paths:
+            abspath = os.path.join(rootdir, path)
+            if not os.path.isdir(os.path.dirname(abspath)):
+                os.makedirs(os.path.dirname(abspath))
+            open(abspath, 'w').close()
+        subprocess.check_call(['git', 'init', '-q'], cwd=rootdir)
+        subprocess.check_call(['git', 'add', '.'], cwd=rootdir)
+
+        start_time = time.time()
+        files = runlint.find_files_to_lint(
+            [rootdir], ancestor_patterns=(runlint._DEFAULT_EXTRA_LINTER,),
+            discovery=options.discovery)
+        elapsed = time.time() - start_time
+    finally:
+        shutil.rmtree(rootdir)
+        runlint._BLACKLIST_CACHE.clear()
+        runlint._ANCESTOR_DIR_CACHE.clear()
+
+    return [('files', len(paths)),
+            ('ignored files', len(build_paths)),
+            ('blacklist entries', len(entries)),
+            ('files found', len(files)),
+            ('seconds', elapsed),
+            ('microseconds per file', elapsed * 1e6 / len(paths))]
+
+
+def _throughput(num_files, num_bytes, elapsed):
+    """Return (label, value) pairs for how fast we linted some files."""
+    return [('files', num_files),
+            ('MB', num_bytes / 1e6),
+            ('seconds', elapsed),
+            ('files/sec', num_files / elapsed if elapsed else 0.0),
+            ('MB/sec', num_bytes / 1e6 / elapsed if elapsed else 0.0)]
+
+
+def end_to_end_benchmark(options, rng):
+    """Time runlint.main() on a synthetic corpus on disk.
+
+    Returns a list of (label, value) pairs.
+    """
+    rootdir = tempfile.mkdtemp(prefix='khan-linter-benchmark-')
+    try:
+        write_synthetic_corpus(rootdir, options.num_files, rng)
+        # We only count the files that runlint lints.
+        files = runlint.find_files_to_lint([rootdir])
+        num_bytes = sum(os.path.getsize(f) for f in files)
+        runlint._BLACKLIST_CACHE.clear()
+        runlint._ANCESTOR_DIR_CACHE.clear()
+
+        formatter = lint_result.CollectingFormatter()
+        start_time = time.time()
+        (_, num_framework_errors) = runlint.main(
+            [rootdir], jobs=options.jobs, formatter=formatter)
+        elapsed = time.time() - start_time
+    finally:
+        shutil.rmtree(rootdir)
+        runlint._BLACKLIST_CACHE.clear()
+        runlint._ANCESTOR_DIR_CACHE.clear()
+
+    return (_throughput(len(files), num_bytes, elapsed) +
+            [('lint errors', len(formatter.errors)),
+             ('framework errors', num_framework_errors)])
+
+
+def _linter_benchmark(lint_fn, extensions, options, rng):
+    """Time lint_fn(path, contents) on the corpus files with extensions.
+
+    contents is a content_source.FileContents.  We take the best time
+    of options.repeat runs.  Returns a list of (label, value) pairs.
+    """
+    corpus = [(path, text)
+              for (path, text) in synthetic_corpus(options.num_files, rng)
+              if path.endswith(extensions)]
+    num_bytes = sum(len(text) for (_, text) in corpus)
+
+    best_elapsed = None
+    for _ in xrange(options.repeat):
+        # We make new FileContents each time, so nothing is memoized.
+        file_contents = [(path, content_source.FileContents(text))
+                         for (path, text) in corpus]
+        start_time = time.time()
+        num_errors = 0
+        for (path, contents) in file_contents:
+            num_errors += len(lint_fn(path, contents))
+        elapsed = time.time() - start_time
+        if best_elapsed is None or elapsed < best_elapsed:
+            best_elapsed = elapsed
+
+    return (_throughput(len(corpus), num_bytes, best_elapsed) +
+            [('lint errors', num_errors)])
+
+
+def _python_linter(linter_class):
+    """Return the linter of linter_class that runlint lints python with."""
+    processor_dict = runlint._get_processor_dict(
+        os.path.join(runlint._CWD, 'eslintrc'), False)
+    return [linter for linter in processor_dict['python']
+            if isinstance(linter, linter_class)][0]
+
+
+def python_parse_benchmark(options, rng):
+    return _linter_benchmark(
+        lambda path, contents: filter(
+            None, [python_parse.parse(contents).syntax_error]),
+        ('.py',), options, rng)
+
+
+def pep8_benchmark(options, rng):
+    return _linter_benchmark(_python_linter(linters.Pep8).process,
+                             ('.py',), options, rng)
+
+
+def pyflakes_benchmark(options, rng):
+    return _linter_benchmark(_python_linter(linters.Pyflakes).process,
+                             ('.py',), options, rng)
+
+
+def git_benchmark(options, rng):
+    return _linter_benchmark(linters.Git().process,
+                             tuple(_CORPUS_GENERATORS), options, rng)
+
+
+def static_content_refs_benchmark(options, rng):
+    return _linter_benchmark(
+        lambda path, contents: static_content_refs.lint_one_file(
+            path, contents.text),
+        ('.html',), options, rng)
+
+
+BENCHMARKS = collections.OrderedDict((
+    ('blacklist', blacklist_benchmark),
+    ('walk', walk_benchmark),
+    ('end-to-end', end_to_end_benchmark),
+    ('python-parse', python_parse_benchmark),
+    ('pep8', pep8_benchmark),
+    ('pyflakes', pyflakes_benchmark),
+    ('git', git_benchmark),
+    ('static-content-refs', static_content_refs_benchmark),
+))
+
+# The results we compare between runs, and whether lower or higher
+# values are better.  The other results describe the synthetic data.
+_TIMINGS = {
+    'seconds': 'lower',
+    'microseconds per path': 'lower',
+    'microseconds per file': 'lower',
+    'files/sec': 'higher',
+    'MB/sec': 'higher',
+}
+
+# The options that affect the results; we only compare runs that
+# agree on all of them.
+_RESULT_OPTIONS = ('num_paths', 'num_blacklist_entries', 'num_files',
+                   'discovery', 'jobs', 'repeat', 'seed')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return '%.3f' % value
+    return str(value)
+
+
+def _revision():
+    """The git revision of khan-linter we're benchmarking, or None."""
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], cwd=runlint._CWD,
+                stderr=devnull).strip()
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+
+def _load_saved_run(filename, run_options):
+    """Return the last run saved in filename with run_options, or None."""
+    saved_run = None
+    try:
+        with open(filename) as f:
+            for line in f:
+                run = json.loads(line)
+                if run['options'] == run_options:
+                    saved_run = run
+    except (IOError, OSError):
+        pass
+    return saved_run
+
+
+def _compare(results, saved_run, threshold_percent):
+    """Print how results compare to saved_run; return the regressions.
+
+    A regression is a timing that is more than threshold_percent
+    worse than it was.  We return a list of descriptions of them.
+    """
+    print '--- compared to %s (revision %s)' % (saved_run['date'],
+                                               saved_run['revision'])
+    regressions = []
+    for (name, labels_and_values) in results.iteritems():
+        saved_values = saved_run['results'].get(name, {})
+        for (label, value) in labels_and_values.iteritems():
+            if label not in _TIMINGS or not saved_values.get(label):
+                continue
+            saved_value = saved_values[label]
+            change_percent = (value - saved_value) * 100.0 / saved_value
+            if _TIMINGS[label] == 'lower':
+                worse_percent = change_percent
+            else:
+                worse_percent = -change_percent
+            description = ('%s %s: %s (was %s, %+.1f%%)'
+                           % (name, label, _format_value(value),
+                              _format_value(saved_value), change_percent))
+            if worse_percent > threshold_percent:
+                regressions.append(description)
+                print 'REGRESSION: %s' % description
+            else:
+                print description
+    return regressions
+
+
+def main(benchmark_names, options):
+    """Run the benchmarks; return the number of regressions found."""
+    results = collections.OrderedDict()
+    for name in benchmark_names:
+        # Each benchmark gets its own rng, so its data doesn't depend
+        # on what other benchmarks we ran first.
+        rng = random.Random(options.seed)
+        print '--- %s' % name
+        results[name] = collections.OrderedDict()
+        for (label, value) in BENCHMARKS[name](options, rng):
+            print '%s: %s' % (label, _format_value(value))
+            results[name][label] = value
+        sys.stdout.flush()
+
+    run_options = dict((option, getattr(options, option))
+                       for option in _RESULT_OPTIONS)
+    regressions = []
+    if options.compare:
+        saved_run = _load_saved_run(options.compare, run_options)
+        if saved_run is None:
+            print ('--- no results saved in %s with these options to '
+                   'compare to' % options.compare)
+        else:
+            regressions = _compare(results, saved_run, options.threshold)
+
+    if options.save:
+        run = {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'revision': _revision(),
+               'options': run_options,
+               'results': results}
+        with open(options.save, 'a') as f:
+            f.write(json.dumps(run, sort_keys=True) + '\n')
+
+    return len(regressions)
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser('%prog [options] [benchmark] ...')
+    parser.add_option('--num-paths', type='int', default=100000,
+                      help='How many paths in the synthetic tree. '
+                           'Default: %default')
+    parser.add_option('--num-blacklist-entries', type='int', default=500,
+                      help='How many entries in the synthetic blacklist. '
+                           'Default: %default')
+    parser.add_option('--discovery', type='choice',
+                      choices=['walk', 'git', 'git-with-untracked'],
+                      default='walk',
+                      help='How the walk benchmark finds files; see '
+                           'runlint.py --help. Default: %default')
+    parser.add_option('--num-files', type='int', default=1000,
+                      help='How many files in the synthetic corpus. '
+                           'Default: %default')
+    parser.add_option('--jobs', '-j', type='int', default=1,
+                      help='The --jobs for the end-to-end benchmark. '
+                           'Default: %default')
+    parser.add_option('--repeat', type='int', default=3,
+                      help='How many times to run each linter benchmark '
+                           '(we report the best). Default: %default')
+    parser.add_option('--seed', type='int', default=0,
+                      help='The random seed for making synthetic data. '
+                           'Default: %default')
+    parser.add_option('--save', metavar='FILE',
+                      help='Append the results to FILE.')
+    parser.add_option('--compare', metavar='FILE',
+                      help='Compare the results to the last ones saved in '
+                           'FILE with the same options.')
+    parser.add_option('--threshold', type='float', default=10,
+                      help='With --compare, flag timings more than this '
+                           'percent worse as regressions. Default: %default')
+    (options, args) = parser.parse_args()
+    for arg in args:
+        if arg not in BENCHMARKS:
+            parser.error('Unknown benchmark "%s"; choose from: %s'
+                         % (arg, ', '.join(BENCHMARKS)))
+    sys.exit(1 if main(args or list(BENCHMARKS), options) else 0)
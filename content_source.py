@@ -0,0 +1,436 @@
+"""Where linters get the contents of the files they lint from.
+
+Several linters look at each file (pep8, pyflakes, and the git-conflict
+linter all look at every python file, for instance).  Rather than have
+each of them read the file, and split it into lines, separately, they
+all get the file's contents from a single per-run source, which reads
+each file only once and splits its lines only once.
+
+The contents usually come from the working tree, but they can instead
+come from git: from the index (so a commit hook lints what is being
+committed, not what happens to be on disk), or from any revision (so
+CI can lint a bare clone, without checking anything out).
+"""
+
+import errno
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+import lint_profile
+
+# We follow at most this many symlinks to get to a file in git...
+_MAX_SYMLINKS = 40
+# ...each of which points to a path at most this long.
+_MAX_SYMLINK_TARGET = 4096
+
+
+class FileContents(object):
+    """The contents of one file, shared among all the linters that lint it.
+
+    text is the contents of the file, read in universal-newline mode.
+    lines and lines_keepends are text.splitlines() and
+    text.splitlines(True) respectively; they are computed the first
+    time they are asked for.  Other things derived from the contents,
+    that several linters want, can be computed once via memoize().
+    """
+    def __init__(self, text):
+        self.text = text
+        self._lines = None
+        self._lines_keepends = None
+        self._memos = {}
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            self._lines = self.text.splitlines()
+        return self._lines
+
+    @property
+    def lines_keepends(self):
+        if self._lines_keepends is None:
+            self._lines_keepends = self.text.splitlines(True)
+        return self._lines_keepends
+
+    def memoize(self, key, compute_fn):
+        """Return compute_fn(self), only calling it the first time.
+
+        key identifies what compute_fn computes, e.g. 'python_parse'.
+        """
+        if key not in self._memos:
+            self._memos[key] = compute_fn(self)
+        return self._memos[key]
+
+    def __getstate__(self):
+        # When we send file contents to a subprocess, the line-lists
+        # and memos are cheaper to recompute there than to pickle.
+        return {'text': self.text, '_lines': None, '_lines_keepends': None,
+                '_memos': {}}
+
+
+class WorkingTreeSource(object):
+    """Provides the contents of files as they are on disk.
+
+    Each file is read at most once, no matter how many linters ask for
+    it.  To keep memory use bounded, the caller says up front how many
+    linters will be using each file (via add_user()), and each linter
+    calls release() once it's done with the file.  We forget a file's
+    contents once all its users have released it.
+
+    on_disk is True if the contents are what's in the files on disk,
+    so external programs (like eslint) can just be told the filenames.
+    """
+    on_disk = True
+
+    def __init__(self):
+        self._contents = {}      # filename -> FileContents, or an exception
+        self._num_users = {}     # filename -> number of unreleased users
+
+    def add_user(self, filename):
+        """Note that one more linter will be get()-ing filename."""
+        self._num_users[filename] = self._num_users.get(filename, 0) + 1
+
+    def read(self, filename):
+        """Return a FileContents for filename, without caching it."""
+        with open(filename, 'U') as f:
+            return FileContents(f.read())
+
+    def get(self, filename):
+        """Return a FileContents for filename.
+
+        Raises IOError or OSError, just like open() would, if the file
+        cannot be read.
+        """
+        if filename not in self._contents:
+            try:
+                with lint_profile.phase('read', filename=filename):
+                    self._contents[filename] = self.read(filename)
+            except (IOError, OSError), why:
+                # Remember the error, so every linter sees it, but we
+                # only try to read the file once.
+                self._contents[filename] = why
+        contents = self._contents[filename]
+        if isinstance(contents, Exception):
+            raise contents
+        return contents
+
+    def release(self, filename):
+        """Note that one linter is done with filename."""
+        num_users = self._num_users.get(filename, 0) - 1
+        if num_users > 0:
+            self._num_users[filename] = num_users
+        else:
+            self._num_users.pop(filename, None)
+            self._contents.pop(filename, None)
+
+    def directories(self, filenames):
+        """Return the set of those of filenames that are directories."""
+        return set(f for f in filenames if os.path.isdir(f))
+
+    def list_files(self):
+        """Return all the files we have, relative to the cwd, or None.
+
+        None means to look at the filesystem to find out.  This can
+        be slow in a big repository, so we only call it when we need
+        to look for files in a directory.
+        """
+        return None
+
+    def close(self):
+        """Free any resources we hold; call once we're all done."""
+        pass
+
+
+def is_git_revision(revision):
+    """True if revision names a commit (or tree) in the git repo at cwd."""
+    with open(os.devnull, 'w') as devnull:
+        return subprocess.call(
+            ['git', 'rev-parse', '--verify', '--quiet',
+             '%s^{tree}' % revision],
+            stdout=devnull, stderr=devnull) == 0
+
+
+class GitSource(WorkingTreeSource):
+    """Provides the contents of files as they are in git.
+
+    If revision is None, that's the contents in the index (what `git
+    commit` would commit); otherwise it's the contents at the given
+    revision, which can be anything `git cat-file` understands, like
+    'HEAD' or 'origin/master'.  Filenames are relative to the cwd, as
+    usual; in a bare repository, where there is no working tree, they
+    are relative to the top of the repository.
+
+    We read all the files through one `git cat-file --batch` process,
+    rather than running a git command for each file.  Files not in
+    git (or not in the index or revision) cannot be read: get()
+    raises IOError, just as for a file that doesn't exist on disk.
+
+    As on disk, reading a symlink gets the contents of the file it
+    points to.  But we can only follow symlinks to files that are in
+    git too; links to anything else can't be read (and we don't list
+    them).
+    """
+    on_disk = False
+
+    def __init__(self, revision=None):
+        super(GitSource, self).__init__()
+        self.revision = revision
+        # Where the cwd is, relative to the top of the repository.
+        self._prefix = subprocess.check_output(
+            ['git', 'rev-parse', '--show-prefix']).strip()
+        self._cat_file = None
+        self._lock = threading.Lock()    # batch linters read in threads
+        self._listing = None             # see _list_paths()
+
+    def _where(self):
+        if self.revision is None:
+            return 'the git index'
+        return 'git revision %s' % self.revision
+
+    def _path_in_repo(self, filename):
+        """filename relative to the top of the repository, or None."""
+        path = os.path.normpath(os.path.join(self._prefix,
+                                             os.path.relpath(filename)))
+        if path == '..' or path.startswith('../') or '\n' in path:
+            return None
+        return path
+
+    def _cat_file_process(self):
+        if self._cat_file is None or self._cat_file.poll() is not None:
+            self._cat_file = subprocess.Popen(
+                ['git', 'cat-file', '--batch'],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                close_fds=True)   # since other threads may be forking too
+        return self._cat_file
+
+    def _read_blob(self, path):
+        """Return the contents of path, or None if it's not a file in git."""
+        # The index is revision '' (':<path>' is the index entry).
+        spec = '%s:%s' % (self.revision or '', path)
+        with self._lock:
+            cat_file = self._cat_file_process()
+            cat_file.stdin.write(spec + '\n')
+            cat_file.stdin.flush()
+            # The response is '<sha> <type> <size>\n<contents>\n',
+            # or '<spec> missing\n' if there's no such object.  The
+            # spec may have spaces in it, so we parse from the right.
+            header = cat_file.stdout.readline().rstrip('\n')
+            if header.endswith(' missing'):
+                return None
+            try:
+                (_, object_type, size) = header.rsplit(' ', 2)
+                size = int(size)
+            except ValueError:
+                # We can't tell where this response ends, so we can't
+                # use this git process anymore.
+                cat_file.kill()
+                cat_file.wait()
+                raise IOError(errno.EIO,
+                              'Unexpected output from git cat-file: %r'
+                              % header, path)
+            contents = cat_file.stdout.read(size + 1)[:-1]
+        if object_type != 'blob':     # e.g. a directory
+            return None
+        return contents
+
+    def _is_symlink(self, path):
+        if self.revision is None:
+            output = subprocess.check_output(
+                ['git', 'ls-files', '-s', '-z', '--',
+                 ':(top,literal)%s' % path])
+        else:
+            output = subprocess.check_output(
+                ['git', 'ls-tree', '-z', '--full-tree', self.revision,
+                 '--', path])
+        return output.startswith('120000 ')
+
+    def _read_file(self, path):
+        """Like _read_blob(), but follows symlinks, as open() does.
+
+        In git, a symlink is a blob holding the path it points to.
+        Returns None if path is a symlink to something not in git.
+        """
+        for _ in xrange(_MAX_SYMLINKS):
+            contents = self._read_blob(path)
+            # A symlink's target is one line, with no newline.  Most
+            # files aren't, so we rarely need to ask git for the mode.
+            if (not contents or '\n' in contents or
+                    len(contents) > _MAX_SYMLINK_TARGET or
+                    not self._is_symlink(path)):
+                return contents
+            if os.path.isabs(contents):
+                return None
+            path = os.path.normpath(os.path.join(os.path.dirname(path),
+                                                 contents))
+            if path == '..' or path.startswith('../'):
+                return None
+        return None                   # a symlink loop
+
+    def read(self, filename):
+        path = self._path_in_repo(filename)
+        contents = None if path is None else self._read_file(path)
+        if contents is None:
+            raise IOError(errno.ENOENT,
+                          'No such file in %s' % self._where(), filename)
+        # Mimic reading in universal-newline mode.
+        if '\r' in contents:
+            contents = contents.replace('\r\n', '\n').replace('\r', '\n')
+        return FileContents(contents)
+
+    def directories(self, filenames):
+        # We look up all the filenames with one git command.
+        paths = [(f, self._path_in_repo(f)) for f in filenames]
+        paths = [(f, path) for (f, path) in paths if path is not None]
+        retval = set(f for (f, path) in paths if path == '.')
+        paths = [(f, path) for (f, path) in paths if path != '.']
+        if not paths:
+            return retval
+        cat_file = subprocess.Popen(['git', 'cat-file', '--batch-check'],
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE)
+        output = cat_file.communicate(''.join(
+            '%s:%s\n' % (self.revision or '', path) for (_, path) in paths))[0]
+        # Each response is '<sha> <type> <size>', or '<spec> missing'.
+        listed_dirs = None
+        for ((f, path), response) in zip(paths, output.splitlines()):
+            if response.endswith(' missing'):
+                # The index only has files, so for it we have to look
+                # for files in the directory.
+                if self.revision is None:
+                    if listed_dirs is None:
+                        listed_dirs = self._listed_dirs()
+                    if path in listed_dirs:
+                        retval.add(f)
+            elif response.split(' ')[1] == 'tree':
+                retval.add(f)
+        return retval
+
+    def _listed_dirs(self):
+        """The directories (relative to the top) that _list_paths() has."""
+        retval = set()
+        for path in self._list_paths():
+            directory = os.path.dirname(path)
+            while directory and directory not in retval:
+                retval.add(directory)
+                directory = os.path.dirname(directory)
+        return retval
+
+    def list_files(self):
+        top = os.path.relpath('.', self._prefix) if self._prefix else '.'
+        return [os.path.normpath(os.path.join(top, path))
+                for path in self._list_paths()]
+
+    def _list_paths(self):
+        """Return the files we have, relative to the top of the repository.
+
+        We only list them once.
+        """
+        if self._listing is not None:
+            return self._listing
+        # Both list '<mode> <stuff>\t<path>', with the path relative
+        # to the top of the repository.
+        if self.revision is None:
+            output = subprocess.check_output(
+                ['git', 'ls-files', '-s', '-z', '--full-name', '--', ':/'])
+        else:
+            output = subprocess.check_output(
+                ['git', 'ls-tree', '-r', '-z', '--full-tree',
+                 self.revision])
+        retval = []
+        last_path = None
+        for line in output.split('\0'):
+            if not line:
+                continue
+            (info, path) = line.split('\t', 1)
+            mode = info.split(' ', 1)[0]
+            if path == last_path:
+                continue                  # another stage of a conflict
+            last_path = path
+            if mode == '160000':          # a submodule
+                continue
+            # Like walking the working tree, we skip symlinks to
+            # directories (and, unlike it, to anything not in git).
+            if mode == '120000' and self._read_file(path) is None:
+                continue
+            retval.append(path)
+        self._listing = retval
+        return retval
+
+    def close(self):
+        if self._cat_file is not None:
+            self._cat_file.stdin.close()
+            self._cat_file.wait()
+            self._cat_file = None
+
+
+def make_source(name):
+    """Return the source runlint's --source flag says to use.
+
+    name is 'working-tree', 'index', or a git revision.
+    """
+    if name == 'working-tree':
+        return WorkingTreeSource()
+    if name == 'index':
+        return GitSource()
+    return GitSource(name)
+
+
+class TemporaryCopies(object):
+    """Copies of some files from a source, in a temporary directory.
+
+    This is for external programs that can only lint files on disk,
+    when the contents we want to lint aren't.  Files that can't be
+    read from the source are left out.  Use it as a context manager:
+    the copies are deleted on exit.
+
+    Attributes:
+       filenames: the names of the copies, in the same order as the
+          files they are copies of
+    """
+    def __init__(self, source, filenames):
+        self._dir = tempfile.mkdtemp(prefix='khan-linter-')
+        self._originals = {}      # abspath of a copy -> original filename
+        self.filenames = []
+        try:
+            for (i, filename) in enumerate(filenames):
+                # We go through the source's cache, since the linter
+                # has probably read the file already.
+                source.add_user(filename)
+                try:
+                    contents = source.get(filename)
+                except (IOError, OSError):
+                    continue
+                finally:
+                    source.release(filename)
+                # We keep the basename, since linters may care about
+                # the extension, but give each file its own directory
+                # so they can't collide.
+                copy = os.path.join(self._dir, str(i),
+                                    os.path.basename(filename))
+                os.mkdir(os.path.dirname(copy))
+                with open(copy, 'w') as f:
+                    f.write(contents.text)
+                self._originals[copy] = filename
+                self.filenames.append(copy)
+        except Exception:
+            self.close()
+            raise
+
+    def original_filename(self, filename):
+        """Map the name of a copy back to the file it is a copy of.
+
+        filename can be absolute or relative to the cwd.  Names that
+        are not of copies are returned unchanged.
+        """
+        return self._originals.get(os.path.abspath(filename), filename)
+
+    def close(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -3,7 +3,9 @@
 // This reporter is used within eslint, I don't know that it supports ES6-isms
 /* eslint-disable no-var */
 
-module.exports = function(results) {
+// Return the lint errors in results as [file, line, col, code, msg] arrays.
+var lintErrors = function(results) {
+    var errors = [];
     results.forEach(function(result) {
         result.messages.forEach(function(message) {
             var code = "W";
@@ -14,11 +16,21 @@ module.exports = function(results) {
             // is that they not include spaces.
             code = code + String(message.ruleId).replace(/ /g, "_");
 
-            // <file>:<line>:<col>: <E|W><code> <msg>
-            process.stdout.write(
-                result.filePath + ":" +
-                    (message.line || 0) + ":" + (message.column || 0) + ": " +
-                    code + " " + message.message + "\n");
+            errors.push([result.filePath, message.line || 0,
+                message.column || 0, code, message.message]);
         });
     });
+    return errors;
+};
+
+module.exports = function(results) {
+    lintErrors(results).forEach(function(error) {
+        // <file>:<line>:<col>: <E|W><code> <msg>
+        process.stdout.write(
+            error[0] + ":" + error[1] + ":" + error[2] + ": " +
+                error[3] + " " + error[4] + "\n");
+    });
 };
+
+// eslint_worker.js uses this to report the same lint errors we would.
+module.exports.lintErrors = lintErrors;
@@ -0,0 +1,94 @@
+/**
+ * A long-running eslint process, so we only pay for starting node,
+ * and loading eslint and its plugins, once.
+ *
+ * We read requests from stdin, one per line.  Each is a json object
+ * like
+ *    {"config": "/path/to/eslintrc", "cwd": "/some/dir",
+ *     "files": ["a.js", "b/c.jsx"]}
+ * For each, we lint the files as
+ *    eslint --config <config> -f eslint_reporter.js <files>
+ * would if run from cwd.  If the request also has "texts", a list of
+ * the contents of each file, we lint those contents instead of
+ * reading the files.
+ *
+ * We lint the files a few at a time, and as we finish each few we
+ * write a json object to stdout, on one line:
+ *    {"errors": [[<file>, <line>, <col>, <E|W><code>, <msg>], ...]}
+ * where "errors" holds the lint errors eslint_reporter.js would print
+ * for those files.  (So our caller can start on them while we lint
+ * the rest.)  Once we've linted all the files, we write
+ *    {"done": true, "stderr": "<any warnings eslint printed>"}
+ * or, if linting failed entirely,
+ *    {"error": "<why>", "stderr": "<any warnings eslint printed>"}
+ *
+ * We exit when stdin is closed.
+ */
+
+// This runs under the same node as eslint; avoid ES6-isms to be safe.
+/* eslint-disable no-var */
+
+var path = require("path");
+var readline = require("readline");
+
+var CLIEngine = require(path.join(__dirname, "node_modules", "eslint"))
+    .CLIEngine;
+var reporter = require(path.join(__dirname, "eslint_reporter.js"));
+
+// eslint reports some problems (like deprecated rules) via
+// console.error; we send those back along with the lint output.
+// (And stdout is for our responses, so nothing else may use it.)
+/* eslint-disable no-console */
+var consoleOutput = [];
+console.error = console.warn = console.log = function() {
+    consoleOutput.push(Array.prototype.join.call(arguments, " ") + "\n");
+};
+
+// How many files we lint before telling our caller about them.  Each
+// call to executeOnFiles() has some overhead, so we don't want to
+// lint just one file at a time.
+var FILES_PER_RESPONSE = 16;
+
+var respond = function(response) {
+    process.stdout.write(JSON.stringify(response) + "\n");
+};
+
+var lint = function(request) {
+    // These are the options that eslint's command-line uses by
+    // default; see translateOptions() in eslint/lib/cli.js.
+    var engine = new CLIEngine({
+        configFile: request.config,
+        useEslintrc: true,
+        ignore: true,
+        allowInlineConfig: true,
+        cwd: request.cwd,
+    });
+    for (var start = 0; start < request.files.length;
+         start += FILES_PER_RESPONSE) {
+        var files = request.files.slice(start, start + FILES_PER_RESPONSE);
+        var results = [];
+        if (request.texts) {
+            files.forEach(function(file, i) {
+                results = results.concat(engine.executeOnText(
+                    request.texts[start + i], file, true).results);
+            });
+        } else {
+            results = engine.executeOnFiles(files).results;
+        }
+        respond({errors: reporter.lintErrors(results)});
+    }
+};
+
+readline.createInterface({input: process.stdin, terminal: false})
+    .on("line", function(line) {
+        consoleOutput = [];
+        try {
+            lint(JSON.parse(line));
+            respond({done: true, stderr: consoleOutput.join("")});
+        } catch (e) {
+            respond({
+                error: String(e && e.stack || e),
+                stderr: consoleOutput.join(""),
+            });
+        }
+    });
@@ -10,9 +10,15 @@ To install (for git >= 1.7.1), run the following:
 and then create a symlink from
    ~/.git_template/hooks/commit-msg
 to this file.
+
+By default we complain about every lint error in every file in the
+commit.  To only complain about lint errors on the lines the commit
+adds or changes, run
+   % git config [--global] khan-linter.changed-lines-only true
 """
 
 import os
+import re
 import subprocess
 import sys
 
@@ -26,6 +32,60 @@ def _normalized_commit_message(text):
     return ''.join(lines).strip()
 
 
+def _lint_changed_lines_only():
+    """Return True if we should only lint the lines the commit changes."""
+    try:
+        value = subprocess.check_output(
+            ['git', 'config', '--bool', 'khan-linter.changed-lines-only'])
+    except subprocess.CalledProcessError:    # it's not set
+        return False
+    return value.strip() == 'true'
+
+
+# Matches a hunk header, like '@@ -10,2 +10,3 @@'.  The second group
+# (the number of lines in the new version) is 1 if it's omitted.
+_HUNK_RE = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+
+
+def _changed_lines(diff_against=None):
+    """Return a map from filename to the lines the commit adds or changes.
+
+    We compare what's in the index to diff_against, which is HEAD by
+    default.  Line numbers are for the file as it is in the index.
+    A file whose diff only deletes lines maps to the empty set.
+    """
+    diff = subprocess.check_output(
+        ['git', 'diff', '--cached', '-U0', '--no-color', '--no-ext-diff',
+         '--src-prefix=a/', '--dst-prefix=b/', '--diff-filter=AMR'] +
+        ([diff_against] if diff_against else []))
+
+    changed_lines = {}
+    filename = None
+    in_header = False
+    for line in diff.splitlines():
+        if line.startswith('diff --git '):
+            in_header = True
+        elif in_header and line.startswith('+++ '):
+            # git adds a tab after filenames that have a space in them.
+            path = line[len('+++ '):].rstrip('\t')
+            if path.startswith('"'):
+                # git quotes filenames with funny characters in them.
+                path = path[1:-1].decode('string_escape')
+            filename = path[len('b/'):]
+            changed_lines[filename] = set()
+        elif line.startswith('@@ '):
+            # This ends the header; lines after this are diff
+            # content, even if they look like '+++ ...'.
+            in_header = False
+            m = _HUNK_RE.match(line)
+            if m and filename is not None:
+                first_line = int(m.group(1))
+                num_lines = int(m.group(2) or 1)
+                changed_lines[filename].update(
+                    xrange(first_line, first_line + num_lines))
+    return changed_lines
+
+
 def main(commit_message_file):
     """Run a git pre-commit lint-check."""
     # If we're a merge, don't try to do a lint-check.
@@ -84,10 +144,28 @@ def main(commit_message_file):
                                          '-z'])
         files_to_lint = files.strip('\0').split('\0')  # that's what -z is for
 
+    changed_lines = None
+    if _lint_changed_lines_only():
+        if is_merge_commit:
+            # Like above, we care about lines that differ from both
+            # sides of the merge.
+            a_lines = _changed_lines('ORIG_HEAD')
+            b_lines = _changed_lines('MERGE_HEAD')
+            changed_lines = dict((fname, a_lines[fname] & b_lines[fname])
+                                 for fname in a_lines if fname in b_lines)
+        else:
+            changed_lines = _changed_lines()
+        # There's no need to lint files where we won't report anything.
+        files_to_lint = [fname for fname in files_to_lint
+                         if changed_lines.get(fname)]
+
     if not files_to_lint or files_to_lint == ['']:
         return 0
 
-    lint_errors = hook_lib.lint_files(files_to_lint)
+    # We lint what's in the index -- what's being committed -- rather
+    # than what's on disk, which may have changes that aren't staged.
+    lint_errors = hook_lib.lint_files(files_to_lint, changed_lines,
+                                      source='index')
 
     # Lint the commit message itself!
     # For the phabricator workflow, some people always have the git
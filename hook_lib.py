@@ -6,21 +6,43 @@ This library does the actual linting, after the VCS-specific commands
 to get the data that needs linting.
 """
 
+import os
 import re
 import sys
 
-import runlint
+import lint_daemon
 
 
-def lint_files(files_to_lint):
+def lint_files(files_to_lint, changed_lines=None, source='working-tree'):
     """Given a list of filenames in the commit, lint them all.
 
+    If changed_lines is not None, it is a map from filename to the
+    set of line numbers in that file that the commit changes; we only
+    complain about lint errors on those lines.
+
+    source says where to read the files from, as for runlint.main();
+    a VCS with a staging area (like git's index) should lint from
+    that, since that is what's being committed.
+
     Emits errors it sees to stderr.
 
     Returns the number of lint errors seen.
     """
-    (lint_errors, framework_errors) = runlint.main(files_to_lint,
-                                                   blacklist='yes')
+    # Through the lint server, we get runlint's exit code, which is
+    # the number of lint errors, up to 127.
+    if lint_daemon.use_server():
+        num_errors = lint_daemon.lint_with_server(
+            ['--blacklist=yes', '--no-cache', '--source=%s' % source, '--'] +
+            list(files_to_lint),
+            prog=os.path.basename(sys.argv[0]), changed_lines=changed_lines)
+        if num_errors is not None:
+            return num_errors
+
+    # We only import runlint -- and so all the linters -- if we need it.
+    import runlint
+    (lint_errors, framework_errors) = runlint.main(
+        files_to_lint, blacklist='yes', changed_lines=changed_lines,
+        source=source)
     return lint_errors + framework_errors
 
 
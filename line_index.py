@@ -0,0 +1,98 @@
+"""Facts about the lines of a file, for filtering linters' errors.
+
+The linters drop some of the errors they find, depending on the line
+the error is on: lines marked with @Nolint, long lines with urls in
+them, long json-like lines in docstrings.  Looking at the line anew
+for each error is fine when there are a few errors, but some files
+(generated data, test fixtures) have thousands, and the docstring
+check has to look back through the file to find the docstring.  So
+instead each linter gets a LineIndex for the file, via get(), which
+works out each fact for every line of the file at once, the first
+time it's asked about it, and answers for any one line in constant
+time from then on.
+"""
+
+
+def _is_docstring_start(line):
+    return line.lstrip().startswith(('"""', "'''"))
+
+
+class LineIndex(object):
+    """Facts about each line in the contents of one file.
+
+    Lines are numbered from 1, as in LintErrors.  Like indexing
+    contents.lines[linenum - 1], which is what the linters used to
+    do, line 0 means the last line.
+    """
+    def __init__(self, contents):
+        """contents is a content_source.FileContents."""
+        self._lines = contents.lines
+        self._has_nolint = None
+        self._has_url = None
+        self._in_def_docstring = None
+
+    def has_nolint(self, linenum):
+        """True if the line has a @Nolint directive on it."""
+        if self._has_nolint is None:
+            self._has_nolint = ['@Nolint' in line for line in self._lines]
+        return self._has_nolint[linenum - 1]
+
+    def has_url(self, linenum):
+        """True if the line has an http or https url in it."""
+        if self._has_url is None:
+            self._has_url = ['http://' in line or 'https://' in line
+                             for line in self._lines]
+        return self._has_url[linenum - 1]
+
+    def in_def_docstring(self, linenum):
+        """True if the line looks like it's in a def's or class's docstring.
+
+        We say it is if, going up from the line (starting with the
+        line itself, but not going as far as the first line of the
+        file), we come to a line that starts with triple quotes, and
+        the line above that is a def or class line.  Since def's (and
+        classes) can be multiple lines long, we may have to look back
+        a few lines for the def: until we reach a line that starts
+        with def or class (good), a line with triple quotes (bad, it
+        means the quotes above were ending a docstring, not starting
+        one) or a blank line (bad, it means the quotes are in some
+        random place).  This can be fooled, but should work well
+        enough.
+        """
+        if self._in_def_docstring is None:
+            self._in_def_docstring = self._find_def_docstrings()
+        return self._in_def_docstring[linenum - 1]
+
+    def _find_def_docstrings(self):
+        """Return in_def_docstring() for each line, as a list."""
+        # after_def[i]: going up from line i (0-indexed, inclusive),
+        # is the first blank, triple-quote, def or class line a def
+        # or class?
+        after_def = []
+        for line in self._lines:
+            stripped = line.strip()
+            if not stripped or _is_docstring_start(stripped):
+                after_def.append(False)
+            elif stripped.startswith(('def ', 'class ')):
+                after_def.append(True)
+            else:
+                after_def.append(bool(after_def) and after_def[-1])
+
+        retval = []
+        docstring_start = None      # the last triple-quote line, if any
+        for (i, line) in enumerate(self._lines):
+            if i == 0:
+                retval.append(False)
+                continue
+            if _is_docstring_start(line):
+                docstring_start = i
+            # If there's no triple-quote line, we look above the
+            # second line.
+            start = 1 if docstring_start is None else docstring_start
+            retval.append(after_def[start - 1])
+        return retval
+
+
+def get(contents):
+    """Return the LineIndex for a FileContents, making it only once."""
+    return contents.memoize('line_index', LineIndex)
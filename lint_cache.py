@@ -0,0 +1,179 @@
+"""A persistent, content-addressed cache of lint results.
+
+Each cache entry holds the lint errors a linter found in one file.
+Entries are keyed by a hash of:
+   1) the file's name and contents
+   2) the linter's class and configuration, including any config
+      files it finds near the file (see Linter.config_fingerprint()
+      and Linter.directory_fingerprint())
+   3) the source code of khan-linter itself, so upgrading the linter
+      invalidates everything.
+If none of those have changed, re-running the linter would find
+exactly the same errors, so we just report the cached ones instead.
+
+Entries live one-per-file under the cache directory.  At the end of a
+run that stored new entries, if the cache has grown past its size
+limit we delete the least-recently-used entries.
+"""
+
+import hashlib
+import os
+import tempfile
+
+import lint_result
+import lint_util
+
+_DEFAULT_MAX_SIZE = 100 * 1024 * 1024    # 100M
+
+# The khan-linter source files whose contents affect lint output.
+_CODE_FILES = ('linters.py', 'lint_util.py', 'static_content_refs.py',
+               'lint_cache.py', 'lint_result.py', 'pep8_checker.py',
+               'python_parse.py', 'line_index.py', 'eslint_reporter.js',
+               'eslint_worker.js', 'lesshint_reporter.js')
+
+
+def default_cache_dir():
+    """Return the directory to use for the cache if none is specified."""
+    cache_home = (os.environ.get('XDG_CACHE_HOME') or
+                  os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'khan-linter')
+
+
+def _code_fingerprint(filenames=_CODE_FILES):
+    """Return a string that changes whenever khan-linter's code does.
+
+    By default we only look at the code that affects lint output.
+    """
+    h = hashlib.sha1()
+    cwd = lint_util.get_real_cwd()
+    for filename in filenames:
+        try:
+            with open(os.path.join(cwd, filename)) as f:
+                h.update(f.read())
+        except (IOError, OSError):
+            pass
+    return h.hexdigest()
+
+
+class LintCache(object):
+    """An on-disk map from (linter, file, contents) to lint errors.
+
+    Arguments:
+        cache_dir: the directory to store cache entries in.  It is
+           created if it does not exist.
+        max_size: the number of bytes the cache entries may take up
+           before we start evicting the least recently used ones.
+    """
+    def __init__(self, cache_dir, max_size=_DEFAULT_MAX_SIZE):
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+        self._code_fingerprint = _code_fingerprint()
+        self._linter_fingerprints = {}    # linter object -> fingerprint
+        # (linter object, directory) -> fingerprint
+        self._directory_fingerprints = {}
+        self._num_bytes_stored = 0
+
+    def _key(self, linter, filename, contents):
+        if linter not in self._linter_fingerprints:
+            self._linter_fingerprints[linter] = linter.config_fingerprint()
+        directory_key = (linter, os.path.dirname(os.path.abspath(filename)))
+        if directory_key not in self._directory_fingerprints:
+            self._directory_fingerprints[directory_key] = (
+                linter.directory_fingerprint(directory_key[1]))
+        h = hashlib.sha1()
+        h.update(self._code_fingerprint)
+        h.update('\0')
+        h.update(self._linter_fingerprints[linter])
+        h.update('\0')
+        h.update(self._directory_fingerprints[directory_key])
+        h.update('\0')
+        h.update(filename)
+        h.update('\0')
+        h.update(contents)
+        return h.hexdigest()
+
+    def _path(self, key):
+        # Fan the entries out over 256 subdirs to keep directories small.
+        return os.path.join(self._cache_dir, key[:2], key[2:])
+
+    def lookup(self, linter, filename, contents):
+        """Return the lint errors for this file, or None if not cached.
+
+        The lint errors are a list of lint_result.LintErrors: those
+        that the linter found when it was run on filename.
+        """
+        path = self._path(self._key(linter, filename, contents))
+        try:
+            with open(path) as f:
+                errors = lint_result.from_json(f.read())
+        except (IOError, OSError, ValueError, TypeError):
+            return None
+
+        # Mark the entry as recently used, for eviction purposes.
+        try:
+            os.utime(path, None)
+        except (IOError, OSError):
+            pass
+        return errors
+
+    def store(self, linter, filename, contents, errors):
+        """Record that linting filename found the given lint errors."""
+        path = self._path(self._key(linter, filename, contents))
+        entry = lint_result.to_json(errors)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            # Write to a tempfile and rename it into place, so a
+            # concurrent lint run never sees a partially-written entry.
+            (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(path))
+        except (IOError, OSError):
+            return       # the cache is an optimization; never fail on it
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(entry)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            # E.g. the disk is full.  Don't leave the tempfile behind.
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+        self._num_bytes_stored += len(entry)
+
+    def prune(self):
+        """Delete least-recently-used entries until we fit in max_size.
+
+        We only bother to look at the cache if we've written to it
+        during this run, since otherwise it can't have grown.
+        """
+        if not self._num_bytes_stored:
+            return
+
+        entries = []
+        total_size = 0
+        for (root, _, files) in os.walk(self._cache_dir):
+            for f in files:
+                path = os.path.join(root, f)
+                try:
+                    st = os.stat(path)
+                except (IOError, OSError):
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total_size += st.st_size
+
+        if total_size <= self._max_size:
+            return
+
+        # Evict down to 90% of the max so we don't have to prune on
+        # every single run once the cache is full.
+        entries.sort()
+        for (_, size, path) in entries:
+            if total_size <= self._max_size * 0.9:
+                break
+            try:
+                os.unlink(path)
+            except (IOError, OSError):
+                continue
+            total_size -= size
+        self._num_bytes_stored = 0
@@ -0,0 +1,519 @@
+#!/usr/bin/env python
+
+"""A long-lived lint server, and a thin client to talk to it.
+
+USAGE:
+   lint_daemon.py start      # start a lint server in the background
+   lint_daemon.py stop       # stop the lint server
+   lint_daemon.py serve      # run a lint server in the foreground
+   lint_daemon.py lint [runlint.py options] [files] ...
+
+Every time runlint.py starts up it has to import the linters (and
+pep8 and pyflakes), set up pep8's options, construct all the linter
+objects, and re-read all the blacklists.  For small runs -- linting
+a file on save, or a commit hook -- that startup takes longer than
+the linting itself.
+
+The lint server does all that once, and then waits for requests on a
+unix-domain socket.  `lint_daemon.py lint` takes exactly the same
+arguments as runlint.py; it sends them (along with its cwd, and the
+environment variables that affect linting) to the server, which runs
+the lint and sends back the output, which the client prints.  The
+client's output and exit code are the same as if it had run
+runlint.py itself.  If there is no server running, the client just
+runs runlint.py.
+
+runlint.py (and so ka-lint) and the git commit hook use the server
+themselves, when there is one, if you run
+   % git config [--global] khan-linter.use-daemon true
+They lint in-process, as usual, if there's no server running.
+
+The server never auto-updates khan-linter, like runlint.py does;
+instead it exits if khan-linter's code changes out from under it.  It
+doesn't lint while khan-linter is being updated; see lint_update.py.
+
+The socket is in a directory only we can get at, and the client only
+talks to a socket we own, so other users can neither talk to our
+server nor pretend to be it.
+
+The protocol: the client sends one line of json, a dict with keys
+'argv', 'prog' (the program name for --help), 'cwd', 'env', and
+maybe 'changed_lines' (or just 'command': 'stop').  The server
+replies with a series of frames, each of which looks like
+   <kind> <length>\n<data>
+where kind is 'o' for stdout, 'e' for stderr, 'x' for the exit code
+(which is the data, and is the last frame), or 'r' if the client
+should run the lint itself (also the last frame).
+"""
+
+import errno
+import json
+import os
+import socket
+import stat
+import subprocess
+import sys
+import time
+
+import lint_update
+import lint_util
+
+_RUNLINT = os.path.join(lint_util.get_real_cwd(), 'runlint.py')
+
+
+def _default_socket_path():
+    # XDG_RUNTIME_DIR, where there is one, is made for things like
+    # this: it's private to us, and cleared when we log out.
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        socket_dir = os.path.join(runtime_dir, 'khan-linter')
+    else:
+        cache_home = (os.environ.get('XDG_CACHE_HOME') or
+                      os.path.join(os.path.expanduser('~'), '.cache'))
+        # Not in lint_cache's directory, which it prunes.
+        socket_dir = os.path.join(cache_home, 'khan-linter-server')
+    return os.path.join(socket_dir, 'lint.sock')
+
+
+_DEFAULT_SOCKET = _default_socket_path()
+
+# The environment variables, or prefixes of them, that the client
+# sends the server: those that runlint.py, the linters, and the
+# programs they run (like git and node) look at.  The server gets
+# the rest of its environment from when it started.  We don't send
+# the whole environment, since there's no call to hand it (and any
+# secrets in it) to another process.
+_CLIENT_ENV_VARS = ('PATH', 'HOME', 'TMPDIR', 'LANG', 'XDG_CACHE_HOME',
+                    'NODE_PATH')
+_CLIENT_ENV_PREFIXES = ('GIT_', 'LC_')
+
+# The server exits if it gets no requests for this long.
+_IDLE_TIMEOUT_SECS = 4 * 60 * 60
+
+# The khan-linter files, besides those that affect lint output (see
+# lint_cache._CODE_FILES), that the server runs code from.  If any of
+# them change, the server exits.
+_SERVER_CODE_FILES = ('runlint.py', 'content_source.py', 'lint_daemon.py',
+                      'lint_profile.py', 'lint_update.py', 'lint_watch.py')
+
+# We forget what we know about which directories hold blacklists,
+# extra linters, etc, if it's older than this, in case someone has
+# added (or removed) one.
+_ANCESTOR_CACHE_MAX_AGE_SECS = 60
+
+
+# ----------------------------------------------------------------------
+# The server.
+
+
+class _FrameWriter(object):
+    """A file-like object that sends what is written to it as frames.
+
+    We buffer stdout a bit, to avoid sending a frame for every print
+    statement.  We flush it before writing anything to stderr, though,
+    so the client sees output in the same order we wrote it.
+    """
+    _MAX_BUFFER = 8192
+
+    def __init__(self, sock, kind, flush_first=None):
+        self._sock = sock
+        self._kind = kind
+        self._flush_first = flush_first
+        self._buffer = []
+        self._buffer_size = 0
+        self.softspace = 0        # needed by the print statement
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffer_size += len(data)
+        if self._kind == 'e' or self._buffer_size >= self._MAX_BUFFER:
+            self.flush()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self._flush_first:
+            self._flush_first.flush()
+        if self._buffer:
+            _send_frame(self._sock, self._kind, ''.join(self._buffer))
+            self._buffer = []
+            self._buffer_size = 0
+
+    def isatty(self):
+        return False
+
+
+def _send_frame(sock, kind, data):
+    sock.sendall('%s %d\n%s' % (kind, len(data), data))
+
+
+class _Server(object):
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        # Importing runlint is what imports all the linters.
+        import runlint
+        import lint_cache
+        self._runlint = runlint
+        self._lint_lock = lint_update.lint_lock
+        self._code_files = lint_cache._CODE_FILES + _SERVER_CODE_FILES
+        self._code_fingerprint = lint_cache._code_fingerprint
+        self._startup_fingerprint = self._code_fingerprint(self._code_files)
+        self._blacklist_mtimes = {}
+        self._ancestor_cache_time = time.time()
+
+    def _mtime(self, filename):
+        try:
+            return os.stat(filename).st_mtime
+        except (IOError, OSError):
+            return None
+
+    def _forget_stale_caches(self):
+        """Drop anything runlint has cached that might be out of date."""
+        blacklist_cache = self._runlint._BLACKLIST_CACHE
+        for filename in blacklist_cache.keys():
+            if self._mtime(filename) != self._blacklist_mtimes.get(filename):
+                del blacklist_cache[filename]
+
+        if (time.time() - self._ancestor_cache_time >
+                _ANCESTOR_CACHE_MAX_AGE_SECS):
+            self._runlint._ANCESTOR_DIR_CACHE.clear()
+            self._ancestor_cache_time = time.time()
+
+    def _remember_blacklist_mtimes(self):
+        self._blacklist_mtimes = dict(
+            (filename, self._mtime(filename))
+            for filename in self._runlint._BLACKLIST_CACHE)
+
+    def _lint(self, request, sock):
+        """Run runlint as the request says; return the exit code."""
+        orig_cwd = os.getcwd()
+        orig_env = os.environ.copy()
+        orig_stdout = sys.stdout
+        orig_stderr = sys.stderr
+        sys.stdout = _FrameWriter(sock, 'o')
+        sys.stderr = _FrameWriter(sock, 'e', flush_first=sys.stdout)
+        try:
+            os.chdir(request['cwd'])
+            for name in os.environ.keys():
+                if _is_client_env_var(name):
+                    del os.environ[name]
+            os.environ.update((name, value) for (name, value)
+                              in request['env'].iteritems()
+                              if _is_client_env_var(name))
+            self._forget_stale_caches()
+            try:
+                (options, args) = self._runlint.parse_commandline(
+                    request['argv'], prog=request.get('prog'))
+                changed_lines = request.get('changed_lines')
+                if changed_lines is not None:
+                    changed_lines = dict(
+                        (filename, set(lines))
+                        for (filename, lines) in changed_lines.iteritems())
+                return self._runlint.run_from_commandline(
+                    options, args, changed_lines=changed_lines)
+            except SystemExit, why:     # e.g. from --help
+                if why.code is None:
+                    return 0
+                if isinstance(why.code, int):
+                    return why.code
+                print >>sys.stderr, why.code
+                return 1
+            except Exception, why:
+                print >>sys.stderr, 'ERROR in the lint server: %s' % why
+                return 1
+        finally:
+            sys.stdout.flush()
+            sys.stdout = orig_stdout
+            sys.stderr = orig_stderr
+            os.environ.clear()
+            os.environ.update(orig_env)
+            os.chdir(orig_cwd)
+            self._remember_blacklist_mtimes()
+
+    def handle(self, sock):
+        """Handle one request.  Returns False if the server should stop."""
+        request = json.loads(sock.makefile('rb').readline())
+        if request.get('command') == 'stop':
+            return False
+
+        # We hold the lock from when we check the code until we're
+        # done linting, so it can't change in between.
+        with self._lint_lock():
+            if (self._code_fingerprint(self._code_files) !=
+                    self._startup_fingerprint):
+                # khan-linter has been updated since we started.  Let
+                # the client lint with the new code, and we'll go away.
+                # We remove the socket first, so the client doesn't
+                # try to use us again.
+                try:
+                    os.unlink(self.socket_path)
+                except OSError:
+                    pass
+                _send_frame(sock, 'r', '')
+                return False
+
+            exit_code = self._lint(request, sock)
+        _send_frame(sock, 'x', str(exit_code))
+        return True
+
+    def serve_forever(self):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0077)    # only we get to talk to the server
+        try:
+            listener.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        listener.listen(16)
+        listener.settimeout(_IDLE_TIMEOUT_SECS)
+        try:
+            while True:
+                try:
+                    (sock, _) = listener.accept()
+                except socket.timeout:
+                    return
+                sock.settimeout(None)
+                try:
+                    if not self.handle(sock):
+                        return
+                except (IOError, OSError, socket.error, ValueError):
+                    pass        # the client went away, or sent garbage
+                finally:
+                    sock.close()
+        finally:
+            listener.close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+
+def _is_client_env_var(name):
+    return (name in _CLIENT_ENV_VARS or
+            name.startswith(_CLIENT_ENV_PREFIXES))
+
+
+def _make_private_dir(directory):
+    """Create directory, if need be; return True if only we can use it."""
+    try:
+        os.makedirs(directory, 0700)
+    except OSError, why:
+        if why.errno != errno.EEXIST:
+            return False
+    try:
+        st = os.lstat(directory)
+    except OSError:
+        return False
+    return (stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and
+            not st.st_mode & 0077)
+
+
+def _check_socket_dir(socket_path):
+    """Make sure the server's socket will be private; complain if not.
+
+    If the user picked the socket path (via $KHAN_LINTER_SOCKET),
+    where to put it is up to them.
+    """
+    socket_dir = os.path.dirname(socket_path)
+    if socket_path != _DEFAULT_SOCKET or _make_private_dir(socket_dir):
+        return True
+    print >>sys.stderr, ('Not starting a lint server: %s is not a '
+                         'directory that only you can use' % socket_dir)
+    return False
+
+
+def _connect(socket_path):
+    """Return a socket connected to the server, or None if none is running.
+
+    If there's a socket file but no server, we delete the socket file.
+    We only connect to sockets we own: anyone could be listening on
+    someone else's.
+    """
+    try:
+        st = os.lstat(socket_path)
+    except OSError:
+        return None
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error, why:
+        sock.close()
+        if why.errno == errno.ECONNREFUSED:
+            try:
+                os.unlink(socket_path)   # the server must have died
+            except OSError:
+                pass
+        return None
+    return sock
+
+
+def serve(socket_path=_DEFAULT_SOCKET):
+    """Run a lint server in the foreground, until it's stopped or idle."""
+    if not _check_socket_dir(socket_path):
+        return 1
+    sock = _connect(socket_path)
+    if sock is not None:
+        sock.close()
+        print >>sys.stderr, ('A lint server is already running on %s'
+                             % socket_path)
+        return 1
+    _Server(socket_path).serve_forever()
+    return 0
+
+
+def start(socket_path=_DEFAULT_SOCKET):
+    """Start a lint server in the background."""
+    if not _check_socket_dir(socket_path):
+        return 1
+    if os.fork():
+        return 0
+    # We're the child: detach ourselves from the terminal.
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.chdir('/')
+    os._exit(serve(socket_path))
+
+
+def stop(socket_path=_DEFAULT_SOCKET):
+    """Stop the lint server, if one is running."""
+    sock = _connect(socket_path)
+    if sock is not None:
+        sock.sendall(json.dumps({'command': 'stop'}) + '\n')
+        sock.close()
+    return 0
+
+
+# ----------------------------------------------------------------------
+# The client.
+
+
+def _socket_path():
+    return os.environ.get('KHAN_LINTER_SOCKET', _DEFAULT_SOCKET)
+
+
+def use_server():
+    """Return True if we should lint via the server, when there is one.
+
+    That's up to `git config khan-linter.use-daemon`.
+    """
+    try:
+        value = subprocess.check_output(
+            ['git', 'config', '--bool', 'khan-linter.use-daemon'])
+    except (subprocess.CalledProcessError, OSError):    # it's not set
+        return False
+    return value.strip() == 'true'
+
+
+def lint_with_server(argv, prog=None, changed_lines=None,
+                     socket_path=None):
+    """Lint via the server; return the exit code, or None if we can't.
+
+    argv holds the arguments to runlint.py (not including argv[0]),
+    and prog is the name of the program to use in --help and errors.
+    changed_lines is as for runlint.main().  None means the caller
+    should lint by itself: there's no server, or it's going away.
+    """
+    # --watch never finishes, so it would tie up the server forever.
+    if '--watch' in argv:
+        return None
+
+    sock = _connect(socket_path or _socket_path())
+    if sock is None:
+        return None
+
+    request = {'argv': argv, 'prog': prog, 'cwd': os.getcwd(),
+               'env': dict((name, value) for (name, value)
+                           in os.environ.iteritems()
+                           if _is_client_env_var(name))}
+    if changed_lines is not None:
+        request['changed_lines'] = dict(
+            (filename, sorted(lines))
+            for (filename, lines) in changed_lines.iteritems())
+    try:
+        sock.sendall(json.dumps(request) + '\n')
+        responses = sock.makefile('rb')
+        header = responses.readline()
+    except socket.error:
+        header = ''
+    if not header:
+        # The server went away before it did anything for us.
+        return None
+    while True:
+        (kind, length) = header.split()
+        data = responses.read(int(length))
+        if kind == 'o':
+            sys.stdout.write(data)
+        elif kind == 'e':
+            sys.stdout.flush()
+            sys.stderr.write(data)
+        elif kind == 'x':
+            return int(data)
+        elif kind == 'r':
+            return None
+        header = responses.readline()
+        if not header:
+            print >>sys.stderr, 'ERROR: the lint server went away'
+            return 1
+
+
+def lint_with_server_if_wanted():
+    """Do runlint.py's linting via the server, if use_server() says to.
+
+    If the server does the linting, we exit with its exit code.
+    Otherwise we return, and runlint.py lints by itself.  runlint.py
+    calls this before it imports the linters, which is half of what
+    the server saves us.
+    """
+    argv = sys.argv[1:]
+    if '--watch' in argv or not use_server():
+        return
+    # The server never updates khan-linter, so we start the update
+    # that runlint.py would have.  (Even with --auto-pull=sync, we
+    # don't wait for it.)
+    if '--no-auto-pull' not in argv:
+        lint_update.maybe_start_background_update(verbose=False)
+    exit_code = lint_with_server(argv,
+                                 prog=os.path.basename(sys.argv[0]))
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+
+def _run_runlint(argv):
+    """Run runlint.py in this process; we never return."""
+    os.execv(sys.executable, [sys.executable, _RUNLINT] + argv)
+
+
+def lint(argv, socket_path=_DEFAULT_SOCKET):
+    """Lint via the server, or runlint.py if need be; return the exit code.
+
+    argv holds the arguments to runlint.py (not including argv[0]).
+    """
+    exit_code = lint_with_server(
+        argv, prog='%s lint' % os.path.basename(sys.argv[0]),
+        socket_path=socket_path)
+    if exit_code is None:
+        sys.stdout.flush()
+        _run_runlint(argv)
+    return exit_code
+
+
+if __name__ == '__main__':
+    socket_path = _socket_path()
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'start':
+        sys.exit(start(socket_path))
+    elif command == 'stop':
+        sys.exit(stop(socket_path))
+    elif command == 'serve':
+        sys.exit(serve(socket_path))
+    elif command == 'lint':
+        sys.exit(lint(sys.argv[2:], socket_path))
+    else:
+        sys.exit(__doc__.split('\n\n')[1])
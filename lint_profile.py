@@ -0,0 +1,254 @@
+"""Time where a lint run spends its time, for `runlint.py --profile`.
+
+The lint framework marks out the phases of its work -- finding the
+files to lint, checking them against the blacklist, reading them,
+parsing them, running the checks, filtering the output, waiting for
+external linters -- with phase():
+
+    with lint_profile.phase('parse', linter='Pep8', filename=f):
+        ...
+
+When no profile is being taken (the usual case), phase() does
+nothing, and costs about as much as a function call.  When one is,
+we add up the time spent in each phase, for each linter and each
+file.  Phases can nest; a phase's time doesn't include the time spent
+in the phases nested inside it, so the times add up to the total.
+A nested phase is for the same linter and file as the phase around
+it, unless it says otherwise.
+
+Linters also do work in background threads (waiting for eslint, say)
+and in subprocesses (with --jobs).  Those phases are timed too, but
+they overlap the main thread's, so the times can add up to more than
+the total; the main thread's time waiting for them is its own phase.
+"""
+
+import collections
+import json
+import threading
+import time
+
+
+# The Profiler that phase() records to, or None if we're not profiling.
+_PROFILER = None
+
+# What we call time that isn't in any phase.
+_OTHER = 'other'
+
+
+class _NullPhase(object):
+    """What phase() returns when we aren't profiling."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+    """A context manager that times one phase for a Profiler."""
+    def __init__(self, profiler, name, linter, filename):
+        self._profiler = profiler
+        self.name = name
+        self.linter = linter
+        self.filename = filename
+        self.start_time = None
+        self.nested_secs = 0.0
+
+    def __enter__(self):
+        stack = self._profiler._stack()
+        if stack:
+            self.linter = self.linter or stack[-1].linter
+            self.filename = self.filename or stack[-1].filename
+        stack.append(self)
+        self.start_time = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.time() - self.start_time
+        stack = self._profiler._stack()
+        stack.pop()
+        if stack:
+            stack[-1].nested_secs += elapsed
+        self._profiler.add(self.name, self.linter, self.filename,
+                           elapsed - self.nested_secs)
+
+
+class Profiler(object):
+    """Adds up the time spent in each phase, linter, and file.
+
+    timings maps (phase, linter, filename) to a pair [seconds, count];
+    linter and filename may be None.
+    """
+    def __init__(self):
+        self.start_time = time.time()
+        self.end_time = None
+        self.timings = {}
+        self._lock = threading.Lock()     # phases end in many threads
+        self._local = threading.local()
+        # The thread that starts us gets an outermost phase, which
+        # collects the time that isn't in any other phase.
+        self._outermost_phase = self.phase(_OTHER)
+        self._outermost_phase.__enter__()
+
+    def _stack(self):
+        """The phases this thread is in, innermost last."""
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def phase(self, name, linter=None, filename=None):
+        return _Phase(self, name, linter, filename)
+
+    def add(self, name, linter, filename, secs, count=1):
+        key = (name, linter, filename)
+        with self._lock:
+            timing = self.timings.setdefault(key, [0.0, 0])
+            timing[0] += secs
+            timing[1] += count
+
+    def stop(self):
+        """Stop timing; call from the thread that created the Profiler."""
+        self._outermost_phase.__exit__(None, None, None)
+        self.end_time = time.time()
+
+    def summary(self):
+        """Return the timings added up in various ways, as a dict.
+
+        This is also what we write to the json file.
+        """
+        total_secs = (self.end_time or time.time()) - self.start_time
+        phases = collections.defaultdict(lambda: [0.0, 0])
+        linters = collections.defaultdict(lambda: collections.defaultdict(
+            float))
+        files = collections.defaultdict(lambda: collections.defaultdict(
+            float))
+        for ((name, linter, filename), (secs, count)) in (
+                self.timings.iteritems()):
+            phases[name][0] += secs
+            phases[name][1] += count
+            if linter is not None:
+                linters[linter][name] += secs
+            if filename is not None:
+                files[filename][name] += secs
+
+        return {
+            'total_seconds': total_secs,
+            'phases': dict((name, {'seconds': secs, 'count': count})
+                           for (name, (secs, count)) in phases.iteritems()),
+            'linters': dict((linter, dict(by_phase))
+                            for (linter, by_phase) in linters.iteritems()),
+            'files': sorted(
+                ({'filename': filename,
+                  'seconds': sum(by_phase.itervalues()),
+                  'phases': dict(by_phase)}
+                 for (filename, by_phase) in files.iteritems()),
+                key=lambda f: (-f['seconds'], f['filename'])),
+        }
+
+    def report(self, outfile, num_files=10):
+        """Print a human-readable summary, with the slowest num_files files."""
+        summary = self.summary()
+
+        def breakdown(by_phase):
+            return ', '.join('%s %.3f' % (name, secs) for (name, secs)
+                             in sorted(by_phase.iteritems(),
+                                       key=lambda kv: -kv[1]))
+
+        print >>outfile, ('--- Profile: %.3f seconds in all'
+                          % summary['total_seconds'])
+        print >>outfile, 'By phase:'
+        for (name, timing) in sorted(summary['phases'].iteritems(),
+                                     key=lambda kv: -kv[1]['seconds']):
+            print >>outfile, ('  %9.3f s  %7d x  %s'
+                              % (timing['seconds'], timing['count'], name))
+        print >>outfile, 'By linter:'
+        for (linter, by_phase) in sorted(
+                summary['linters'].iteritems(),
+                key=lambda kv: -sum(kv[1].itervalues())):
+            print >>outfile, ('  %9.3f s  %s (%s)'
+                              % (sum(by_phase.itervalues()), linter,
+                                 breakdown(by_phase)))
+        print >>outfile, ('Slowest %d of %d files:'
+                          % (min(num_files, len(summary['files'])),
+                             len(summary['files'])))
+        for f in summary['files'][:num_files]:
+            print >>outfile, ('  %9.3f s  %s (%s)'
+                              % (f['seconds'], f['filename'],
+                                 breakdown(f['phases'])))
+
+    def write_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+def start():
+    """Start profiling; return the Profiler that phase() now records to."""
+    global _PROFILER
+    _PROFILER = Profiler()
+    return _PROFILER
+
+
+def stop():
+    """Stop profiling; return the Profiler, or None if we weren't."""
+    global _PROFILER
+    (profiler, _PROFILER) = (_PROFILER, None)
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def phase(name, linter=None, filename=None):
+    """Return a context manager timing a phase, if we're profiling."""
+    if _PROFILER is None:
+        return _NULL_PHASE
+    return _PROFILER.phase(name, linter, filename)
+
+
+def timed(name, fn):
+    """Return fn, but timed as the given phase if we're profiling.
+
+    This is for functions we call very many times, where we don't
+    want even the cost of calling phase() unless we're profiling.
+    """
+    if _PROFILER is None:
+        return fn
+
+    def timed_fn(*args):
+        with _PROFILER.phase(name):
+            return fn(*args)
+    return timed_fn
+
+
+# Subprocesses (of a multiprocessing.Pool) are forked with a copy of
+# our profiler, which they record to as usual.  They send us their
+# timings, via take_subprocess_timings() and add_subprocess_timings().
+
+def reset_in_subprocess():
+    """Forget the timings that a forked subprocess inherited from us."""
+    if _PROFILER is not None:
+        _PROFILER.timings = {}
+        _PROFILER._lock = threading.Lock()
+        _PROFILER._local = threading.local()
+
+
+def take_subprocess_timings():
+    """Return the timings recorded in this subprocess since we last asked.
+
+    Returns None if we aren't profiling.
+    """
+    if _PROFILER is None:
+        return None
+    (timings, _PROFILER.timings) = (_PROFILER.timings, {})
+    return timings
+
+
+def add_subprocess_timings(timings):
+    """Add timings from take_subprocess_timings() into our own."""
+    if _PROFILER is None or timings is None:
+        return
+    for ((name, linter, filename), (secs, count)) in timings.iteritems():
+        _PROFILER.add(name, linter, filename, secs, count)
@@ -0,0 +1,213 @@
+"""Lint errors, and the formatters that print them.
+
+The linters return LintError records, rather than printing lines of
+text.  The records are only turned into text at the very end, by
+whichever formatter the user asked for:
+   text: our canonical form, one error per line:
+            <file>:<line>[:<col>]: <E|W><code> <msg>
+         (This is what `arc lint` and the commit hooks expect.)
+   json: a list of objects, one per error
+   checkstyle: the xml format that CI tools like jenkins understand
+
+Some things we need to tell the user aren't lint errors -- "I couldn't
+read this file," for instance.  The text formatter prints those
+notes in with the lint errors, just as it always has; the structured
+formatters print them to stderr, to keep their output parseable.
+"""
+
+import collections
+import json
+import os
+import re
+import sys
+from xml.sax import saxutils
+
+
+class LintError(collections.namedtuple(
+        'LintError', ('filename', 'linenum', 'colnum', 'code', 'message',
+                      'fix'))):
+    """One lint error.
+
+    Attributes:
+       filename: the file with the error, relative to the cwd
+       linenum: the line the error is on; the first line is 1
+       colnum: the column the error is at (the first column is 1),
+          or None if the linter doesn't say
+       code: the kind of error, like 'E501' or 'E=pyflakes='.  It
+          starts with E for an error, or W for a warning.
+       message: a description of the error
+       fix: None, or a pair (text_to_remove, text_to_add) saying how
+          to fix the error at colnum, for `arc lint` to offer to do.
+    """
+    __slots__ = ()
+
+    def __new__(cls, filename, linenum, colnum, code, message, fix=None):
+        return super(LintError, cls).__new__(cls, filename, linenum, colnum,
+                                             code, message, fix)
+
+    @classmethod
+    def from_list(cls, values):
+        """Make a LintError from a list like what json.loads() gives us.
+
+        That is: [filename, linenum, colnum, code, message], with an
+        optional fix (as a 2-element list) at the end, where strings
+        may be unicode.  We store all strings as utf-8.
+        """
+        def utf8(value):
+            if isinstance(value, unicode):
+                return value.encode('utf-8')
+            return value
+
+        values = [utf8(value) for value in values]
+        if len(values) > 5 and values[5]:
+            values[5] = tuple(utf8(value) for value in values[5])
+        return cls(*values)
+
+    def to_text(self):
+        """Return this error in our canonical one-line form."""
+        if self.colnum is None:
+            location = '%s:%s' % (self.filename, self.linenum)
+        else:
+            location = '%s:%s:%s' % (self.filename, self.linenum,
+                                     self.colnum)
+        text = '%s: %s %s' % (location, self.code, self.message)
+        if self.fix is not None:
+            # This is the format that arc's linter regexp looks for.
+            text += '\0%s\0%s\0' % self.fix
+        return text
+
+
+_TEXT_RE = re.compile(r'^([^:]*):(\d+)(?::(\d+))?: (\S+) (.*)$')
+
+
+def parse_text(line):
+    """Parse a line in our canonical form into a LintError.
+
+    This is for external linters, which give us their output as text.
+    Returns None if the line is not in the canonical form.
+    """
+    m = _TEXT_RE.match(line)
+    if m is None:
+        return None
+    (filename, linenum, colnum, code, message) = m.groups()
+    return LintError(filename, int(linenum),
+                     None if colnum is None else int(colnum),
+                     code, message)
+
+
+def to_json(errors):
+    """Encode a list of LintErrors as json, e.g. to store them."""
+    return json.dumps(errors)
+
+
+def from_json(s):
+    """The inverse of to_json()."""
+    return [LintError.from_list(error) for error in json.loads(s)]
+
+
+class TextFormatter(object):
+    """Prints each lint error in our canonical form as it comes in."""
+    def report(self, errors):
+        """Output the given LintErrors; return how many we output."""
+        for error in errors:
+            print error.to_text()
+        return len(errors)
+
+    def note(self, message):
+        """Tell the user something that isn't a lint error."""
+        print message
+
+    def finish(self):
+        """Output anything we've been saving up; call once at the end."""
+        pass
+
+
+class CollectingFormatter(TextFormatter):
+    """Collects the lint errors for the caller, rather than printing them.
+
+    The errors are in self.errors.  Notes are printed as usual.
+    """
+    def __init__(self):
+        self.errors = []
+
+    def report(self, errors):
+        self.errors.extend(errors)
+        return len(errors)
+
+
+class _SavingFormatter(TextFormatter):
+    """Base class for formatters that print everything at the end."""
+    def __init__(self):
+        self._errors = []
+
+    def report(self, errors):
+        self._errors.extend(errors)
+        return len(errors)
+
+    def note(self, message):
+        print >>sys.stderr, message
+
+
+class JsonFormatter(_SavingFormatter):
+    """Prints all the lint errors at the end, as a json list of objects."""
+    def finish(self):
+        json.dump([error._asdict() for error in self._errors], sys.stdout,
+                  indent=2, sort_keys=True)
+        print
+
+
+class CheckstyleFormatter(_SavingFormatter):
+    """Prints all the lint errors at the end, in checkstyle xml format."""
+    def finish(self):
+        errors_by_file = collections.OrderedDict()
+        for error in self._errors:
+            errors_by_file.setdefault(error.filename, []).append(error)
+
+        print '<?xml version="1.0" encoding="utf-8"?>'
+        print '<checkstyle version="4.3">'
+        for (filename, errors) in errors_by_file.iteritems():
+            print '<file name=%s>' % saxutils.quoteattr(filename)
+            for error in errors:
+                print ('<error line="%s" column="%s" severity="%s" '
+                       'message=%s source=%s/>'
+                       % (error.linenum, error.colnum or 0,
+                          'warning' if error.code.startswith('W')
+                          else 'error',
+                          saxutils.quoteattr(error.message),
+                          saxutils.quoteattr(error.code)))
+            print '</file>'
+        print '</checkstyle>'
+
+
+class ChangedLinesFilter(object):
+    """Wraps a formatter, passing on only errors on the given lines.
+
+    This is so we can complain only about lines someone has changed
+    (in a commit, say), and not about every old lint error in the
+    files they touched.  changed_lines is a map from filename to the
+    set of line numbers to report errors on.  Errors in files not in
+    changed_lines are not reported either.
+    """
+    def __init__(self, formatter, changed_lines):
+        self._formatter = formatter
+        self._changed_lines = dict((os.path.normpath(f), lines)
+                                   for (f, lines) in changed_lines.iteritems())
+
+    def report(self, errors):
+        return self._formatter.report(
+            [error for error in errors
+             if error.linenum in self._changed_lines.get(
+                 os.path.normpath(error.filename), ())])
+
+    def note(self, message):
+        self._formatter.note(message)
+
+    def finish(self):
+        self._formatter.finish()
+
+
+FORMATTERS = {
+    'text': TextFormatter,
+    'json': JsonFormatter,
+    'checkstyle': CheckstyleFormatter,
+}
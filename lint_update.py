@@ -0,0 +1,254 @@
+"""Keep khan-linter up to date, without getting in the way of lints.
+
+Once a day, runlint.py updates the khan-linter repo it's running
+from, via git.  It can do that one of two ways:
+   sync: pull before linting, and then re-exec itself to lint with
+      the new code.  This can add seconds (or, on a slow network,
+      much more) to whichever lint happens to do it.
+   background: start a detached updater process, and lint right
+      away with the code we have.  The updater fetches the new code
+      and switches the repo over to it; the next lint uses it.
+
+Either way, we must never change the repo's files while a lint is
+running from them: it could import a mix of old and new modules, or
+have eslint read a new config with old plugins.  So every lint holds
+a shared lock (via lint_lock()) while it runs, and we only switch
+the repo to the new code while holding the exclusive lock.  The
+switch itself (a fast-forward merge of what we've fetched) is quick
+and needs no network, so lints that start during it wait only a
+moment.
+
+But a lint imports its code before it takes the lock, and the repo
+could be switched in between.  So runlint.py imports us before the
+rest of khan-linter, and we note then what khan-linter's code is.
+Once it has the lock, it checks with code_changed() that the code is
+still the same, and if not starts over.
+"""
+
+import contextlib
+import errno
+import fcntl
+import os
+import subprocess
+import time
+
+import lint_util
+
+
+_CWD = lint_util.get_real_cwd()
+
+# This file's mtime is when we last updated.  We also lock it: see
+# lint_lock() and _update_lock().
+_LOCK_FILE = '/tmp/khan-linter.pull'
+
+_UPDATE_INTERVAL_SECS = 24 * 60 * 60
+
+# The background updater waits at most this long for running lints
+# to finish before switching to the new code.  If it can't, the
+# next lint tries again.
+_MAX_SWITCH_WAIT_SECS = 10 * 60
+_SWITCH_RETRY_SECS = 1
+
+
+def _code_state():
+    """Return something that changes whenever khan-linter's code does.
+
+    This is the size, mtime, and inode of each of our .py and .js
+    files.  (An update replaces the files it changes.)  We only stat
+    the files, so this is cheap enough to do on every lint.
+    """
+    retval = []
+    for name in sorted(os.listdir(_CWD)):
+        if name.endswith(('.py', '.js')):
+            try:
+                st = os.stat(os.path.join(_CWD, name))
+            except OSError:
+                continue
+            retval.append((name, st.st_size, st.st_mtime, st.st_ino))
+    return retval
+
+
+# khan-linter's code when we were imported, which is before the rest
+# of it was.
+_CODE_STATE_AT_IMPORT = _code_state()
+
+
+def code_changed():
+    """True if khan-linter's code has changed since we were imported.
+
+    Call this while holding lint_lock().  If it returns False, the
+    code we imported is the code in the repo, and stays so until we
+    release the lock.
+    """
+    return _code_state() != _CODE_STATE_AT_IMPORT
+
+
+def _open_lock_file():
+    """Return a file object for _LOCK_FILE, or None if we can't open it."""
+    try:
+        return open(_LOCK_FILE, 'a')
+    except (IOError, OSError):
+        try:
+            # Someone else created it, say; we can still lock it.
+            return open(_LOCK_FILE, 'r')
+        except (IOError, OSError):
+            return None
+
+
+@contextlib.contextmanager
+def lint_lock():
+    """Keep the repo from being updated while in this context.
+
+    Lints run inside this; several can do so at once.  If we can't
+    lock (the lock file isn't readable, say), we lint anyway.
+    """
+    f = _open_lock_file()
+    if f is None:
+        yield
+        return
+    try:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        yield
+    finally:
+        f.close()      # which releases the lock
+
+
+@contextlib.contextmanager
+def _update_lock(max_wait_secs=None):
+    """Wait until no lints are running, and keep them from starting.
+
+    Yields True if we got the lock, or False if we couldn't get it
+    within max_wait_secs (if not None), or couldn't lock at all.
+    """
+    f = _open_lock_file()
+    if f is None:
+        yield False
+        return
+    try:
+        if max_wait_secs is None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            deadline = time.time() + max_wait_secs
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except IOError, why:
+                    if why.errno not in (errno.EAGAIN, errno.EACCES):
+                        raise
+                if time.time() >= deadline:
+                    yield False
+                    return
+                time.sleep(_SWITCH_RETRY_SECS)
+        yield True
+    finally:
+        f.close()
+
+
+def _git(*args):
+    return subprocess.check_output(('git',) + args, cwd=_CWD)
+
+
+def _update_is_due():
+    """True if we're a git repo that hasn't been updated in a day."""
+    # If we're not a git repo, we can't pull.
+    if not os.path.isdir(os.path.join(_CWD, '.git')):
+        return False
+    try:
+        last_update_time = os.stat(_LOCK_FILE).st_mtime
+    except (IOError, OSError):
+        last_update_time = 0
+    return last_update_time + _UPDATE_INTERVAL_SECS < time.time()
+
+
+def _set_last_update_time(when):
+    """Set the mtime of _LOCK_FILE, creating it if need be."""
+    try:
+        open(_LOCK_FILE, 'a').close()
+        os.utime(_LOCK_FILE, (when, when))
+    except (IOError, OSError):
+        pass
+
+
+def maybe_update(verbose):
+    """Pull if the repo hasn't been updated in 24 hours, then return.
+
+    Returns True if the working copy changed as a result, and False
+    if no pull was done or there were no changes.  We wait for any
+    running lints to finish first.
+    """
+    if not _update_is_due():
+        return False
+
+    _set_last_update_time(time.time())
+    # Phabricator often runs two linters at the same time, meaning
+    # they could both contend for the 'git pull' call.  This lock
+    # prevents that.  (It does mean that we pull twice, but that's
+    # the safest way to make sure neither linter runs before the
+    # update is complete.)
+    with _update_lock():
+        if verbose:
+            print 'Updating the khan-linter repo'
+        old_sha = _git('rev-parse', 'HEAD')
+        _git('pull', '-q', '--no-rebase', '--ff-only')
+        new_sha = _git('rev-parse', 'HEAD')
+
+    return new_sha != old_sha
+
+
+def _update_in_background():
+    """Fetch the new code, and switch to it once no lint is running.
+
+    This runs in the detached updater process.
+    """
+    try:
+        _git('fetch', '-q')
+        upstream = _git('rev-parse', '@{upstream}').strip()
+        if _git('rev-parse', 'HEAD').strip() == upstream:
+            return                 # we're up to date
+        with _update_lock(_MAX_SWITCH_WAIT_SECS) as locked:
+            if locked:
+                _git('merge', '-q', '--ff-only', upstream)
+                return
+    except (subprocess.CalledProcessError, OSError):
+        pass
+    # We didn't update, so let the next lint try again.  (But not
+    # right away, if we failed because we're offline, say.)
+    _set_last_update_time(time.time() - _UPDATE_INTERVAL_SECS + 60 * 60)
+
+
+def maybe_start_background_update(verbose):
+    """Start updating the repo if it hasn't been updated in 24 hours.
+
+    We return right away: the update happens in a detached process,
+    which outlives us if need be, and takes effect for the lints that
+    start once it's done.  Call this before lint_lock(): the updater
+    must not inherit our lock.
+    """
+    if not _update_is_due():
+        return
+
+    # Set the last-update time now, so other lints don't start
+    # updaters of their own.
+    _set_last_update_time(time.time())
+    if verbose:
+        print 'Updating the khan-linter repo in the background'
+
+    pid = os.fork()
+    if pid:
+        os.waitpid(pid, 0)         # the child exits right away
+        return
+    # We're the child: detach ourselves from the terminal, and from
+    # our parent's output (which arc, say, is reading until it's
+    # closed).
+    try:
+        os.setsid()
+        if os.fork():
+            os._exit(0)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        os.closerange(3, subprocess.MAXFD)
+        _update_in_background()
+    finally:
+        os._exit(0)
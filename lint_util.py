@@ -2,6 +2,8 @@
 
 import os
 import re
+import sys
+import threading
 
 
 def get_real_cwd():
@@ -9,19 +11,17 @@ def get_real_cwd():
     return os.path.dirname(os.path.realpath(__file__))
 
 
-def add_arc_fix_str(lintline, bad_line, to_remove, to_add,
-                    search_backwards=False, limit_to_80=True):
-    """Return lintline augmented by arc's autopatching functionality.
+def add_arc_fix(error, bad_line, to_remove, to_add,
+                search_backwards=False, limit_to_80=True):
+    """Return error (a lint_result.LintError) with a fix for arc to use.
 
-    This gets picked up as part of the regex used by arc to present
-    linting results. When it sees the added strings, it prompts if
-    you'd like to apply the patch.
+    arc presents the fix as part of the lint results, and prompts if
+    you'd like to apply the patch.  See "config/linter.scriptandregex.regex"
+    in your project's .arclint for how it finds the fix in our output.
 
-    See "config/linter.scriptandregex.regex" in your project's .arclint.
-
-    The way this works is we use lintline to find the first occurrence of
-    'to_remove' in bad_line (after the column number specified in lintline),
-    and munge lintline to set the column number correctly to remove+add.
+    The way this works is we find the first occurrence of 'to_remove'
+    in bad_line (after the column number of error), and set error's
+    column number correctly to remove+add.
     to_remove can be a basestring or a regexp. If search_backwards is True, we
     find the first occurrence of 'to_remove' *before* the listed column number.
     This is for lint errors that report something was bad after it happened
@@ -31,16 +31,13 @@ def add_arc_fix_str(lintline, bad_line, to_remove, to_add,
     If limit_to_80 is True, then we do not suggest a change that
     would increase the linelength beyond 80 chars.
     """
-    (location, errcode, msg) = lintline.split(' ', 2)
-    location_info = location.split(':')
-    if len(location_info) < 4:       # No column info
-        return lintline              # arc can't autofix without a column
-    (fname, line, col, _) = location_info
-    col = int(col) - 1               # Move from 1-indexed to 0-indexed
+    if error.colnum is None:         # No column info
+        return error                 # arc can't autofix without a column
+    col = error.colnum - 1           # Move from 1-indexed to 0-indexed
 
     # Special case: no need to search around for the empty string.
     if not to_remove:
-        return lintline + "\0\0%s\0" % to_add
+        return error._replace(fix=('', to_add))
 
     if not isinstance(to_remove, basestring):
         # `to_remove` is a regexp.
@@ -57,7 +54,7 @@ def add_arc_fix_str(lintline, bad_line, to_remove, to_add,
             col_offset = col
         match = re.search(to_remove, sub_line)
         if match is None:
-            return lintline
+            return error
         to_remove = match.group()
         new_col = match.start() + col_offset
     elif to_remove.endswith('\n'):     # This is a whole-line match
@@ -74,7 +71,35 @@ def add_arc_fix_str(lintline, bad_line, to_remove, to_add,
         len(bad_line) - len(to_remove) + len(to_add) >= 80)
     if new_col == -1 or too_long:
         # Could not find `to_remove`, or line is too long; don't fix.
-        return lintline
+        return error
+
+    return error._replace(colnum=new_col + 1, fix=(to_remove, to_add))
+
+
+class BackgroundCall(object):
+    """Call fn(*args) in a background thread.
+
+    Call result() to wait for fn to finish and get its return value.
+    If fn raised an exception, result() re-raises it.
+    """
+    def __init__(self, fn, *args):
+        self._retval = None
+        self._exc_info = None
+        self._thread = threading.Thread(target=self._run, args=(fn, args))
+        self._thread.daemon = True   # don't keep us alive on control-C
+        self._thread.start()
+
+    def _run(self, fn, args):
+        try:
+            self._retval = fn(*args)
+        except BaseException:
+            self._exc_info = sys.exc_info()
 
-    return ('%s:%s:%s: %s %s\0%s\0%s\0'
-            % (fname, line, new_col + 1, errcode, msg, to_remove, to_add))
+    def result(self):
+        # We join with a timeout because in python2 a plain join()
+        # can't be interrupted by control-C.
+        while self._thread.is_alive():
+            self._thread.join(60)
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._retval
@@ -0,0 +1,215 @@
+"""Notice when files change, for `runlint.py --watch`.
+
+runlint.py does the linting; this module just tells it which files
+have changed since it last looked.  We use linux's inotify (via
+ctypes) if we can, and fall back to polling if we can't: on other
+systems, or if there are too many directories to watch.
+
+Both watchers have a wait() method, which blocks until some files
+change, and then returns the set of their absolute paths, which
+includes files that have been deleted.  A path may be a directory
+that has been deleted, meaning everything under it has been too.
+wait() may instead return None, meaning that anything may have
+changed; the caller should look at everything again, and make a new
+watcher to wait with.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+
+# From <sys/inotify.h>.
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_DONT_FOLLOW = 0x02000000
+_IN_ISDIR = 0x40000000
+_IN_CLOEXEC = 02000000
+
+# We only care about files once they've been written, not while
+# they're being written.  We watch for file creation only to notice
+# new directories.
+_WATCH_MASK = (_IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO |
+               _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF |
+               _IN_ONLYDIR | _IN_DONT_FOLLOW)
+
+# The size of struct inotify_event, not counting the name at the end.
+_EVENT_HEADER = struct.Struct('iIII')
+
+# Editors often save a file in several steps (write a temp file,
+# rename it, ...).  So once something changes, we wait until nothing
+# has changed for this long before saying what did.
+_SETTLE_SECS = 0.1
+
+
+class InotifyWatcher(object):
+    """Watches directory trees for changes using inotify.
+
+    roots are the absolute paths of the files and directories to
+    watch.  We watch every directory under each directory in roots
+    (each needs its own inotify watch), except those for which
+    skip_dir(path) returns True.  For files in roots, we watch the
+    directory they're in, so wait() may also return other files in
+    that directory.
+
+    Raises OSError if inotify is not available, or if we can't watch
+    all the directories (there's a per-user limit).
+    """
+    def __init__(self, roots, skip_dir):
+        self._skip_dir = skip_dir
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                 use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self._fd = self._libc.inotify_init1(_IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._wd_to_dir = {}
+        try:
+            for root in roots:
+                if os.path.isdir(root):
+                    self._watch_tree(root)
+                else:
+                    self._watch_dir(os.path.dirname(root))
+        except OSError:
+            self.close()
+            raise
+
+    def _watch_dir(self, directory):
+        wd = self._libc.inotify_add_watch(self._fd, directory, _WATCH_MASK)
+        if wd < 0:
+            why = ctypes.get_errno()
+            if why in (errno.ENOENT, errno.ENOTDIR):
+                return            # it went away already
+            raise OSError(why, 'Cannot watch %s: %s'
+                          % (directory, os.strerror(why)))
+        self._wd_to_dir[wd] = directory
+
+    def _watch_tree(self, rootdir):
+        """Watch rootdir and the directories under it; return its files."""
+        files = []
+        for (dirpath, dirnames, filenames) in os.walk(rootdir):
+            dirnames[:] = [d for d in dirnames
+                           if not self._skip_dir(os.path.join(dirpath, d))]
+            self._watch_dir(dirpath)
+            files.extend(os.path.join(dirpath, f) for f in filenames)
+        return files
+
+    def _read_events(self, changed):
+        """Add the paths that events say have changed to changed.
+
+        Returns False if we have lost track of what's changed.
+        """
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            (wd, mask, _, name_length) = _EVENT_HEADER.unpack_from(data,
+                                                                   offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip('\0')
+            offset += name_length
+
+            if mask & _IN_Q_OVERFLOW:
+                return False
+            directory = self._wd_to_dir.get(wd)
+            if directory is None:
+                continue
+            if mask & _IN_IGNORED:         # the directory is gone
+                del self._wd_to_dir[wd]
+                continue
+            if mask & (_IN_MOVE_SELF | _IN_DELETE_SELF):
+                # We hear about this from the parent directory too
+                # (unless it's a root, and then there's nothing left
+                # to watch).
+                continue
+
+            path = os.path.join(directory, name)
+            if not mask & _IN_ISDIR:
+                if not mask & _IN_CREATE:
+                    changed.add(path)
+            elif mask & _IN_MOVED_FROM:
+                # The watches under the directory now have the wrong
+                # paths; the simplest thing is to start over.
+                return False
+            elif mask & (_IN_CREATE | _IN_MOVED_TO):
+                if not self._skip_dir(path):
+                    try:
+                        changed.update(self._watch_tree(path))
+                    except OSError:     # probably too many watches now
+                        return False
+            else:                           # _IN_DELETE
+                changed.add(path)
+        return True
+
+    def wait(self):
+        changed = set()
+        timeout = None
+        while True:
+            (readable, _, _) = select.select([self._fd], [], [], timeout)
+            if not readable:               # things have settled down
+                return changed
+            if not self._read_events(changed):
+                return None
+            if changed:
+                timeout = _SETTLE_SECS
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher(object):
+    """Watches files for changes by stat-ing them every so often.
+
+    list_files() returns the absolute paths of the files to watch;
+    we call it every time we look, to find new files.
+    """
+    def __init__(self, list_files, interval_secs=1.0):
+        self._list_files = list_files
+        self._interval_secs = interval_secs
+        self._stats = self._stat_files()
+
+    def _stat_files(self):
+        stats = {}
+        for f in self._list_files():
+            try:
+                st = os.stat(f)
+            except OSError:
+                continue
+            stats[f] = (st.st_mtime, st.st_size, st.st_ino)
+        return stats
+
+    def wait(self):
+        while True:
+            time.sleep(self._interval_secs)
+            stats = self._stat_files()
+            changed = set(f for f in set(stats) | set(self._stats)
+                          if stats.get(f) != self._stats.get(f))
+            self._stats = stats
+            if changed:
+                return changed
+
+    def close(self):
+        pass
+
+
+def make_watcher(roots, skip_dir, list_files):
+    """Return an InotifyWatcher if we can, else a PollingWatcher.
+
+    The arguments are as for those classes' constructors.
+    """
+    try:
+        return InotifyWatcher(roots, skip_dir)
+    except (OSError, AttributeError):
+        return PollingWatcher(list_files)
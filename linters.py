@@ -1,13 +1,21 @@
 """Linters process files or lists of files for correctness."""
 
-import cStringIO
-import itertools
+import Queue
+import collections
+import heapq
+import json
 import os
 import re
 import subprocess
 import sys
+import tempfile
+import threading
 
+import content_source
+import lint_profile
+import lint_result
 import lint_util
+import line_index
 
 # Add vendor path so we can find (our packaged versions of) pep8 and pyflakes.
 _CWD = lint_util.get_real_cwd()
@@ -17,7 +25,12 @@ sys.path.append(_vendor_dir)
 
 import static_content_refs
 import pep8
-from pyflakes.scripts import pyflakes
+import pep8_checker
+import python_parse
+from pyflakes import __version__ as _PYFLAKES_VERSION
+from pyflakes import checker as pyflakes_checker
+from pyflakes import messages as pyflakes_messages
+from pyflakes import reporter as pyflakes_reporter
 
 
 class Linter(object):
@@ -25,98 +38,531 @@ class Linter(object):
 
     When subclassing, override either process_files or process (or both,
     though if you override process_files then it doesn't matter what
-    process does).
+    process does).  Linters that run an external program should also
+    override start_process_files, and set runs_in_subprocess.
+
+    Linters don't print the lint errors they find.  Instead, they
+    hand lint_result.LintError records to a formatter (see
+    lint_result.py), which takes care of the printing.
     """
-    def process_files(self, files):
-        """Print lint errors for a list of filenames and return error count."""
+    # True if the bulk of our work happens in an external program.
+    runs_in_subprocess = False
+
+    def config_fingerprint(self):
+        """Return a string that changes whenever our lint output might.
+
+        This is used as part of the key for the lint-result cache, so
+        subclasses that take configuration, or that rely on some
+        external tool, should add that configuration and the tool's
+        version in here.
+        """
+        return self.__class__.__name__
+
+    def directory_fingerprint(self, directory):
+        """Return a string that changes whenever config in directory does.
+
+        Like config_fingerprint(), but for configuration that depends
+        on where the file being linted is, such as eslint's .eslintrc
+        files in the file's directory and the ones above it.
+        directory is an absolute path.  The lint-result cache calls
+        this once per directory per run.
+        """
+        return ''
+
+    def process_files(self, files, cache=None, pool=None, source=None,
+                      formatter=None):
+        """Report lint errors for a list of filenames and return error count.
+
+        If cache is not None, it is a lint_cache.LintCache; we use it
+        to avoid re-linting files we have already linted before.
+
+        If pool is not None, it is a PoolBatch (or a
+        multiprocessing.Pool); we use it to call process() on several
+        files at once.  We still report the lint errors in the same
+        order as files.
+
+        If source is not None, it is where we get the file contents
+        from (see content_source.py); otherwise we read from disk.
+
+        formatter is what we report the lint errors to (see
+        lint_result.py); by default we print them as text.
+        """
+        if source is None:
+            source = content_source.WorkingTreeSource()
+        if formatter is None:
+            formatter = lint_result.TextFormatter()
+        if pool is not None and len(files) > 1:
+            return self._start_processing_files_in_pool(
+                files, cache, pool, source, formatter)()
+
         num_errors = 0
         for f in files:
             try:
-                contents = open(f, 'U').read()
+                try:
+                    contents = source.get(f)
+                except (IOError, OSError), why:
+                    formatter.note("SKIPPING lint of %s: %s"
+                                   % (f, why.args[1]))
+                    num_errors += 1
+                    continue
+                errors = _cached_errors(cache, self, f, contents)
+                if errors is None:
+                    with lint_profile.phase('check', self.__class__.__name__,
+                                            f):
+                        errors = _process_and_cache(cache, self, f, contents,
+                                                    self.process, f, contents)
+            finally:
+                source.release(f)
+            num_errors += formatter.report(errors)
+        return num_errors
+
+    def start_process_files(self, files, cache=None, pool=None,
+                            source=None, jobs=1, formatter=None):
+        """Start linting files, in the background if possible.
+
+        Returns a function that takes no arguments.  Calling it waits
+        for the linting to finish, reports the lint errors, and returns
+        their count, just like process_files().  Linters that run an
+        external program start it here, so it can run while we do
+        other work.  For linters that do their work in-process there
+        is nothing to start; it all happens when the function is called.
+
+        jobs is how many copies of the external program we may run
+        at once.  (In-process linters use pool instead.  They add
+        their files to it here, so that when several linters lint
+        the same file, it goes to a subprocess only once; see
+        PoolBatch.)
+        """
+        if pool is not None and len(files) > 1:
+            return self._start_processing_files_in_pool(
+                files, cache, pool, source, formatter)
+        return lambda: self.process_files(files, cache, None, source,
+                                          formatter)
+
+    def _start_processing_files_in_pool(self, files, cache, pool, source,
+                                        formatter):
+        """Like start_process_files(), but process() files in a pool."""
+        if not isinstance(pool, PoolBatch):
+            pool = PoolBatch(pool)
+        # We read the files here, rather than in the subprocesses, so
+        # each file is still read only once even though several
+        # linters look at it.
+        cached_errors = {}    # filename -> list of LintErrors
+        unreadable = {}       # filename -> why we couldn't read it
+        file_contents = {}    # filename -> contents, for files to lint
+        for f in files:
+            try:
+                contents = source.get(f)
             except (IOError, OSError), why:
-                print "SKIPPING lint of %s: %s" % (f, why.args[1])
-                num_errors += 1
+                unreadable[f] = why.args[1]
                 continue
-            num_errors += self.process(f, contents)
-        return num_errors
+            finally:
+                source.release(f)
+            errors = _cached_errors(cache, self, f, contents)
+            if errors is not None:
+                cached_errors[f] = errors
+            else:
+                file_contents[f] = contents
+                pool.add(self, f, contents)
+
+        def finish():
+            num_errors = 0
+            for f in files:
+                if f in unreadable:
+                    formatter.note("SKIPPING lint of %s: %s"
+                                   % (f, unreadable[f]))
+                    num_errors += 1
+                    continue
+                if f in cached_errors:
+                    errors = cached_errors[f]
+                else:
+                    errors = pool.result(self, f)
+                    if cache is not None:
+                        cache.store(self, f, file_contents[f].text, errors)
+                num_errors += formatter.report(errors)
+            return num_errors
+
+        return finish
 
     def process(self, file, contents):
-        """Lint one file given its path and contents, returning error count."""
+        """Lint one file given its path and contents.
+
+        contents is a content_source.FileContents.  Returns a list of
+        the lint_result.LintErrors found.
+        """
         raise NotImplementedError("Subclasses must override process()")
 
 
-def _capture_stdout_of(fn, *args, **kwargs):
-    """Call fn(*args, **kwargs) and return (fn_retval, fn_stdout_output_fp)."""
+class PoolBatch(object):
+    """Calls in-process linters' process() in a multiprocessing.Pool.
+
+    Several linters lint each file: pep8, pyflakes, and others all
+    lint every python file.  If we sent the file to a subprocess once
+    for each of them, each would tokenize and parse it there anew,
+    since a FileContents doesn't bring what's memoized on it along.
+    So instead we send each file to a subprocess just once, along
+    with all the linters that want to process() it, and they share
+    the one parse.
+
+    Linters add() every file they want processed before they ask for
+    the result() for any of them; main() starts all the linters
+    before finishing any.  The first result() sends everything added
+    so far to the pool.
+    """
+    def __init__(self, pool):
+        self._pool = pool
+        # filename -> (contents, [linters]), for files not yet sent
+        self._to_send = collections.OrderedDict()
+        # (filename, [linters]) for the files we've sent, in order,
+        # and the iterators we'll get their results from.
+        self._sent = collections.deque()
+        self._result_iters = collections.deque()
+        self._results = {}      # (linter, filename) -> LintErrors
+
+    def add(self, linter, f, contents):
+        """Note that linter wants to process() f, whose contents are given."""
+        self._to_send.setdefault(f, (contents, []))[1].append(linter)
+
+    def _send(self):
+        tasks = [(f, contents, linters) for (f, (contents, linters))
+                 in self._to_send.iteritems()]
+        self._to_send = collections.OrderedDict()
+        # Give each subprocess several files at a time, to cut down
+        # on communication overhead, but keep the chunks small enough
+        # that the work is still evenly spread on a many-core machine.
+        chunksize = max(1, min(8, len(tasks) // 64))
+        self._sent.extend((f, linters) for (f, _, linters) in tasks)
+        self._result_iters.append(
+            self._pool.imap(_process_in_subprocess, tasks, chunksize))
+
+    def _receive(self):
+        """Wait for the results for the next file we sent."""
+        while True:
+            try:
+                (results, timings) = self._result_iters[0].next()
+                break
+            except StopIteration:
+                self._result_iters.popleft()
+        lint_profile.add_subprocess_timings(timings)
+        (f, linters) = self._sent.popleft()
+        for (linter, errors) in zip(linters, results):
+            self._results[(linter, f)] = errors
+
+    def result(self, linter, f):
+        """Return the LintErrors linter.process() found in f.
+
+        If process() raised an exception, so do we.
+        """
+        key = (linter, f)
+        if key not in self._results and self._to_send:
+            self._send()
+        with lint_profile.phase('pool wait', linter.__class__.__name__):
+            while key not in self._results:
+                self._receive()
+        errors = self._results.pop(key)
+        if isinstance(errors, Exception):
+            raise errors
+        return errors
+
+
+def _process_in_subprocess(task):
+    """Call process() on a file for several linters; for PoolBatch.
+
+    The input is a triple (filename, contents, linters), where
+    contents is a content_source.FileContents.  Returns a pair: a
+    list with the LintErrors each linter found (or the exception it
+    raised), and the lint_profile timings for them (None if we're not
+    profiling).
+    """
+    (f, contents, linters) = task
+    results = []
+    for linter in linters:
+        try:
+            with lint_profile.phase('check', linter.__class__.__name__, f):
+                results.append(linter.process(f, contents))
+        except Exception, why:
+            results.append(why)
+    return (results, lint_profile.take_subprocess_timings())
+
+
+def _cached_errors(cache, linter, f, contents):
+    """Return linter's lint errors for f from the cache, or None if absent."""
+    if cache is None:
+        return None
+    with lint_profile.phase('cache', linter.__class__.__name__, f):
+        return cache.lookup(linter, f, contents.text)
+
+
+def _process_and_cache(cache, linter, f, contents, process_fn, *args):
+    """Call process_fn(*args), storing the lint errors it returns.
+
+    Returns the return value of process_fn, which should be a list of
+    the lint errors it found in f.
+    """
+    errors = process_fn(*args)
+    if cache is not None:
+        with lint_profile.phase('cache', linter.__class__.__name__, f):
+            cache.store(linter, f, contents.text, errors)
+    return errors
+
+
+def _node_package_version(package_name):
+    """Return the version of our vendored copy of the given node package."""
+    package_json = os.path.join(_CWD, 'node_modules', package_name,
+                                'package.json')
     try:
-        orig_stdout = sys.stdout
-        sys.stdout = cStringIO.StringIO()
-        retval = fn(*args, **kwargs)
-        sys.stdout.reset()    # so new read()/readlines() calls will return
-        return (retval, sys.stdout)
-    finally:
-        sys.stdout = orig_stdout
+        with open(package_json) as f:
+            return json.load(f).get('version', '')
+    except (IOError, OSError, ValueError):
+        return ''
+
+
+# We don't bother starting another copy of a batch linter for fewer
+# files than this; starting node takes about as long as linting them.
+_MIN_FILES_PER_SHARD = 16
+
+# The most bytes of filenames we put on one command line.  ARG_MAX is
+# at least 128K on every system we care about; this leaves plenty of
+# room for the environment, which counts against the same limit.
+_MAX_ARGV_BYTES = 64 * 1024
+
+
+def _shard_files(files, num_shards):
+    """Split files into num_shards lists, with about equal bytes in each.
+
+    Linting time is roughly proportional to file size, so we balance
+    the shards by that rather than by number of files: we hand out
+    the biggest files first, each to the shard with the fewest bytes
+    so far.  Each shard is sorted, and empty shards are omitted.
+    """
+    def size(f):
+        try:
+            return os.path.getsize(f)
+        except (IOError, OSError):
+            return 0
+
+    shards = [(0, i, []) for i in xrange(num_shards)]    # a heap
+    for f in sorted(files, key=size, reverse=True):
+        (shard_size, i, shard_files) = heapq.heappop(shards)
+        shard_files.append(f)
+        heapq.heappush(shards, (shard_size + size(f), i, shard_files))
+    return [sorted(shard_files) for (_, _, shard_files) in sorted(shards)
+            if shard_files]
+
+
+def _argv_safe_chunks(files):
+    """Split files into lists that each fit on a command line."""
+    chunk = []
+    chunk_bytes = 0
+    for f in files:
+        if chunk and chunk_bytes + len(f) + 1 > _MAX_ARGV_BYTES:
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(f)
+        chunk_bytes += len(f) + 1
+    if chunk:
+        yield chunk
+
+
+def _lint_files_in_shards(linter, files, jobs, source):
+    """Start calling linter.lint_files() on files, running up to jobs at once.
+
+    Returns an iterator over the (filename, lint_errors) pairs that
+    the lint_files() calls yield, in the order they yield them.  The
+    calls run in background threads, so they are under way before
+    the caller starts iterating.  No call is given more files than
+    fit on a command line.
+    """
+    linter_name = linter.__class__.__name__
+    results = Queue.Queue()
+    shard_done = object()      # what a shard puts on results when it's done
+
+    def lint_shard(shard):
+        try:
+            with lint_profile.phase('subprocess', linter_name):
+                for chunk in _argv_safe_chunks(shard):
+                    for file_and_errors in linter.lint_files(chunk, source):
+                        results.put(file_and_errors)
+        finally:
+            results.put(shard_done)
+
+    num_shards = max(1, min(jobs, len(files) // _MIN_FILES_PER_SHARD))
+    shard_calls = [lint_util.BackgroundCall(lint_shard, shard)
+                   for shard in _shard_files(files, num_shards)]
+
+    def iter_results():
+        num_running = len(shard_calls)
+        while num_running:
+            with lint_profile.phase('subprocess wait', linter_name):
+                try:
+                    # We use a timeout because in python2 a plain
+                    # get() can't be interrupted by control-C.
+                    result = results.get(True, 60)
+                except Queue.Empty:
+                    continue
+            if result is shard_done:
+                num_running -= 1
+            else:
+                yield result
+        for shard_call in shard_calls:
+            shard_call.result()      # to re-raise any exception
+    return iter_results()
+
+
+def _start_processing_files_in_batch(linter, files, cache, source, jobs,
+                                     formatter):
+    """Implementation of start_process_files() for batch linters.
+
+    Batch linters are those that have a lint_files() method, which
+    runs an external tool over a list of files and returns the lint
+    errors it found.  We then call process() on each file that the
+    tool complained about, to filter its output.  When we have a
+    cache, we only give the external tool those files that are not
+    already in the cache.
+
+    We run lint_files() in background threads, several at once if
+    jobs > 1 and there are enough files to make it worthwhile.  The
+    function we return does the process()-ing, and reports the errors
+    in each file, as soon as lint_files() is done with the file.
+    """
+    if source is None:
+        source = content_source.WorkingTreeSource()
+    if formatter is None:
+        formatter = lint_result.TextFormatter()
+
+    # We report the cached errors when we're finished, not now, so
+    # that our errors come out after those of the linters finished
+    # before us.
+    cached_errors = []    # a list of LintErrors for each cached file
+    files_to_lint = []
+    for filename in files:
+        if cache is not None:
+            try:
+                contents = source.get(filename)
+            except (IOError, OSError):
+                pass     # we'll complain about it below
+            else:
+                errors = _cached_errors(cache, linter, filename, contents)
+                if errors is not None:
+                    cached_errors.append(errors)
+                    source.release(filename)
+                    continue
+        files_to_lint.append(filename)
+
+    def report_cached_errors():
+        return sum(formatter.report(errors) for errors in cached_errors)
+
+    if not files_to_lint:
+        return report_cached_errors
+
+    lint_results = _lint_files_in_shards(linter, files_to_lint, jobs, source)
+
+    def process_file(filename, lint_errors):
+        """Report the errors in filename; return how many we reported."""
+        # If we're not caching, there's no need to even read files
+        # without lint errors.  If we are, we need to cache their
+        # (empty) output.
+        try:
+            if lint_errors is None and cache is None:
+                return 0
+            try:
+                contents = source.get(filename)
+            except (IOError, OSError), why:
+                formatter.note("SKIPPING lint of %s: %s"
+                               % (filename, why.args[1]))
+                return 1
+            # For batch linters, process() just filters the output.
+            with lint_profile.phase('filter', linter.__class__.__name__,
+                                    filename):
+                errors = _process_and_cache(cache, linter, filename,
+                                            contents, linter.process,
+                                            filename, contents,
+                                            lint_errors or [])
+        finally:
+            source.release(filename)
+        return formatter.report(errors)
+
+    def finish():
+        num_errors = report_cached_errors()
+        files_left = set(files_to_lint)
+        try:
+            for (filename, lint_errors) in lint_results:
+                # The linter may complain about files we didn't ask
+                # about (ones they import, say); we ignore those.
+                if filename in files_left:
+                    files_left.remove(filename)
+                    num_errors += process_file(filename, lint_errors)
+            # What's left are the files without lint errors.
+            for filename in files_to_lint:
+                if filename in files_left:
+                    files_left.remove(filename)
+                    num_errors += process_file(filename, None)
+        finally:
+            # If the linter failed, we're still done with the files
+            # it didn't get to.
+            for filename in files_left:
+                source.release(filename)
+        return num_errors
+
+    return finish
 
 
 class Pep8(Linter):
     """Linter for python.  process() processes one file."""
     def __init__(self, pep8_args, propose_arc_fixes=False):
         pep8.process_options(pep8_args + ['dummy'])
+        pep8_checker.compile_checks()
+        self._pep8_flags = [arg for arg in pep8_args if arg.startswith('-')]
         self._propose_arc_fixes = propose_arc_fixes
 
-    def _munge_output_line(self, line):
-        """Modify the line to have the canonical form for lint lines."""
-        # Canonical form: <file>:<line>[:<col>]: <E|W><code> <msg>
-        # Pep8 already has that form, so we're good.  We only need to
-        # strip the trailing newline.
-        return line.rstrip()
+    def config_fingerprint(self):
+        return '%s pep8=%s flags=%s arc=%s' % (
+            self.__class__.__name__, pep8.__version__,
+            ' '.join(sorted(self._pep8_flags)), self._propose_arc_fixes)
 
-    def _maybe_add_arc_fix(self, lintline, bad_line):
+    def _maybe_add_arc_fix(self, error, bad_line):
         """Optionally add a patch for arc lint to use for autofixing."""
         if not self._propose_arc_fixes:
-            return lintline
-
-        errcode = lintline.split(' ')[1]
+            return error
 
         # expected 2 blank lines, found 1
-        if errcode == 'E302':
-            return lint_util.add_arc_fix_str(lintline, bad_line, '', '\n')
+        if error.code == 'E302':
+            return lint_util.add_arc_fix(error, bad_line, '', '\n')
 
         # at least two spaces before inline comment
-        if errcode == 'E261':
-            return lint_util.add_arc_fix_str(lintline, bad_line, '', ' ')
+        if error.code == 'E261':
+            return lint_util.add_arc_fix(error, bad_line, '', ' ')
 
-        return lintline
+        return error
 
-    def _process_one_line(self, output_line, contents_lines):
-        """If line is an 'error', print it and return 1.  Else return 0.
+    def _process_one_error(self, error, contents_lines, lines_index):
+        """Return the error, or None if it's not actually an error for us.
 
-        pep8 prints all errors to stdout.  But we want to ignore some
-        'errors' that are ok for us but cannot be suppressed via pep8
-        flags, such as lines marked with @Nolint.  To do this, we
-        intercept stdin and remove these lines.
+        pep8 finds some 'errors' that are ok for us but cannot be
+        suppressed via pep8 flags, such as lines marked with @Nolint.
+        We filter those out here.
 
         Arguments:
-           output_line: one line of the pep8 error-output
+           error: one lint_result.LintError that pep8 found
            contents_lines: the contents of the file being linted,
               as a list of lines.
+           lines_index: the line_index.LineIndex for the file.
 
         Returns:
-           1 (indicating one error) if we print the error line, 0 else.
+           The error (perhaps with an arc fix added), or None.
         """
-        # Get the lint message to a canonical format so we can parse it.
-        lintline = self._munge_output_line(output_line)
+        bad_linenum = error.linenum                    # first line is '1'
 
-        bad_linenum = int(lintline.split(':', 2)[1])   # first line is '1'
-        bad_line = contents_lines[bad_linenum - 1]     # convert to 0-index
-
-        if '@Nolint' in bad_line:
-            return 0
+        if lines_index.has_nolint(bad_linenum):
+            return None
 
         # We allow lines to be arbitrarily long if they are urls,
         # since splitting urls at 80 columns can be annoying.
-        if ('E501 line too long' in lintline and
-            ('http://' in bad_line or 'https://' in bad_line)):
-            return 0
+        if error.code == 'E501' and lines_index.has_url(bad_linenum):
+            return None
+
+        bad_line = contents_lines[bad_linenum - 1]     # convert to 0-index
 
         # We sometimes embed json in docstrings (as documentation of
         # command output), and don't want to have to do weird
@@ -125,158 +571,169 @@ class Pep8(Linter):
         # and ends with a ".  (The end-check is kosher because only
         # strings can be really long in our use-case.)  If that check
         # passes, we do a simple syntax-check that we're in a
-        # docstring: going up until we see a line with a """, the line
-        # above it starts with 'def' or 'class' (we do some simple
-        # checking for multi-line def's).  This can be fooled, but
-        # should work well enough.
-        if ('E501 line too long' in lintline and
+        # docstring; see LineIndex.in_def_docstring().
+        if (error.code == 'E501' and
                 bad_line.lstrip().startswith('"') and
                 bad_line.rstrip(',\n').endswith('"') and
-                bad_linenum):
-            linenum = 0           # in case the xrange() below is empty
-            for linenum in xrange(bad_linenum - 1, 0, -1):
-                if (contents_lines[linenum].lstrip().startswith('"""') or
-                    contents_lines[linenum].lstrip().startswith("'''")):
-                    break
-            # Now check that the line before the """ is a def or class.
-            # Since def's (and classes) can be multiple lines long, we
-            # may have to check backwards a few lines.  We basically look
-            # at previous lines until we reach a line that starts with
-            # def or class (good), a line with a """ (bad, it means the
-            # """ above was ending a docstring, not starting one) or a
-            # blank line (bad, it means the """ is in some random place).
-            for prev_linenum in xrange(linenum - 1, -1, -1):
-                prev = contents_lines[prev_linenum].strip()
-                if (not prev or
-                    prev.startswith('"""') or prev.startswith("'''")):
-                    break
-                if prev.startswith('def ') or prev.startswith('class '):
-                    return 0
+                bad_linenum and
+                lines_index.in_def_docstring(bad_linenum)):
+            return None
 
         # OK, looks like it's a legitimate error.
-        print self._maybe_add_arc_fix(lintline, bad_line)
-        return 1
+        return self._maybe_add_arc_fix(error, bad_line)
 
     def process(self, f, contents_of_f):
-        contents_lines = contents_of_f.splitlines(True)
-
-        (num_candidate_errors, pep8_stdout) = _capture_stdout_of(
-            pep8.Checker(f, lines=contents_lines).check_all)
-
-        # Go through the output and remove the 'actually ok' lines.
-        if num_candidate_errors == 0:
-            return 0
-
-        num_errors = 0
-        for output_line in pep8_stdout.readlines():
-            num_errors += self._process_one_line(output_line,
-                                                 contents_lines)
-        return num_errors
-
-
-class Pyflakes(Linter):
-    """Linter for python.  process() processes one file."""
-    def __init__(self, propose_arc_fixes=False):
-        self._propose_arc_fixes = propose_arc_fixes
-
-    def _munge_output_line(self, line):
-        """Modify the line to have the canonical form for lint lines."""
-        # Canonical form: <file>:<line>[:<col>]: <E|W><code> <msg>
-        # pyflakes just needs to add the "E<code>" or "W<code>".  For
-        # now we only use E, since everything we print is an error.
-        # pyflakes doesn't have an error code, so we just use
-        # 'pyflakes'.  We also strip the trailing newline.
-        (file, line, error) = line.rstrip().split(':')
-        return '%s:%s:1: E=pyflakes=%s' % (file, line, error)
-
-    def _maybe_add_arc_fix(self, lintline, bad_line):
-        """Optionally add a patch for arc lint to use for autofixing."""
-        if not self._propose_arc_fixes:
-            return lintline
-
-        if 'imported but unused' in lintline:
-            return lint_util.add_arc_fix_str(lintline, bad_line,
-                                             bad_line + '\n', '')
-
-        return lintline
-
-    def _process_one_line(self, output_line, contents_lines):
-        """If line is an 'error', print it and return 1.  Else return 0.
-
-        pyflakes prints all errors to stdout.  But we want to ignore
-        some 'errors' that are ok for us: code like
-          try:
-             import unittest2 as unittest
-          except ImportError:
-             import unittest
-        To do this, we intercept stdin and remove these lines.
-
-        Arguments:
-           output_line: one line of the pyflakes error-output
-           contents_lines: the contents of the file being linted,
-              as a list of lines.
-
-        Returns:
-           1 (indicating one error) if we print the error line, 0 else.
-        """
+        parse = python_parse.parse(contents_of_f)
+        if parse.tokenize_error:
+            # The Pyflakes linter reports this as a syntax error; we
+            # don't need to report it twice.
+            return []
+
+        contents_lines = contents_of_f.lines_keepends
+        checker = pep8_checker.Checker(f, contents_lines, parse.tokens)
+        checker.check_all()
+
+        # Go through the errors and remove the 'actually ok' ones.
+        with lint_profile.phase('filter'):
+            lines_index = line_index.get(contents_of_f)
+            errors = (self._process_one_error(error, contents_lines,
+                                              lines_index)
+                      for error in checker.errors)
+            return [error for error in errors if error is not None]
+
+
+def _unused_by_convention(name):
+    """True if python convention says it's ok for name to be unused."""
+    return name == '_' or name.startswith('unused_')
+
+
+class _PyflakesReporter(pyflakes_reporter.Reporter):
+    """Turns the pyflakes messages about one file into LintErrors.
+
+    pyflakes complains about some things that are ok for us: code
+    like
+      try:
+         import unittest2 as unittest
+      except ImportError:
+         import unittest
+    We filter those out here, looking at the message objects
+    themselves, so we don't spend time formatting the many messages
+    we're going to throw away.  _PyflakesChecker asks us about each
+    message before it even makes it (see is_suppressed()); we look at
+    the line each remaining message is on in flake().
+
+    The LintErrors are in self.errors, in the order pyflakes found
+    them.
+    """
+    # The messages we never report, and the ones we don't report if
+    # the name they're about is unused by convention.  The values are
+    # functions that take the message's arguments (not including its
+    # location), and return True if we should drop it.
+    _SUPPRESSED_MESSAGES = {
         # The 'try/except ImportError' example described above.
-        if 'redefinition of unused' in output_line:
-            return 0
-
+        pyflakes_messages.RedefinedWhileUnused: lambda name, orig_loc: True,
         # We follow python convention of allowing an unused variable
         # if it's named '_' or starts with 'unused_'.
-        if ('assigned to but never used' in output_line and
-            ("local variable '_'" in output_line or
-             "local variable 'unused_" in output_line)):
-            return 0
-
+        pyflakes_messages.UnusedVariable: _unused_by_convention,
         # It's OK to redefine variables that are unused by convention.
-        if ("list comprehension redefines '_'" in output_line or
-            "list comprehension redefines 'unused_" in output_line):
-            return 0
+        pyflakes_messages.RedefinedInListComp: (
+            lambda name, orig_loc: _unused_by_convention(name)),
+        # 'from foo import *' used; unable to detect undefined names.
+        pyflakes_messages.ImportStarUsed: lambda modname: True,
+    }
+
+    def __init__(self, filename, contents, propose_arc_fixes):
+        """contents is the content_source.FileContents of filename."""
+        super(_PyflakesReporter, self).__init__(sys.stdout, sys.stderr)
+        self._filename = filename
+        self._contents_lines = contents.lines
+        self._lines_index = line_index.get(contents)
+        self._propose_arc_fixes = propose_arc_fixes
+        self.errors = []
 
-        # Get rid of some warnings too.
-        if 'unable to detect undefined names' in output_line:
-            return 0
+    def is_suppressed(self, message_class, message_args):
+        """True if we'd drop a message_class made with message_args.
 
-        # -- The next set of warnings need to look at the error line.
-        # Get the lint message to a canonical format so we can parse it.
-        lintline = self._munge_output_line(output_line)
+        message_args are the arguments to message_class's constructor
+        after its location.
+        """
+        is_suppressed = self._SUPPRESSED_MESSAGES.get(message_class)
+        return is_suppressed is not None and is_suppressed(*message_args)
 
-        bad_linenum = int(lintline.split(':', 2)[1])   # first line is '1'
-        bad_line = contents_lines[bad_linenum - 1]     # convert to 0-index
+    def syntaxError(self, filename, msg, lineno, offset, text):
+        """Record a syntax error; text (the bad code) may be None."""
+        self.errors.append(lint_result.LintError(
+            filename, lineno, offset or 1, 'E=pyflakes=', msg))
 
+    def flake(self, message):
+        """Record a LintError for message, unless its line says not to."""
         # If the line has a nolint directive, ignore it.
-        if '@Nolint' in bad_line:
-            return 0
+        if self._lines_index.has_nolint(message.lineno):
+            return
+
+        bad_line = self._contents_lines[message.lineno - 1]
 
         # An old nolint directive that's specific to imports
-        if ('@UnusedImport' in bad_line and
-            'imported but unused' in lintline):
-            return 0
+        is_unused_import = isinstance(message, pyflakes_messages.UnusedImport)
+        if is_unused_import and '@UnusedImport' in bad_line:
+            return
+
+        # OK, looks like it's a legitimate error.  pyflakes doesn't
+        # have error codes, so we just use 'pyflakes'; and we say
+        # everything is an error (E), not a warning.
+        error = lint_result.LintError(
+            self._filename, message.lineno, 1, 'E=pyflakes=',
+            message.message % message.message_args)
+        # Optionally add a patch for arc lint to use for autofixing.
+        if self._propose_arc_fixes and is_unused_import:
+            error = lint_util.add_arc_fix(error, bad_line, bad_line + '\n', '')
+        self.errors.append(error)
+
+
+class _PyflakesChecker(pyflakes_checker.Checker):
+    """A pyflakes checker that gives its messages to a _PyflakesReporter.
+
+    Messages the reporter would drop anyway are never even made.
+    pyflakes checks the tree as soon as it's constructed, so all the
+    messages have been reported by the time the constructor returns.
+    """
+    def __init__(self, tree, filename, reporter):
+        self._reporter = reporter
+        super(_PyflakesChecker, self).__init__(tree, filename)
 
-        # OK, looks like it's a legitimate error.
-        print self._maybe_add_arc_fix(lintline, bad_line)
-        return 1
+    def report(self, messageClass, *args, **kwargs):
+        # args[0] is the message's location.
+        if not self._reporter.is_suppressed(messageClass, args[1:]):
+            self._reporter.flake(messageClass(self.filename, *args, **kwargs))
 
-    def process(self, f, contents_of_f):
-        # pyflakes's ast-parser fails if the file doesn't end in a newline,
-        # so make sure it does.
-        if not contents_of_f.endswith('\n'):
-            contents_of_f += '\n'
-        (num_candidate_errors, pyflakes_stdout) = _capture_stdout_of(
-            pyflakes.check, contents_of_f, f)
-
-        # Now go through the output and remove the 'actually ok' lines.
-        if num_candidate_errors == 0:
-            return 0
 
-        num_errors = 0
-        contents_lines = contents_of_f.splitlines()  # need these for filtering
-        for output_line in pyflakes_stdout.readlines():
-            num_errors += self._process_one_line(output_line,
-                                                 contents_lines)
-        return num_errors
+class Pyflakes(Linter):
+    """Linter for python.  process() processes one file."""
+    def __init__(self, propose_arc_fixes=False):
+        self._propose_arc_fixes = propose_arc_fixes
+
+    def config_fingerprint(self):
+        return '%s pyflakes=%s arc=%s' % (
+            self.__class__.__name__, _PYFLAKES_VERSION,
+            self._propose_arc_fixes)
+
+    def process(self, f, contents_of_f):
+        reporter = _PyflakesReporter(f, contents_of_f,
+                                     self._propose_arc_fixes)
+        parse = python_parse.parse(contents_of_f)
+        if parse.syntax_error:
+            # We're the linter that reports syntax errors for python files.
+            (linenum, colnum, msg) = parse.syntax_error
+            reporter.syntaxError(f, msg, linenum, colnum, None)
+            return reporter.errors
+
+        # This is what pyflakes.check() does, but using our parse, and
+        # our reporter, which drops the 'actually ok' messages as
+        # pyflakes finds them.
+        _PyflakesChecker(parse.tree, f, reporter)
+        with lint_profile.phase('filter'):
+            reporter.errors.sort(key=lambda error: error.linenum)
+        return reporter.errors
 
 
 class CustomPythonLinter(Linter):
@@ -292,19 +749,18 @@ class CustomPythonLinter(Linter):
                 'super(self.__class__' in line)    # @Nolint
 
     def process(self, f, contents_of_f):
-        num_errors = 0
-        for (linenum_minus_1, line) in enumerate(contents_of_f.splitlines()):
+        errors = []
+        for (linenum_minus_1, line) in enumerate(contents_of_f.lines):
             if '@Nolint' in line:
                 continue
 
             if self._bad_super(line):
-                # Canonical form: <file>:<line>[:<col>]: <E|W><code> <msg>
-                print ('%s:%s: E999 first argument to super() must be '
-                       'an explicit classname, not type(self)'
-                       % (f, linenum_minus_1 + 1))
-                num_errors += 1
+                errors.append(lint_result.LintError(
+                    f, linenum_minus_1 + 1, None, 'E999',
+                    'first argument to super() must be an explicit '
+                    'classname, not type(self)'))
 
-        return num_errors
+        return errors
 
 
 class Git(Linter):
@@ -325,16 +781,131 @@ class Git(Linter):
         # Ignore files that git thinks are binary; those don't ever
         # get merge conflict markers.  This is how we check, sez
         # http://stackoverflow.com/questions/6119956/how-to-determine-if-git-handles-a-file-as-binary-or-as-text:
-        if '\0' in contents_of_f[:8000]:
-            return 0      # a binary file
+        text = contents_of_f.text
+        if '\0' in text[:8000]:
+            return []     # a binary file
 
-        num_errors = 0
-        for m in self._MARKERS_RE.finditer(contents_of_f):
-            linenum = contents_of_f.count('\n', 0, m.start()) + 1
-            print ('%s:%s:1: E1 git conflict marker "%s" found'
-                   % (f, linenum, m.group(1)))
-            num_errors += 1
-        return num_errors
+        errors = []
+        for m in self._MARKERS_RE.finditer(text):
+            linenum = text.count('\n', 0, m.start()) + 1
+            errors.append(lint_result.LintError(
+                f, linenum, 1, 'E1',
+                'git conflict marker "%s" found' % m.group(1)))
+        return errors
+
+
+class _EslintWorker(object):
+    """A running eslint_worker.js, which lints javascript files on request.
+
+    Starting node, and having eslint load all its plugins, takes
+    longer than linting a few files does.  The worker only does that
+    once, so when we lint many times in one process (as the lint
+    server in lint_daemon.py does), we only pay for it once.
+
+    fingerprint identifies the eslint setup (node packages, eslintrc
+    files) the worker started with; see _acquire_eslint_worker().
+    """
+    def __init__(self, node_path, fingerprint):
+        self.node_path = node_path
+        self.fingerprint = fingerprint
+        env = os.environ.copy()
+        env['NODE_PATH'] = node_path
+        # We only look at the worker's stderr if it dies.  (We don't
+        # use a pipe, since nobody would be reading from it.)
+        self._stderr = tempfile.TemporaryFile()
+        self.eslint_stderr = None
+        self._process = subprocess.Popen(
+            ['node', os.path.join(_CWD, 'eslint_worker.js')],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self._stderr,
+            close_fds=True,       # since other threads may be forking too
+            env=env)
+
+    def is_alive(self):
+        return self._process.poll() is None
+
+    def _read_response(self):
+        try:
+            response = self._process.stdout.readline()
+        except (IOError, OSError):
+            response = ''
+        if not response:
+            self._stderr.seek(0)
+            raise RuntimeError("The eslint worker died:\n%s"
+                               % self._stderr.read())
+        return json.loads(response)
+
+    def lint(self, config_path, files, texts=None):
+        """Lint files using config_path; yield the errors eslint finds.
+
+        If texts is not None, it holds the contents of each file in
+        files, which eslint lints rather than reading the files.
+
+        Yields lists of the lint_result.LintErrors in the files (with
+        absolute filenames), in order, as eslint lints them; all the
+        errors in any one file are in the same list.  Once we're done,
+        self.eslint_stderr is what eslint itself printed as warnings.
+        Raises RuntimeError if the worker could not lint the files.
+        If that happens, or the caller stops before we're done, the
+        worker should not be used again.
+        """
+        request = {'config': config_path, 'cwd': os.getcwd(), 'files': files}
+        if texts is not None:
+            request['texts'] = texts
+        self.eslint_stderr = None
+        try:
+            self._process.stdin.write(json.dumps(request) + '\n')
+            self._process.stdin.flush()
+        except (IOError, OSError):
+            pass       # _read_response() will tell us what went wrong
+        while True:
+            response = self._read_response()
+            if 'error' in response:
+                raise RuntimeError("Unexpected error from linter:\n%s"
+                                   % response['error'])
+            if response.get('done'):
+                self.eslint_stderr = response['stderr'].encode('utf-8')
+                return
+            yield [lint_result.LintError.from_list(error)
+                   for error in response['errors']]
+
+    def stop(self):
+        """Tell the worker to exit (by closing its input)."""
+        try:
+            self._process.stdin.close()
+        except (IOError, OSError):
+            pass
+        self._stderr.close()
+
+
+# Map from NODE_PATH to the workers with that NODE_PATH not in use.
+_IDLE_ESLINT_WORKERS = {}
+_ESLINT_WORKERS_LOCK = threading.Lock()
+
+
+def _acquire_eslint_worker(node_path, fingerprint):
+    """Return an _EslintWorker for our exclusive use until it's released.
+
+    We reuse an idle worker if we can.  But if the eslint setup has
+    changed since a worker started -- someone edited an eslintrc file,
+    or updated node_modules -- its view of the world is out of date,
+    so we stop it rather than using it.
+    """
+    with _ESLINT_WORKERS_LOCK:
+        idle_workers = _IDLE_ESLINT_WORKERS.setdefault(node_path, [])
+        while idle_workers:
+            worker = idle_workers.pop()
+            if worker.fingerprint == fingerprint and worker.is_alive():
+                return worker
+            worker.stop()
+    return _EslintWorker(node_path, fingerprint)
+
+
+def _release_eslint_worker(worker):
+    """Let others use a worker from _acquire_eslint_worker()."""
+    with _ESLINT_WORKERS_LOCK:
+        _IDLE_ESLINT_WORKERS.setdefault(worker.node_path, []).append(worker)
 
 
 class Eslint(Linter):
@@ -343,48 +914,131 @@ class Eslint(Linter):
     Arguments:
         config_path: the path of the eslintrc file
     """
+    runs_in_subprocess = True
+
+    # The node packages whose versions affect eslint's output.
+    _NODE_PACKAGES = ('eslint', 'babel-eslint', 'eslint-plugin-react',
+                      'eslint-plugin-flowtype')
+
+    _EXTENDS_RE = re.compile(r'"extends"\s*:\s*(\[[^\]]*\]|"[^"]*")')
+
+    # The files eslint looks for config in, in each directory.  (It
+    # also looks at the "eslintConfig" field of package.json.)
+    _CASCADED_CONFIG_FILES = ('.eslintrc.js', '.eslintrc.yaml',
+                              '.eslintrc.yml', '.eslintrc.json', '.eslintrc')
+
     def __init__(self, config_path, propose_arc_fixes=False):
         self._config_path = config_path
         self._propose_arc_fixes = propose_arc_fixes
 
-    def _maybe_add_arc_fix(self, lintline, bad_line):
+    def _config_chain_contents(self, config_path, seen):
+        """Return the contents of config_path and every file it extends.
+
+        We only follow 'extends' entries that are paths; the other
+        kind (like 'eslint:recommended') are built into eslint and
+        its plugins, so they are covered by their version numbers.
+        """
+        if config_path in seen:
+            return []
+        seen.add(config_path)
+        try:
+            with open(config_path) as f:
+                contents = f.read()
+        except (IOError, OSError):
+            return ['']
+        retval = [contents]
+        for m in self._EXTENDS_RE.finditer(contents):
+            for extends in re.findall(r'"([^"]*)"', m.group(1)):
+                if extends.startswith(('.', '/')):
+                    extends_path = os.path.join(
+                        os.path.dirname(config_path), extends)
+                    retval.extend(self._config_chain_contents(
+                        os.path.normpath(extends_path), seen))
+        return retval
+
+    def _setup_fingerprint(self):
+        """A string that changes whenever our eslint setup does."""
+        versions = ['%s=%s' % (p, _node_package_version(p))
+                    for p in self._NODE_PACKAGES]
+        return '\0'.join([' '.join(versions)] +
+                          self._config_chain_contents(self._config_path,
+                                                      set()))
+
+    def config_fingerprint(self):
+        # eslint also skips the files listed in the .eslintignore in
+        # its cwd, which is ours.
+        try:
+            with open('.eslintignore') as f:
+                eslintignore = f.read()
+        except (IOError, OSError):
+            eslintignore = ''
+        return '%s arc=%s %s\0%s' % (self.__class__.__name__,
+                                     self._propose_arc_fixes,
+                                     self._setup_fingerprint(),
+                                     eslintignore)
+
+    def directory_fingerprint(self, directory):
+        # Besides our config, eslint uses the config files in the
+        # linted file's directory and every directory above it (until
+        # one says it's the root, but we don't bother to check).
+        retval = []
+        seen = set()
+        while True:
+            for basename in self._CASCADED_CONFIG_FILES:
+                config_path = os.path.join(directory, basename)
+                if os.path.exists(config_path):
+                    retval.append(config_path)
+                    retval.extend(self._config_chain_contents(config_path,
+                                                              seen))
+            package_json = os.path.join(directory, 'package.json')
+            if os.path.exists(package_json):
+                try:
+                    with open(package_json) as f:
+                        config = json.load(f).get('eslintConfig')
+                except (IOError, OSError, ValueError, AttributeError):
+                    config = None
+                if config is not None:
+                    retval.append(package_json)
+                    retval.append(json.dumps(config, sort_keys=True))
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return '\0'.join(retval)
+            directory = parent
+
+    def _maybe_add_arc_fix(self, error, bad_line):
         """Optionally add a patch for arc lint to use for autofixing."""
         if not self._propose_arc_fixes:
-            return lintline
+            return error
 
-        (file_line_col, errcode, msg) = lintline.split(' ', 2)
+        (errcode, msg) = (error.code, error.message)
 
         if errcode == 'Esemi':
-            return lint_util.add_arc_fix_str(lintline, bad_line, '', ';')
+            return lint_util.add_arc_fix(error, bad_line, '', ';')
         if errcode == 'Eno-extra-semi':
-            return lint_util.add_arc_fix_str(lintline, bad_line, ';', '')
+            return lint_util.add_arc_fix(error, bad_line, ';', '')
         if errcode == 'Ecomma-dangle':
-            return lint_util.add_arc_fix_str(lintline, bad_line, '', ',')
+            return lint_util.add_arc_fix(error, bad_line, '', ',')
         if errcode == 'Ecomma-spacing':
-            return lint_util.add_arc_fix_str(lintline, bad_line, ',', ', ')
+            return lint_util.add_arc_fix(error, bad_line, ',', ', ')
         if errcode == 'Espace-before-function-paren':
-            return lint_util.add_arc_fix_str(lintline, bad_line,
-                                             re.compile(r' +'), '')
+            return lint_util.add_arc_fix(error, bad_line,
+                                         re.compile(r' +'), '')
         if errcode == 'Eprefer-const':
-            return lint_util.add_arc_fix_str(lintline, bad_line,
-                                             'let', 'const',
-                                             search_backwards=True)
+            return lint_util.add_arc_fix(error, bad_line, 'let', 'const',
+                                         search_backwards=True)
 
         if errcode == 'Ereact/jsx-closing-bracket-location':
-            try:
-                col = file_line_col.split(':')[2]
-            except IndexError:
-                col = None
+            col = error.colnum
             m = re.search(r'\(expected column (\d+)\)', msg)
 
             if col is not None and m is not None:
-                spaces_to_add = int(m.group(1)) - int(col)
+                spaces_to_add = int(m.group(1)) - col
                 if spaces_to_add > 0:
-                    return lint_util.add_arc_fix_str(
-                        lintline, bad_line, '', ' ' * spaces_to_add)
+                    return lint_util.add_arc_fix(
+                        error, bad_line, '', ' ' * spaces_to_add)
                 else:
-                    return lint_util.add_arc_fix_str(
-                        lintline, bad_line, ' ' * -spaces_to_add, '',
+                    return lint_util.add_arc_fix(
+                        error, bad_line, ' ' * -spaces_to_add, '',
                         search_backwards=True)
 
             # Also handle the case the \> should go on the next line
@@ -392,8 +1046,8 @@ class Eslint(Linter):
             if m:
                 indent = int(m.group(1)) - 1
                 if indent >= 0:
-                    return lint_util.add_arc_fix_str(
-                        lintline, bad_line, '', '\n' + ' ' * indent)
+                    return lint_util.add_arc_fix(
+                        error, bad_line, '', '\n' + ' ' * indent)
 
         if errcode == 'Eindent':
             m = re.search(r'Expected indentation of (\d+) space characters '
@@ -402,99 +1056,91 @@ class Eslint(Linter):
             if m:
                 spaces_to_add = int(m.group(1)) - int(m.group(2))
                 if spaces_to_add > 0:
-                    return lint_util.add_arc_fix_str(
-                        lintline, bad_line, '', ' ' * spaces_to_add)
+                    return lint_util.add_arc_fix(
+                        error, bad_line, '', ' ' * spaces_to_add)
                 else:
-                    return lint_util.add_arc_fix_str(
-                        lintline, bad_line, ' ' * -spaces_to_add, '',
+                    return lint_util.add_arc_fix(
+                        error, bad_line, ' ' * -spaces_to_add, '',
                         search_backwards=True)
 
         if errcode in {'Ecomputed-property-spacing', 'Earray-bracket-spacing',
                        'Eobject-curly-spacing'}:
-            search_backwards = 'space before' in lintline
-            return lint_util.add_arc_fix_str(lintline, bad_line,
-                                             re.compile(r' +'), '',
-                                             search_backwards=search_backwards)
+            search_backwards = 'space before' in msg
+            return lint_util.add_arc_fix(error, bad_line,
+                                         re.compile(r' +'), '',
+                                         search_backwards=search_backwards)
 
         if errcode == 'Espace-in-parens':
-            try:
-                col = int(file_line_col.split(':')[2]) - 2
-            except IndexError:
-                col = None
-
-            if col is not None:
-                paren = bad_line[col]
+            if error.colnum is not None:
+                paren = bad_line[error.colnum - 2]
                 search_backwards = {'(': False, ')': True}.get(paren)
 
                 if search_backwards is not None:
-                    return lint_util.add_arc_fix_str(
-                        lintline, bad_line, re.compile(r' +'), '',
+                    return lint_util.add_arc_fix(
+                        error, bad_line, re.compile(r' +'), '',
                         search_backwards=search_backwards)
 
-        return lintline
+        return error
 
-    def _process_one_line(self, filename, output_line, contents_lines):
-        """If line is an 'error', print it and return 1.  Else return 0.
+    def _process_one_error(self, filename, error, contents_lines,
+                           lines_index):
+        """Return the error, or None if it's not actually an error for us.
 
-        eslint prints all errors to stdout.  But we want to
-        ignore some 'errors' that are ok for us, in particular ones
-        that have been commented out with @Nolint.
+        We want to ignore some 'errors' that eslint finds that are ok
+        for us, in particular ones that have been commented out with
+        @Nolint.
 
         Arguments:
            filename: path to file being linted
-           output_line: one line of the eslint error-output
+           error: one lint_result.LintError that eslint found
            contents_lines: the contents of the file being linted,
               as a list of lines.
+           lines_index: the line_index.LineIndex for the file.
 
         Returns:
-           1 (indicating one error) if we print the error line, 0 else.
+           The error (perhaps with an arc fix added), or None.
         """
-        # output_line is like:
-        #   <file>:<line>:<col>: W<code> <message>
-        # which is just what we need!
-        bad_linenum = int(output_line.split(':', 2)[1])   # first line is '1'
-        bad_line = contents_lines[bad_linenum - 1]     # convert to 0-index
+        bad_linenum = error.linenum                    # first line is '1'
 
         # If the line has a nolint directive, ignore it.
-        if '@Nolint' in bad_line:
-            return 0
+        if lines_index.has_nolint(bad_linenum):
+            return None
+
+        bad_line = contents_lines[bad_linenum - 1]     # convert to 0-index
 
         # Allow long lines in fixture files, which just hold test data.
-        if (' Emax-len ' in output_line and
+        if (error.code == 'Emax-len' and
                 filename.endswith(('.fixture.js', 'fixture.jsx'))):
-            return 0
+            return None
 
-        # I don't know why it prints this.  Shrug.
-        if 'File ignored because of your .eslintignore file' in output_line:
-            return 0
+        # I don't know why it reports this.  Shrug.
+        if 'File ignored because of your .eslintignore file' in error.message:
+            return None
 
-        print self._maybe_add_arc_fix(output_line, bad_line)
-        return 1
+        return self._maybe_add_arc_fix(error, bad_line)
 
-    def process(self, f, contents_of_f, eslint_lines):
-        num_errors = 0
-        contents_lines = contents_of_f.splitlines()  # need these for filtering
-        for output_line in eslint_lines:
-            num_errors += self._process_one_line(f, output_line,
-                                                 contents_lines)
-        return num_errors
+    def process(self, f, contents_of_f, eslint_errors):
+        contents_lines = contents_of_f.lines   # need these for filtering
+        lines_index = line_index.get(contents_of_f)
+        errors = (self._process_one_error(f, error, contents_lines,
+                                          lines_index)
+                  for error in eslint_errors)
+        return [error for error in errors if error is not None]
 
-    def lint_files(self, files):
-        """Execute a linter on a list of files and return the stdout for each.
+    def lint_files(self, files, source=None):
+        """Execute a linter on a list of files and yield the errors in each.
 
         Arguments:
-            exec_path: A path to the linter's executable
             files: A list of filenames
-            extra_flags: (optional) A list of commandline flags to include in
-                         the subprocess call
+            source: where to get the files' contents from, if not disk
 
-        Returns:
-            dict of {f: stdout_lines} from filename to stdout as an array of
-            stdout lines only containing files that had output; if there are
-            no lint errors, an empty dict.
+        Yields:
+            (f, lint_errors) pairs, one for each file that eslint
+            found errors in, where lint_errors is a list of the
+            lint_result.LintErrors in it.  We yield each file as soon
+            as eslint is done with it.
         """
         exec_path = os.path.join(_CWD, 'node_modules', '.bin', 'eslint')
-        reporter_path = os.path.join(_CWD, 'eslint_reporter.js')
         assert os.path.isfile(exec_path), (
             "Vendoring error: eslint is missing from '%s'" % exec_path)
 
@@ -503,89 +1149,113 @@ class Eslint(Linter):
         # Two ways to tell:
         #    1) shebang line at the top of the file
         #    2) '"use strict";' in the file somewhere
-        subprocess_args = [exec_path, '--config', self._config_path,
-                           '-f', reporter_path, '--no-color'] + files
-
-        env = os.environ.copy()
-        if 'NODE_PATH' in env:
-            env['NODE_PATH'] += ':' + os.path.dirname(self._config_path)
+        if 'NODE_PATH' in os.environ:
+            node_path = (os.environ['NODE_PATH'] + ':' +
+                         os.path.dirname(self._config_path))
         else:
-            env['NODE_PATH'] = os.path.dirname(self._config_path)
-
-        pipe = subprocess.Popen(
-            subprocess_args,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            env=env)
-        stdout, stderr = pipe.communicate()
-
-        if stderr:
-            raise RuntimeError("Unexpected stderr from linter:\n%s" % stderr)
-
-        output = {}
-
-        # eslint_reporter specifies that errors are reported on
-        # individual lines starting with "filename:line:col".  It
-        # converts all filenames to an absolute path; we convert them
-        # back to relpaths here.
-        lint_lines = ['%s:%s' % (os.path.relpath(line.split(':', 1)[0]),
-                                 line.split(':', 1)[1])
-                      for line in stdout.splitlines()]
-        get_filename = lambda line: line.split(':', 1)[0]
-        lines = sorted(lint_lines, key=get_filename)
-        for filename, flines in itertools.groupby(lines, get_filename):
-            output[filename] = list(flines)
-
-        return output
-
-    def process_files(self, files):
-        """Lint a series of files, and self.process() each with an error."""
-        num_errors = 0
-        file_to_lint_output = self.lint_files(files)
-        for filename in files:
-            if filename in file_to_lint_output:
-                lintlines = file_to_lint_output[filename]
+            node_path = os.path.dirname(self._config_path)
+
+        # We restart the worker if node_modules changes at all, not
+        # just when one of the packages in _NODE_PACKAGES does.
+        node_modules = os.path.join(_CWD, 'node_modules')
+        fingerprint = '%s\0%s' % (os.stat(node_modules).st_mtime,
+                                   self._setup_fingerprint())
+
+        texts = None
+        if source is not None and not source.on_disk:
+            # We send eslint the contents to lint.  Files we can't
+            # read are left out; our caller complains about those.
+            readable_files = []
+            texts = []
+            for f in files:
                 try:
-                    contents = open(filename, 'U').read()
-                except (IOError, OSError), why:
-                    print "SKIPPING lint of %s: %s" % (filename, why.args[1])
-                    num_errors += 1
+                    texts.append(
+                        source.get(f).text.decode('utf-8', 'replace'))
+                except (IOError, OSError):
                     continue
-                num_errors += self.process(filename, contents, lintlines)
-        return num_errors
+                readable_files.append(f)
+            files = readable_files
+
+        # eslint converts all filenames to an absolute path; we
+        # convert them back to relpaths here, once per file.
+        relpaths = {}
+        worker = _acquire_eslint_worker(node_path, fingerprint)
+        done = False
+        try:
+            for errors in worker.lint(self._config_path, files, texts):
+                output = collections.OrderedDict()
+                for error in errors:
+                    relpath = relpaths.get(error.filename)
+                    if relpath is None:
+                        relpath = os.path.relpath(error.filename)
+                        relpaths[error.filename] = relpath
+                    output.setdefault(relpath, []).append(
+                        error._replace(filename=relpath))
+                for file_and_errors in output.iteritems():
+                    yield file_and_errors
+            done = True
+        finally:
+            if done:
+                _release_eslint_worker(worker)
+            else:
+                worker.stop()
+
+        if worker.eslint_stderr:
+            raise RuntimeError("Unexpected stderr from linter:\n%s"
+                               % worker.eslint_stderr)
+
+    def start_process_files(self, files, cache=None, pool=None,
+                            source=None, jobs=1, formatter=None):
+        """Start lint_files() in the background; see Linter.
+
+        We don't use pool: lint_files() does all the work, in
+        subprocesses of its own.
+        """
+        return _start_processing_files_in_batch(self, files, cache, source,
+                                                jobs, formatter)
+
+    def process_files(self, files, cache=None, pool=None, source=None,
+                      formatter=None):
+        """Lint a series of files, and self.process() each with an error."""
+        return self.start_process_files(files, cache, pool, source,
+                                        formatter=formatter)()
 
 
 class LessHint(Linter):
     """Linter for less."""
-    def _process_one_line(self, filename, output_line, contents_lines):
-        # output_line is like:
-        #   <file>:<line>:<col>: W<code> <message>
-        bad_linenum = int(output_line.split(':', 2)[1])   # first line is '1'
-        bad_line = contents_lines[bad_linenum - 1]     # convert to 0-index
+    runs_in_subprocess = True
 
-        # If the line has a nolint directive, ignore it.
-        if '@Nolint' in bad_line:
-            return 0
+    def config_fingerprint(self):
+        return '%s khan-lesshint=%s' % (
+            self.__class__.__name__, _node_package_version('khan-lesshint'))
 
-        print output_line
-        return 1
+    def process(self, f, contents_of_f, lesshint_errors):
+        lines_index = line_index.get(contents_of_f)
+        # If the line has a nolint directive, ignore its error.
+        return [error for error in lesshint_errors
+                if not lines_index.has_nolint(error.linenum)]
 
-    def process(self, f, contents_of_f, lesshint_lines):
-        num_errors = 0
-        contents_lines = contents_of_f.splitlines()  # need these for filtering
-        for output_line in lesshint_lines:
-            num_errors += self._process_one_line(f, output_line,
-                                                 contents_lines)
-        return num_errors
+    def lint_files(self, files, source=None):
+        """Execute a linter on a list of files and yield the errors in each.
 
-    def lint_files(self, files):
-        """Execute a linter on a list of files and return the stdout for each.
+        If source is not None and not the working tree, we lint
+        temporary copies of the files' contents from source.
 
-        Returns:
-            dict of {f: stdout_lines} from filename to stdout as an array of
-            stdout lines only containing files that had output; if there are
-            no lint errors, an empty dict.
+        Yields:
+            (f, lint_errors) pairs, one for each file that lesshint
+            found errors in, where lint_errors is a list of the
+            lint_result.LintErrors in it.  We yield each file as soon
+            as lesshint is done with it.
         """
+        if source is not None and not source.on_disk:
+            with content_source.TemporaryCopies(source, files) as copies:
+                for (f, errors) in self.lint_files(copies.filenames):
+                    original_f = copies.original_filename(f)
+                    yield (original_f,
+                           [error._replace(filename=original_f)
+                            for error in errors])
+            return
+
         exec_path = os.path.join(_CWD, 'node_modules', '.bin', 'lesshint')
         reporter_path = os.path.join(_CWD, 'lesshint_reporter.js')
         assert os.path.isfile(exec_path), (
@@ -593,41 +1263,68 @@ class LessHint(Linter):
 
         subprocess_args = [exec_path, '--reporter', reporter_path] + files
 
-        pipe = subprocess.Popen(
-            subprocess_args,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE)
-        stdout, stderr = pipe.communicate()
-
-        if stderr:
-            raise RuntimeError("Unexpected stderr from lesshint:\n%s" % stderr)
-
-        output = {}
-
-        # lesshint_reporter specifies that errors are reported on individual
-        # lines starting with "filename:line:col"
-        get_filename = lambda line: line.split(':', 1)[0]
-        lines = sorted(stdout.splitlines(), key=get_filename)
-        for filename, flines in itertools.groupby(lines, get_filename):
-            output[filename] = list(flines)
-
-        return output
+        # We read the output as lesshint writes it.  (We don't use a
+        # pipe for stderr, since nobody would be reading from it while
+        # we do, and lesshint could fill it up and hang.)
+        with tempfile.TemporaryFile() as stderr_file:
+            pipe = subprocess.Popen(
+                subprocess_args,
+                stdout=subprocess.PIPE,
+                stderr=stderr_file,
+                close_fds=True)   # since other threads may be forking too
+            try:
+                for file_and_errors in self._parse_output(pipe.stdout):
+                    yield file_and_errors
+            finally:
+                pipe.stdout.close()
+                pipe.wait()
+
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
+            if stderr:
+                raise RuntimeError("Unexpected stderr from lesshint:\n%s"
+                                   % stderr)
+
+    def _parse_output(self, stdout):
+        """Yield (f, lint_errors) for each file in lesshint's output.
+
+        lesshint_reporter prints the errors in our canonical form,
+        "<file>:<line>:<col>: <code> <msg>".  lesshint lints the files
+        one at a time, and reports all of a file's errors at once, so
+        we know we have all the errors in a file once we see an error
+        in the next one.
+        """
+        filename = None
+        errors = []
+        for line in iter(stdout.readline, ''):
+            line = line.rstrip('\n')
+            error = lint_result.parse_text(line)
+            if error is None:
+                raise RuntimeError("Unexpected output from lesshint:\n%s"
+                                   % line)
+            if error.filename != filename and errors:
+                yield (filename, errors)
+                errors = []
+            filename = error.filename
+            errors.append(error)
+        if errors:
+            yield (filename, errors)
+
+    def start_process_files(self, files, cache=None, pool=None,
+                            source=None, jobs=1, formatter=None):
+        """Start lint_files() in the background; see Linter.
+
+        We don't use pool: lint_files() does all the work, in
+        subprocesses of its own.
+        """
+        return _start_processing_files_in_batch(self, files, cache, source,
+                                                jobs, formatter)
 
-    def process_files(self, files):
+    def process_files(self, files, cache=None, pool=None, source=None,
+                      formatter=None):
         """Lint a series of files, and self.process() each with an error."""
-        num_errors = 0
-        file_to_lint_output = self.lint_files(files)
-        for filename in files:
-            if filename in file_to_lint_output:
-                lintlines = file_to_lint_output[filename]
-                try:
-                    contents = open(filename, 'U').read()
-                except (IOError, OSError), why:
-                    print "SKIPPING lint of %s: %s" % (filename, why.args[1])
-                    num_errors += 1
-                    continue
-                num_errors += self.process(filename, contents, lintlines)
-        return num_errors
+        return self.start_process_files(files, cache, pool, source,
+                                        formatter=formatter)()
 
 
 class HtmlLinter(Linter):
@@ -640,11 +1337,10 @@ class HtmlLinter(Linter):
     def process(self, f, contents_of_f):
         if ('templates' + os.sep) in f:
             # s_c_r.lint_one_file() happily ignores @Nolint lines for us.
-            errors = static_content_refs.lint_one_file(f, contents_of_f)
-            for (fname, linenum, colnum, unused_endcol, msg) in errors:
-                # Canonical form: <file>:<line>[:<col>]: <E|W><code> <msg>
-                print ('%s:%s:%s: E=static_url= %s'
-                       % (fname, linenum, colnum, msg))
-            return len(errors)
+            errors = static_content_refs.lint_one_file(f, contents_of_f.text)
+            return [lint_result.LintError(fname, linenum, colnum,
+                                          'E=static_url=', msg)
+                    for (fname, linenum, colnum, unused_endcol, msg)
+                    in errors]
         else:
-            return 0
+            return []
@@ -0,0 +1,372 @@
+"""A pep8 Checker that works from already-generated tokens.
+
+pep8.Checker.check_all() tokenizes the file itself.  We'd rather use
+the tokens from python_parse, which are shared with the other python
+linters.  The wrinkle is that pep8 runs the physical-line checks on
+each line as the tokenizer reads it, and the order matters: some
+checks depend on state (such as indent_char) that is set as lines are
+read, and errors are printed in the order they are found.
+
+The tokenizer reads line N just before it emits the first token that
+ends on line N, so that is exactly when we run the physical-line
+checks on line N.
+
+We also collect the errors as lint_result.LintErrors, rather than
+having pep8 print them.
+
+pep8 runs each check by looking up each of the check's arguments on
+the Checker by name (run_check() does a getattr() per argument), for
+every check on every line.  That dispatch costs more than most of the
+checks themselves.  So instead, once per set of pep8 options, we
+generate two functions, one to run all the physical-line checks and
+one to run all the logical-line checks, that call each check with its
+arguments directly; see _CheckPlan.
+
+Better yet, most physical-line checks only ever complain about lines
+that a regexp can find: lines that are too long, or that have a tab
+in their indentation.  So rather than running those checks on every
+line, we search the whole file for such lines up front, run the
+checks on just those, and report the errors when the tokens get to
+their lines, just as if we'd checked each line as it was read.
+"""
+
+import re
+import tokenize
+
+import lint_result
+import pep8     # our vendored copy; linters.py puts it on sys.path
+
+
+class _CheckPlan(object):
+    """The pep8 checks that pep8.options say to run, compiled for speed.
+
+    pep8.process_options() already leaves out the checks whose error
+    codes are all ignored.  We turn the rest into generated code like
+
+        def run_physical_checks(self, line):
+            _arg_indent_char = self.indent_char
+            result = _check_0(line)
+            if result is not None:
+                self.report_error(self.line_number, result[0], result[1],
+                                  _check_0)
+            result = _check_1(line, _arg_indent_char)
+            ...
+
+    The checks don't change the Checker, so we can fetch each
+    argument once, up front.  They run in the same order as in pep8,
+    so the errors come out in the same order too.
+    """
+    def __init__(self, options):
+        self.options = options
+        self.run_physical_checks = self._compile(
+            'run_physical_checks', options.physical_checks,
+            'self.report_error(self.line_number, result[0], result[1], %s)')
+        self.run_logical_checks = self._compile(
+            'run_logical_checks', options.logical_checks,
+            'self._report_logical_error(result, %s)')
+        self.batch_physical_checks = self._batch_physical_checks(options)
+        self._ignored_codes = {}
+
+    def _batch_physical_checks(self, options):
+        """Return how to run the physical checks on a whole file at once.
+
+        That's a list of (check, argument_names, find_candidate_lines)
+        triples, one for each physical check in options, in order; see
+        _BATCH_CHECKS.  If we don't know how to batch every check, we
+        return None, and the checks are run line by line instead.
+        """
+        long_line_re = re.compile('[^\n]{%d,}'
+                                  % (options.max_line_length + 1))
+        batch_checks = dict(_BATCH_CHECKS)
+        batch_checks[pep8.maximum_line_length] = (
+            lambda text, lines, indent_char:
+                _matching_line_numbers(long_line_re, text))
+
+        retval = []
+        for (_, check, argument_names) in options.physical_checks:
+            if (check not in batch_checks or
+                    not set(argument_names) <= _BATCH_CHECK_ARGUMENTS):
+                return None
+            retval.append((check, argument_names, batch_checks[check]))
+        return retval
+
+    def _compile(self, function_name, checks, report_statement):
+        """Return a function(checker, line) that runs all of checks.
+
+        checks are (name, function, argument_names) triples, as in
+        pep8.options.physical_checks.  The first argument of each
+        check is the line.
+        """
+        namespace = {}
+        fetched_arguments = set()
+        prologue = []
+        body = []
+        for (i, (_, check, argument_names)) in enumerate(checks):
+            check_name = '_check_%d' % i
+            namespace[check_name] = check
+            arguments = ['line']
+            for argument_name in argument_names[1:]:
+                if argument_name not in fetched_arguments:
+                    fetched_arguments.add(argument_name)
+                    prologue.append('    _arg_%s = self.%s'
+                                    % (argument_name, argument_name))
+                arguments.append('_arg_%s' % argument_name)
+            body.append('    result = %s(%s)'
+                        % (check_name, ', '.join(arguments)))
+            body.append('    if result is not None:')
+            body.append('        ' + report_statement % check_name)
+
+        source = '\n'.join(['def %s(self, line):' % function_name] +
+                            prologue + body + ['    pass']) + '\n'
+        exec compile(source, '<pep8 %s>' % function_name, 'exec') in namespace
+        return namespace[function_name]
+
+    def is_ignored(self, code):
+        """pep8.ignore_code(code), but remembering the answer."""
+        if code not in self._ignored_codes:
+            self._ignored_codes[code] = bool(pep8.ignore_code(code))
+        return self._ignored_codes[code]
+
+
+def _matching_line_numbers(regexp, text):
+    """Yield the numbers of the lines that regexp matches in, in order.
+
+    Lines are numbered from 1, and regexp must match at most once per
+    line.
+    """
+    line_number = 1
+    pos = 0
+    for m in regexp.finditer(text):
+        line_number += text.count('\n', pos, m.start())
+        pos = m.start()
+        yield line_number
+
+
+_INDENTED_LINE_RE = re.compile(r'^[ \t]', re.MULTILINE)
+_TAB_IN_INDENT_RE = re.compile(r'^ *\t', re.MULTILINE)
+_SPACE_IN_INDENT_RE = re.compile(r'^\t* ', re.MULTILINE)
+
+
+def _mixed_indent_line_numbers(text, lines, indent_char):
+    if indent_char == ' ':
+        return _matching_line_numbers(_TAB_IN_INDENT_RE, text)
+    elif indent_char == '\t':
+        return _matching_line_numbers(_SPACE_IN_INDENT_RE, text)
+    return ()      # no line is indented
+
+
+# For each physical-line check we can run on a whole file at once,
+# a function (text, lines, indent_char) that returns the numbers of
+# all the lines the check might complain about, in order.  We still
+# run the check itself on each of those lines, to get exactly the
+# errors it would have found.  indent_char is that of the first
+# indented line; no earlier line has an indent to complain about.
+# (maximum_line_length depends on the options, so _CheckPlan adds it.)
+_BATCH_CHECKS = {
+    pep8.tabs_obsolete: (lambda text, lines, indent_char:
+                         _matching_line_numbers(_TAB_IN_INDENT_RE, text)),
+    pep8.tabs_or_spaces: _mixed_indent_line_numbers,
+    # Every line but the last ends with a newline, which is enough.
+    pep8.missing_newline: (lambda text, lines, indent_char:
+                           [len(lines)] if lines else []),
+}
+
+# The arguments the checks in _BATCH_CHECKS may take.
+_BATCH_CHECK_ARGUMENTS = frozenset(['physical_line', 'indent_char'])
+
+
+_CHECK_PLAN = None
+
+
+def compile_checks():
+    """Compile the checks that pep8.options says to run.
+
+    Call this after pep8.process_options().  (Checker does it for
+    you if you forget, but it's better done once, up front.)
+    """
+    global _CHECK_PLAN
+    _CHECK_PLAN = _CheckPlan(pep8.options)
+
+
+def _check_plan():
+    if _CHECK_PLAN is None or _CHECK_PLAN.options is not pep8.options:
+        compile_checks()
+    return _CHECK_PLAN
+
+
+class Checker(pep8.Checker):
+    """Like pep8.Checker, but takes the file's tokens as input.
+
+    Arguments:
+       filename: the name of the file being checked, for error messages
+       lines: the lines of the file, including their trailing newlines
+       tokens: the tokens of the file, as generated by
+          tokenize.generate_tokens(); see python_parse.PythonParse.
+
+    After check_all(), self.errors holds the LintErrors it found.
+    """
+    def __init__(self, filename, lines, tokens):
+        pep8.Checker.__init__(self, filename, lines=lines)
+        self._all_tokens = tokens
+        self._plan = _check_plan()
+        self.errors = []
+
+    def _find_physical_errors(self):
+        """Run the physical checks on the whole file at once, if we can.
+
+        Returns a sorted list of (line number, [(offset, text, check)])
+        pairs, holding the errors in each line in the order the checks
+        found them.  Returns None if we have to check line by line,
+        instead: if the plan says so, or if the lines are split at
+        something other than '\n', which our regexps don't know about.
+        """
+        if self._plan.batch_physical_checks is None:
+            return None
+        text = ''.join(self.lines)
+        if '\r' in text:
+            return None
+
+        m = _INDENTED_LINE_RE.search(text)
+        indent_char = m.group() if m else None
+        self._indent_char_line_number = (
+            text.count('\n', 0, m.start()) + 1 if m else None)
+
+        errors_by_line = {}
+        for (check, argument_names, find_candidate_lines) in (
+                self._plan.batch_physical_checks):
+            for line_number in find_candidate_lines(text, self.lines,
+                                                    indent_char):
+                arguments = {'physical_line': self.lines[line_number - 1],
+                             'indent_char': indent_char}
+                result = check(*[arguments[name] for name in argument_names])
+                if result is not None:
+                    errors_by_line.setdefault(line_number, []).append(
+                        (result[0], result[1], check))
+        return sorted(errors_by_line.iteritems())
+
+    def _read_lines_through(self, line_number):
+        """Pretend we read lines up to line_number, as pep8 would.
+
+        That is: report the physical-line errors on those lines, and
+        set indent_char when we get to the first indented line.
+        """
+        if self._physical_errors is None:
+            while self.line_number < line_number:
+                self.readline_check_physical()
+            return
+
+        if (self.indent_char is None and
+                self._indent_char_line_number is not None and
+                self._indent_char_line_number <= line_number):
+            line = self.lines[self._indent_char_line_number - 1]
+            self.indent_char = line[0]
+        errors = self._physical_errors
+        while (self._next_physical_error < len(errors) and
+               errors[self._next_physical_error][0] <= line_number):
+            (error_line_number, line_errors) = (
+                errors[self._next_physical_error])
+            for (offset, text, check) in line_errors:
+                self.report_error(error_line_number, offset, text, check)
+            self._next_physical_error += 1
+        self.line_number = line_number
+
+    def check_physical(self, line):
+        """Run all physical checks on a raw input line."""
+        self.physical_line = line
+        if self.indent_char is None and line and line[0] in ' \t':
+            self.indent_char = line[0]
+        self._plan.run_physical_checks(self, line)
+
+    def check_logical(self):
+        """Build a line from tokens and run all logical checks on it."""
+        self.build_tokens_line()
+        first_token_start = self.mapping[0][1][2]
+        first_line = self.lines[first_token_start[0] - 1]
+        self.previous_indent_level = self.indent_level
+        self.indent_level = pep8.expand_indent(
+            first_line[:first_token_start[1]])
+        self._plan.run_logical_checks(self, self.logical_line)
+        self.previous_logical = self.logical_line
+
+    def _report_logical_error(self, result, check):
+        """Report what a logical-line check returned, as pep8 does."""
+        (offset, text) = result
+        if isinstance(offset, tuple):
+            (original_number, original_offset) = offset
+        else:
+            for (token_offset, token) in self.mapping:
+                if offset >= token_offset:
+                    original_number = token[2][0]
+                    original_offset = token[2][1] + offset - token_offset
+        self.report_error(original_number, original_offset, text, check)
+
+    def report_error(self, line_number, offset, text, check):
+        """Record an error, instead of printing it like pep8 does.
+
+        We always run pep8 with --repeat, and don't use its
+        statistics, so we don't bother keeping those up to date.
+        """
+        code = text[:4]
+        if self._plan.is_ignored(code) or code in self.expected:
+            return
+        self.file_errors += 1
+        self.errors.append(lint_result.LintError(
+            self.filename, self.line_offset + line_number, offset + 1,
+            code, text[5:]))
+
+    def _generate_tokens(self):
+        """Yield self._all_tokens, running physical checks as we go."""
+        self._physical_errors = self._find_physical_errors()
+        self._next_physical_error = 0
+        num_lines = len(self.lines)
+        for token in self._all_tokens:
+            token_end_line = min(token[3][0], num_lines)
+            if self.line_number < token_end_line:
+                self._read_lines_through(token_end_line)
+            yield token
+
+    def check_all(self, expected=None, line_offset=0):
+        """Run all checks on the input file.
+
+        This is the same as pep8.Checker.check_all(), except for where
+        the tokens come from.
+        """
+        self.expected = expected or ()
+        self.line_offset = line_offset
+        self.line_number = 0
+        self.file_errors = 0
+        self.indent_char = None
+        self.indent_level = 0
+        self.previous_logical = ''
+        self.blank_lines = 0
+        self.blank_lines_before_comment = 0
+        self.tokens = []
+        parens = 0
+        for token in self._generate_tokens():
+            self.tokens.append(token)
+            token_type, text = token[0:2]
+            if token_type == tokenize.OP and text in '([{':
+                parens += 1
+            if token_type == tokenize.OP and text in '}])':
+                parens -= 1
+            if token_type == tokenize.NEWLINE and not parens:
+                self.check_logical()
+                self.blank_lines = 0
+                self.blank_lines_before_comment = 0
+                self.tokens = []
+            if token_type == tokenize.NL and not parens:
+                if len(self.tokens) <= 1:
+                    # The physical line contains only this token.
+                    self.blank_lines += 1
+                self.tokens = []
+            if token_type == tokenize.COMMENT:
+                source_line = token[4]
+                token_start = token[2][1]
+                if source_line[:token_start].strip() == '':
+                    self.blank_lines_before_comment = max(
+                        self.blank_lines, self.blank_lines_before_comment)
+                    self.blank_lines = 0
+                if text.endswith('\n') and not parens:
+                    # The comment also ends a physical line.
+                    self.tokens = []
+        return self.file_errors
@@ -0,0 +1,72 @@
+"""Tokenize and parse python files once, for all the python linters.
+
+pep8 works from a file's tokens, and pyflakes from its abstract syntax
+tree.  Rather than have each of them tokenize or compile the file on
+its own, they both get it from here, via parse(), which does the
+work once per file.  This also means that a file with a syntax error
+is detected in one place, and reported once (by the Pyflakes linter).
+"""
+
+import _ast
+import tokenize
+
+import lint_profile
+
+
+class PythonParse(object):
+    """The tokens and abstract syntax tree for the contents of one file.
+
+    Attributes:
+       tokens: a list of the 5-tuples that tokenize.generate_tokens()
+          produces for the file.  If the file could not be tokenized,
+          this holds the tokens that came before the problem.
+       tokenize_error: None, or the exception that tokenize raised.
+       tree: the ast for the file, or None if it could not be compiled.
+       syntax_error: None, or a triple (linenum, colnum, msg) saying
+          why the file could not be compiled.  colnum may be None.
+    """
+    def __init__(self, contents):
+        """contents is a content_source.FileContents."""
+        self.tokens = []
+        self.tokenize_error = None
+        try:
+            for token in tokenize.generate_tokens(
+                    iter(contents.lines_keepends).next):
+                self.tokens.append(token)
+        except (tokenize.TokenError, SyntaxError), why:
+            self.tokenize_error = why
+
+        # The ast-parser fails if the file doesn't end in a newline,
+        # so make sure it does.
+        text = contents.text
+        if not text.endswith('\n'):
+            text += '\n'
+        self.tree = None
+        self.syntax_error = None
+        try:
+            self.tree = compile(text, '<lint>', 'exec', _ast.PyCF_ONLY_AST)
+        except SyntaxError, why:
+            if why.text is None:
+                # This means there's an encoding problem with the file.
+                self.syntax_error = (1, None, 'problem decoding source')
+            else:
+                # why.offset is relative to why.text, which can span
+                # several lines; we want it relative to the last one.
+                offset = why.offset
+                if offset is not None:
+                    offset -= sum(len(line) for line in
+                                  why.text.splitlines(True)[:-1])
+                self.syntax_error = (why.lineno, offset, why.args[0])
+        except Exception:
+            # e.g. TypeError, if the file has a null byte in it.
+            self.syntax_error = (1, None, 'problem decoding source')
+
+
+def _timed_parse(contents):
+    with lint_profile.phase('parse'):
+        return PythonParse(contents)
+
+
+def parse(contents):
+    """Return the PythonParse for a FileContents, computing it only once."""
+    return contents.memoize('python_parse', _timed_parse)
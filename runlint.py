@@ -30,64 +30,154 @@ filename extension.  (This can be overridden with the --lang flag.)
 Files with unknown or unsupported extensions will be skipped.
 """
 
-import fcntl
+# This comes first, so it sees khan-linter's code as it is before we
+# import the rest; see lint_update.code_changed().
+import lint_update
+# This comes next, so that if a lint server does our linting for us,
+# we don't have to import the linters first.
+import lint_daemon
+if __name__ == '__main__':
+    lint_daemon.lint_with_server_if_wanted()
+
+import collections
 import fnmatch
+import multiprocessing
 import optparse
 import os
 import re
+import signal
+import stat
 import subprocess
 import sys
+import threading
 import time
 
+import content_source
 import linters
+import lint_cache
+import lint_profile
+import lint_result
 import lint_util
+import lint_watch
 
 _DEFAULT_BLACKLIST_PATTERN = '<ancestor>/lint_blacklist.txt'
 _DEFAULT_EXTRA_LINTER = '<ancestor_within_repo>/tools/runlint.py'
 _CWD = lint_util.get_real_cwd()
 
-_BLACKLIST_CACHE = {}    # map from filename to its parsed contents (a set)
-
-
-def _parse_one_blacklist_line(line):
-    if line.endswith('/'):
-        # When blacklisting a directory, we add two entries: one for the
-        # directory name itself (to make pruning easier), and one for the
-        # entire directory tree (as a regexp).  This recursive call does
-        # the first of these.
-        retval = _parse_one_blacklist_line(line[:-1])
-    # If the code below this line has horrible syntax highlighting, check
-    # this out:  http://stackoverflow.com/questions/13210816/sublime-texts-syntax-highlighting-of-regexes-in-python-leaks-into-surrounding-c
-    elif not re.search(r'[[*?!]', line):
-        # Easy case: no char meaningful to glob()
-        return set((os.path.normpath(line),))
-    else:
-        retval = set()
+_BLACKLIST_CACHE = {}    # map from filename to its parsed _Blacklist
+
+
+# The characters that make a blacklist entry a glob pattern.
+# If the code below this line has horrible syntax highlighting, check
+# this out:  http://stackoverflow.com/questions/13210816/sublime-texts-syntax-highlighting-of-regexes-in-python-leaks-into-surrounding-c
+_GLOB_CHARS_RE = re.compile(r'[[*?!]')
+
+
+def _glob_to_re(glob):
+    """Return a regexp (as a string) matching the paths glob matches.
 
-    # If we get here, the pattern is a glob pattern.
-    if line.startswith('**/'):   # magic 'many directory' matcher
-        fnmatch_line = line[len('**/'):]
+    The regexp is meant to be used with re.match() and re.S.  If glob
+    ends with '/', it matches everything under the directory.
+    """
+    if glob.startswith('**/'):   # magic 'many directory' matcher
+        fnmatch_glob = glob[len('**/'):]
         re_prefix = '.*'
     else:
-        fnmatch_line = line
+        fnmatch_glob = glob
         re_prefix = ''
 
-    fnmatch_re = fnmatch.translate(fnmatch_line)   # glob -> re
+    fnmatch_re = fnmatch.translate(fnmatch_glob)   # glob -> re
+    # fnmatch.translate adds flags at the end, which we can't have
+    # once we combine several regexps into one.
+    if fnmatch_re.endswith('(?ms)'):
+        fnmatch_re = fnmatch_re[:-len('(?ms)')]
     # For some unknown reason, fnmatch.translate tranlates '*'
     # to '.*' rather than '[^/]*'.  We have to fix that.
     fnmatch_re = fnmatch_re.replace('.*', '[^/]*')
     # fnmatch.translate also puts in a \Z (same as $, basically).
     # But if the blacklist pattern is a directory, we don't want
     # that, since we want to do exactly a prefix match.
-    if fnmatch_line.endswith('/'):
+    if fnmatch_glob.endswith('/'):
         fnmatch_re = fnmatch_re.replace(r'\Z', '')
+    return re_prefix + fnmatch_re
 
-    retval.add(re.compile(re_prefix + fnmatch_re))
-    return retval
+
+def _combined_re(regexps):
+    """Compile a list of regexps into one that matches if any of them do."""
+    return re.compile('|'.join('(?:%s)' % regexp for regexp in regexps), re.S)
+
+
+class _Blacklist(object):
+    """The entries of a blacklist file, compiled for fast matching.
+
+    Each entry is a filename, a directory (ending in '/'), or a glob
+    pattern for either.  Rather than check a path against each entry
+    in turn, we sort the entries so matching a path is mostly a few
+    dict and set lookups:
+      * plain filenames, and directory names, go in a set
+      * plain directories also go in a set of directory prefixes,
+        which we look up each of the path's ancestor directories in
+      * glob patterns that start with a plain directory name are
+        compiled into one regexp per such directory, which we only
+        try on paths under that directory
+      * all other glob patterns (such as those starting with '**/')
+        are compiled into one regexp, which we try on every path
+    """
+    def __init__(self, entries):
+        self._names = set()
+        self._dir_prefixes = set()
+        regexps_by_top_dir = {}
+        other_regexps = []
+
+        for entry in entries:
+            if entry.endswith('/'):
+                # When blacklisting a directory, we match the directory
+                # name itself (to make pruning easier), and the entire
+                # directory tree.
+                globs = (entry[:-1], entry)
+            else:
+                globs = (entry,)
+
+            for glob in globs:
+                if not _GLOB_CHARS_RE.search(glob):
+                    if glob.endswith('/'):
+                        self._dir_prefixes.add(glob)
+                    else:
+                        self._names.add(os.path.normpath(glob))
+                    continue
+
+                top_dir = glob.split('/', 1)[0]
+                if '/' in glob and not _GLOB_CHARS_RE.search(top_dir):
+                    regexps_by_top_dir.setdefault(top_dir, []).append(
+                        _glob_to_re(glob))
+                else:
+                    other_regexps.append(_glob_to_re(glob))
+
+        self._re_by_top_dir = dict(
+            (top_dir, _combined_re(regexps))
+            for (top_dir, regexps) in regexps_by_top_dir.iteritems())
+        self._other_re = _combined_re(other_regexps) if other_regexps else None
+
+    def matches(self, path):
+        """True if path, relative to the blacklist's directory, is in it."""
+        if path in self._names:
+            return True
+
+        slash = path.find('/')
+        while slash != -1:
+            if path[:slash + 1] in self._dir_prefixes:
+                return True
+            slash = path.find('/', slash + 1)
+
+        top_dir_re = self._re_by_top_dir.get(path.split('/', 1)[0])
+        if top_dir_re is not None and top_dir_re.match(path):
+            return True
+
+        return self._other_re is not None and bool(self._other_re.match(path))
 
 
 def _parse_blacklist(blacklist_filename):
-    """Read from blacklist filename and returns a set of the contents.
+    """Read from blacklist filename and returns a _Blacklist of the contents.
 
     Blank lines and those that start with # are ignored.
 
@@ -95,22 +185,23 @@ def _parse_blacklist(blacklist_filename):
        blacklist_filename: the full path of the blacklist file
 
     Returns:
-       A set of all the paths listed in blacklist_filename.
-       These paths may be filename strings, directory name strings,
-       or re objects (for blacklist entries with '*'/etc in them).
+       A _Blacklist holding all the paths listed in blacklist_filename.
+       These paths may be filenames, directory names, or glob patterns
+       (for blacklist entries with '*'/etc in them).
     """
     if not blacklist_filename:
-        return set()
+        return _Blacklist(())
 
     if blacklist_filename in _BLACKLIST_CACHE:
         return _BLACKLIST_CACHE[blacklist_filename]
 
-    retval = set()
+    entries = []
     contents = open(blacklist_filename).readlines()
     for line in contents:
         line = line.strip()
         if line and not line.startswith('#'):
-            retval.update(_parse_one_blacklist_line(line))
+            entries.append(line)
+    retval = _Blacklist(entries)
     _BLACKLIST_CACHE[blacklist_filename] = retval
     return retval
 
@@ -132,6 +223,21 @@ def _is_toplevel_repository_dir(directory):
 _ANCESTOR_DIR_CACHE = {}
 
 
+def _parse_ancestor_pattern(ancestor_pattern):
+    """Return a pair (ancestor_basename, stop_at_repository), or None.
+
+    For '<ancestor>/foo', that's ('foo', False), and for
+    '<ancestor_within_repo>/foo', ('foo', True).  If ancestor_pattern
+    is just a filename, we return None.
+    """
+    if ancestor_pattern.startswith('<ancestor>/'):
+        return (ancestor_pattern[len('<ancestor>/'):], False)
+    elif ancestor_pattern.startswith('<ancestor_within_repo>/'):
+        return (ancestor_pattern[len('<ancestor_within_repo>/'):], True)
+    else:
+        return None
+
+
 def _resolve_ancestor(ancestor_pattern, file_to_lint):
     """If a_p starts with '<ancestor>/', replace based on file_to_lint.
 
@@ -148,14 +254,10 @@ def _resolve_ancestor(ancestor_pattern, file_to_lint):
     if not ancestor_pattern:
         return None
 
-    if ancestor_pattern.startswith('<ancestor>/'):
-        ancestor_basename = ancestor_pattern[len('<ancestor>/'):]
-        stop_at_repository = False
-    elif ancestor_pattern.startswith('<ancestor_within_repo>/'):
-        ancestor_basename = ancestor_pattern[len('<ancestor_within_repo>/'):]
-        stop_at_repository = True
-    else:
+    parsed_pattern = _parse_ancestor_pattern(ancestor_pattern)
+    if parsed_pattern is None:
         return ancestor_pattern   # the 'pattern' is an actual filename
+    (ancestor_basename, stop_at_repository) = parsed_pattern
 
     # The hard case: resolve '<ancestor>/' or '<ancestor_within_repo>/' to the
     # proper directory.
@@ -210,18 +312,7 @@ def _file_in_blacklist_helper(fname, blacklist_pattern):
                % (fname, blacklist_dir))
     fname = fname[len(blacklist_dir) + 1:]   # +1 for the trailing '/'
 
-    blacklist = _parse_blacklist(blacklist_filename)
-    if fname in blacklist:
-        return True
-
-    # The blacklist can have regexp patterns in it, so we need to
-    # check those too, one by one:
-    for blacklist_entry in blacklist:
-        if not isinstance(blacklist_entry, basestring):
-            if blacklist_entry.match(fname):
-                return True
-
-    return False
+    return _parse_blacklist(blacklist_filename).matches(fname)
 
 
 def _file_in_blacklist(fname, blacklist_pattern):
@@ -236,35 +327,342 @@ def _file_in_blacklist(fname, blacklist_pattern):
     return False
 
 
-def _files_under_directory(rootdir, blacklist_pattern, verbose):
-    """Return a set of files under rootdir not in the blacklist."""
+def _blacklist_checker(directory, blacklist_filename, blacklist_pattern):
+    """Return a function saying if entries of directory are blacklisted.
+
+    blacklist_filename is what blacklist_pattern resolves to for
+    files in directory.  The function we return does what
+    _file_in_blacklist() does, but faster, since it only has to
+    figure out the blacklist once for all the entries.  It takes
+    the name of an entry in directory, and a function that returns
+    True if the entry is a symlink (which it calls only if need be).
+    """
+    # The blacklist entries are relative to the blacklist's
+    # directory, so we need the path from there to here.
+    blacklist = None
+    path_prefix = None
+    if blacklist_filename:
+        blacklist = _parse_blacklist(blacklist_filename)
+        blacklist_dir = os.path.dirname(blacklist_filename)
+        if directory == blacklist_dir:
+            path_prefix = ''
+        elif directory.startswith(blacklist_dir + '/'):
+            path_prefix = directory[len(blacklist_dir) + 1:] + '/'
+
+    def in_blacklist(name, is_symlink):
+        path = os.path.join(directory, name)
+        if blacklist is None:
+            pass
+        elif path_prefix is None:
+            # Let _file_in_blacklist_helper complain about this.
+            if _file_in_blacklist_helper(path, blacklist_pattern):
+                return True
+        elif blacklist.matches(path_prefix + name):
+            return True
+        # If the entry is a symlink, resolve it and check again.
+        if blacklist_pattern and is_symlink():
+            return _file_in_blacklist_helper(os.path.realpath(path),
+                                             blacklist_pattern)
+        return False
+
+    return lint_profile.timed('blacklist', in_blacklist)
+
+
+try:
+    _scandir = os.scandir                    # python 3.5 and later
+except AttributeError:
+    try:
+        from scandir import scandir as _scandir     # the backport, from pypi
+    except ImportError:
+        _scandir = None
+
+
+class _DirEntry(object):
+    """The parts of scandir's DirEntry we use, for when we lack scandir.
+
+    scandir can usually tell what an entry is without a stat, from
+    the directory listing itself.  We have to lstat each entry (once),
+    and stat it too if it's a symlink.
+    """
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._mode = None
+
+    def _lstat_mode(self):
+        if self._mode is None:
+            try:
+                self._mode = os.lstat(self.path).st_mode
+            except OSError:
+                self._mode = 0
+        return self._mode
+
+    def is_symlink(self):
+        return stat.S_ISLNK(self._lstat_mode())
+
+    def is_dir(self):
+        if self.is_symlink():
+            return os.path.isdir(self.path)
+        return stat.S_ISDIR(self._lstat_mode())
+
+
+def _dir_entries(directory):
+    """Return the DirEntry-s for directory, or [] if we can't list it."""
+    try:
+        if _scandir is not None:
+            return list(_scandir(directory))
+        return [_DirEntry(directory, name) for name in os.listdir(directory)]
+    except OSError:
+        return []
+
+
+def _resolve_ancestor_in_listing(parsed_pattern, directory, names,
+                                 parent_value):
+    """Like _resolve_ancestor, given what it resolves to in the parent dir.
+
+    parsed_pattern is what _parse_ancestor_pattern() returned (not
+    None), names is the set of names in directory, and parent_value
+    is what the pattern resolves to in directory's parent.  We only
+    need to stat anything if the ancestor-file is in a subdirectory,
+    like <ancestor>/tools/runlint.py, and that subdirectory exists.
+    """
+    (ancestor_basename, stop_at_repository) = parsed_pattern
+    if ancestor_basename.split('/', 1)[0] in names:
+        ancestor_filename = os.path.join(directory, ancestor_basename)
+        if '/' not in ancestor_basename or os.path.exists(ancestor_filename):
+            return ancestor_filename
+    if stop_at_repository and ('.git' in names or '.hg' in names):
+        return None
+    return parent_value
+
+
+def _files_under_directory(rootdir, blacklist_pattern, verbose,
+                           ancestor_patterns=()):
+    """Return a set of files under rootdir not in the blacklist.
+
+    We walk the tree once, top-down.  We figure out what blacklist
+    applies to each directory (and what each of ancestor_patterns,
+    such as the extra linter's, resolves to there) from its listing
+    and its parent's blacklist, rather than looking for a blacklist
+    file from scratch for each file.  We record what we find in
+    _ANCESTOR_DIR_CACHE, so later _resolve_ancestor() calls on these
+    files need no stats at all.
+    """
+    patterns = set(p for p in (blacklist_pattern,) + tuple(ancestor_patterns)
+                   if p)
+    parsed_patterns = dict((p, _parse_ancestor_pattern(p)) for p in patterns)
+
     retval = set()
-    for root, dirs, files in os.walk(rootdir):
-        # Prune the subdirs that are in the blacklist.  We go
-        # backwards so we can use del.  (Weird os.walk() semantics:
-        # calling del on an element of dirs suppresses os.walk()'s
-        # traversal into that dir.)
-        for i in xrange(len(dirs) - 1, -1, -1):
-            absdir = os.path.join(root, dirs[i])
-            if _file_in_blacklist(absdir, blacklist_pattern):
+    # Each item is a directory to walk, and a map from each pattern
+    # to what it resolves to in that directory's parent.
+    to_walk = [(rootdir, None)]
+    while to_walk:
+        (directory, parent_resolved) = to_walk.pop()
+        entries = _dir_entries(directory)
+
+        if parent_resolved is None:
+            resolved = dict((p, _resolve_ancestor(p, directory))
+                            for p in patterns)
+        else:
+            names = set(entry.name for entry in entries)
+            resolved = {}
+            for p in patterns:
+                if parsed_patterns[p] is None:
+                    resolved[p] = p
+                else:
+                    resolved[p] = _resolve_ancestor_in_listing(
+                        parsed_patterns[p], directory, names,
+                        parent_resolved[p])
+                    _ANCESTOR_DIR_CACHE[(p, directory)] = resolved[p]
+
+            # We check whether a directory is in the blacklist only
+            # now, since the blacklist that applies to a directory is
+            # its own, if it has one, rather than its parent's.
+            if _blacklist_checker(os.path.dirname(directory),
+                                  resolved.get(blacklist_pattern),
+                                  blacklist_pattern)(
+                                      os.path.basename(directory),
+                                      lambda: False):
                 if verbose:
-                    print '... skipping directory %s: in blacklist' % absdir
-                del dirs[i]
-        # Prune the files that are in the blacklist.
+                    print '... skipping directory %s: in blacklist' % directory
+                continue
+
+        in_blacklist = _blacklist_checker(
+            directory, resolved.get(blacklist_pattern), blacklist_pattern)
+
+        for entry in entries:
+            if not entry.is_dir():
+                if in_blacklist(entry.name, entry.is_symlink):
+                    if verbose:
+                        print '... skipping file %s: in blacklist' % entry.path
+                else:
+                    retval.add(entry.path)
+            elif not entry.is_symlink():   # like os.walk, we don't follow
+                to_walk.append((entry.path, resolved))
+    return retval
+
+
+def _listed_files_under_directory(rootdir, listed_files, blacklist_pattern,
+                                  verbose, symlinks=None):
+    """Like _files_under_directory, but for files not (necessarily) on disk.
+
+    listed_files is a list of absolute filenames, such as all the
+    files in some git revision; we return those under rootdir that
+    are not in the blacklist.  As with _files_under_directory, a file
+    is skipped if any directory it's in is in the blacklist.
+
+    symlinks is the set of listed_files that are symlinks, if we know;
+    if it's None, we look on disk when we need to know.
+    """
+    if symlinks is None:
+        is_symlink = os.path.islink
+    else:
+        is_symlink = symlinks.__contains__
+
+    # We check all the files in a directory at once, so we only need
+    # to figure out its blacklist once.
+    rootdir_prefix = os.path.join(rootdir, '')
+    files_by_dir = {}
+    for f in listed_files:
+        if f.startswith(rootdir_prefix):
+            files_by_dir.setdefault(os.path.dirname(f), []).append(f)
+
+    dir_in_blacklist = {}
+
+    def in_blacklist(directory):
+        if directory == rootdir:
+            return False
+        if directory not in dir_in_blacklist:
+            # As in _files_under_directory, we use the directory's
+            # own blacklist, if it has one, for the directory itself.
+            dir_in_blacklist[directory] = (
+                in_blacklist(os.path.dirname(directory)) or
+                _blacklist_checker(
+                    os.path.dirname(directory),
+                    _resolve_ancestor(blacklist_pattern,
+                                      os.path.join(directory, '')),
+                    blacklist_pattern)(os.path.basename(directory),
+                                       lambda: os.path.islink(directory)))
+            if dir_in_blacklist[directory] and verbose:
+                print '... skipping directory %s: in blacklist' % directory
+        return dir_in_blacklist[directory]
+
+    retval = set()
+    for (directory, files) in files_by_dir.iteritems():
+        if in_blacklist(directory):
+            continue
+        checker = _blacklist_checker(
+            directory,
+            _resolve_ancestor(blacklist_pattern, os.path.join(directory, '')),
+            blacklist_pattern)
         for f in files:
-            abspath = os.path.join(root, f)
-            if _file_in_blacklist(abspath, blacklist_pattern):
+            if checker(os.path.basename(f), lambda: is_symlink(f)):
                 if verbose:
-                    print '... skipping file %s: in blacklist' % abspath
+                    print '... skipping file %s: in blacklist' % f
                 continue
-            retval.add(os.path.join(root, f))
+            retval.add(f)
     return retval
 
 
+def _git_toplevel(directory):
+    """Return the top of the git working tree directory is in, or None."""
+    # We don't use --show-toplevel, since it resolves symlinks, and
+    # we want the top as a path our filenames start with.
+    with open(os.devnull, 'w') as devnull:
+        try:
+            cdup = subprocess.check_output(
+                ['git', 'rev-parse', '--show-cdup'],
+                cwd=directory, stderr=devnull).rstrip('\n')
+        except (subprocess.CalledProcessError, OSError):
+            return None
+    return os.path.normpath(os.path.join(directory, cdup))
+
+
+def _git_listed_files(repo_dir, include_untracked):
+    """Return the files in the git working tree at repo_dir.
+
+    That's the files git tracks, and if include_untracked, the files
+    it doesn't that aren't ignored (by .gitignore and the like).  We
+    include the files in submodules (and, if include_untracked, in
+    untracked repositories inside this one), but not files that
+    have been deleted, or symlinks to directories, since walking the
+    directory tree wouldn't find those either.
+
+    Returns a pair: the set of absolute filenames, and the subset of
+    those that are symlinks.
+    """
+    # -t says whether each file is cached, deleted ('R'), etc.; -s
+    # gives the mode of the cached ones.
+    git_args = ['git', 'ls-files', '-z', '-t', '-s', '--cached', '--deleted']
+    if include_untracked:
+        git_args.extend(['--others', '--exclude-standard'])
+    output = subprocess.check_output(git_args, cwd=repo_dir)
+
+    files = set()
+    deleted = set()
+    symlinks = set()
+    for line in output.split('\0'):
+        if not line:
+            continue
+        (tag, line) = (line[0], line[2:])
+        if tag == '?':             # untracked: the line is just the path
+            (mode, path) = (None, line)
+        else:                      # '<mode> <sha> <stage>\t<path>'
+            (info, path) = line.split('\t', 1)
+            mode = info.split(' ', 1)[0]
+        filename = os.path.join(repo_dir, path)
+
+        if tag == 'R':
+            deleted.add(filename)
+        elif tag == 'S':           # not checked out (sparse checkout)
+            pass
+        elif mode == '160000' or path.endswith('/'):
+            # A submodule, or an untracked repository.
+            if os.path.exists(os.path.join(filename, '.git')):
+                (nested_files, nested_symlinks) = _git_listed_files(
+                    filename.rstrip('/'), include_untracked)
+                files.update(nested_files)
+                symlinks.update(nested_symlinks)
+        elif mode == '120000' or (mode is None and os.path.islink(filename)):
+            if not os.path.isdir(filename):
+                files.add(filename)
+                symlinks.add(filename)
+        else:
+            files.add(filename)
+    return (files - deleted, symlinks - deleted)
+
+
 def find_files_to_lint(files_and_directories,
                        blacklist='auto',
                        blacklist_pattern=_DEFAULT_BLACKLIST_PATTERN,
-                       verbose=False):
+                       verbose=False,
+                       source=None,
+                       ancestor_patterns=(),
+                       discovery='walk',
+                       only_files=None):
+    """Return the files to lint, given the files and directories to lint.
+
+    If source is not None, it is the content_source we'll be linting
+    from; if that isn't the working tree, we look at what files it
+    has, rather than what files are on disk.
+
+    discovery says how to find the files under directories on disk:
+    'walk' looks at every file on disk.  'git' uses `git ls-files`
+    to list the files git tracks (which skips ignored files, like
+    build output), and 'git-with-untracked' also lists the untracked
+    files git doesn't ignore.  Directories not in a git repository
+    are walked regardless.
+
+    ancestor_patterns are other '<ancestor>/' patterns (such as the
+    extra linter's) that we will resolve for the files we find.  We
+    can resolve them cheaply while we walk directories, so we do.
+
+    If only_files is not None, it is a set of absolute paths, and we
+    return just those of them that we would otherwise return.  We
+    don't look on disk for other files, so this is fast however big
+    the directories are.  (--watch uses this to decide which changed
+    files to lint again.)
+    """
     if blacklist == 'yes':
         file_blacklist = blacklist_pattern
         dir_blacklist = blacklist_pattern
@@ -280,12 +678,17 @@ def find_files_to_lint(files_and_directories,
         file_blacklist = None
         dir_blacklist = None
 
+    files_and_directories = [os.path.abspath(f)
+                             for f in files_and_directories]
+    if source is None:
+        source = content_source.WorkingTreeSource()
+    directories = source.directories(files_and_directories)
+
     # Ignore explicitly-listed files that are in the blacklist.
     files_to_lint = []
     directories_to_lint = []
     for f in files_and_directories:
-        f = os.path.abspath(f)
-        if os.path.isdir(f):
+        if f in directories:
             blacklist_for_f = dir_blacklist
         else:
             blacklist_for_f = file_blacklist
@@ -296,7 +699,7 @@ def find_files_to_lint(files_and_directories,
         if _file_in_blacklist(f, blacklist_for_f):
             if verbose:
                 print '... skipping (in blacklist)'
-        elif os.path.isdir(f):
+        elif f in directories:
             if verbose:
                 print ('... LINTING %s files under this directory'
                        % ('non-blacklisted' if dir_blacklist else 'all'))
@@ -308,10 +711,42 @@ def find_files_to_lint(files_and_directories,
 
     # TODO(csilvers): log if we skip a file in a directory because
     # it's in the blacklist?
+    # We only list the files the source has if we have to look in a
+    # directory; in a big repository, that can take a while.
+    listed_files = None
+    if directories_to_lint:
+        listed_files = source.list_files()
+        if listed_files is not None:
+            listed_files = sorted(os.path.abspath(f) for f in listed_files)
+
+    git_listings = {}     # map from a repository's top to its files
     for directory in directories_to_lint:
-        files_to_lint.extend(_files_under_directory(directory, dir_blacklist,
-                                                    verbose))
+        if listed_files is not None:
+            files_to_lint.extend(_listed_files_under_directory(
+                directory, listed_files, dir_blacklist, verbose))
+            continue
 
+        git_toplevel = None
+        if discovery != 'walk':
+            git_toplevel = _git_toplevel(directory)
+        if git_toplevel is not None:
+            if git_toplevel not in git_listings:
+                git_listings[git_toplevel] = _git_listed_files(
+                    git_toplevel, discovery == 'git-with-untracked')
+            (git_files, git_symlinks) = git_listings[git_toplevel]
+            if only_files is not None:
+                git_files = git_files.intersection(only_files)
+            files_to_lint.extend(_listed_files_under_directory(
+                directory, git_files, dir_blacklist, verbose, git_symlinks))
+        elif only_files is not None:
+            files_to_lint.extend(_listed_files_under_directory(
+                directory, only_files, dir_blacklist, verbose))
+        else:
+            files_to_lint.extend(_files_under_directory(
+                directory, dir_blacklist, verbose, ancestor_patterns))
+
+    if only_files is not None:
+        files_to_lint = [f for f in files_to_lint if f in only_files]
     files_to_lint.sort()    # just to be pretty
     return files_to_lint
 
@@ -323,6 +758,9 @@ _EXTENSION_DICT = {'.py': 'python',
                    '.less': 'less',
                    }
 
+# The languages that we lint with eslint.
+_ESLINT_LANGS = ('javascript', 'jsx')
+
 
 def _lang(filename, lang_option):
     """Returns a string representing the language filename is written in."""
@@ -332,8 +770,87 @@ def _lang(filename, lang_option):
     return _EXTENSION_DICT.get(extension, 'unknown')
 
 
-def _run_extra_linter(extra_linter_filename, files, verbose):
-    """Run extra_linter_filename if it exists and is executable.
+def _rename_temporary_copies(output, copies):
+    """Rename the copies in lint errors in output to their originals."""
+    lines = []
+    for line in output.splitlines(True):
+        error = lint_result.parse_text(line.rstrip('\n'))
+        if error is not None:
+            error = error._replace(
+                filename=copies.original_filename(error.filename))
+            line = error.to_text() + line[len(line.rstrip('\n')):]
+        lines.append(line)
+    return ''.join(lines)
+
+
+# We give each run of an extra linter at most this many files...
+_EXTRA_LINTER_FILES_PER_RUN = 100
+# ...and kill it if it takes longer than this.
+_EXTRA_LINTER_TIMEOUT_SECS = 10 * 60
+
+
+def _run_one_extra_linter(linter_filename, files, source=None):
+    """Run linter_filename on files, returning (stdout, stderr, returncode).
+
+    The extra linter reads the files itself.  So if source is not
+    the working tree, we give it temporary copies of the files'
+    contents to lint instead, and rename them back in its output.
+
+    If the linter takes longer than _EXTRA_LINTER_TIMEOUT_SECS, we
+    kill it, and returncode is None.
+    """
+    if source is not None and not source.on_disk:
+        with content_source.TemporaryCopies(source, files) as copies:
+            (stdout, stderr, returncode) = _run_one_extra_linter(
+                linter_filename, copies.filenames)
+            return (_rename_temporary_copies(stdout, copies),
+                    _rename_temporary_copies(stderr, copies),
+                    returncode)
+
+    with lint_profile.phase('extra linter', linter_filename):
+        p = subprocess.Popen([linter_filename, '-'], stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             close_fds=True)  # other threads may be forking
+        timed_out = []
+
+        def kill():
+            timed_out.append(True)
+            try:
+                p.kill()
+            except OSError:        # it just finished
+                pass
+
+        timer = threading.Timer(_EXTRA_LINTER_TIMEOUT_SECS, kill)
+        timer.daemon = True
+        timer.start()
+        try:
+            (stdout, stderr) = p.communicate(input='\n'.join(files))
+        finally:
+            timer.cancel()
+            timer.join()     # so it's not still around when we exit
+    return (stdout, stderr, None if timed_out else p.returncode)
+
+
+def _run_extra_linter_chunks(linter_filename, chunks, source, jobs):
+    """Run linter_filename on each list of files in chunks, jobs at once.
+
+    Returns a list of BackgroundCalls, one for each chunk, in order,
+    whose result() is what _run_one_extra_linter() returns for it.
+    We run each chunk in its own thread, but only let jobs of them
+    run the linter at the same time.
+    """
+    semaphore = threading.Semaphore(max(jobs, 1))
+
+    def run_chunk(files):
+        with semaphore:
+            return _run_one_extra_linter(linter_filename, files, source)
+
+    return [lint_util.BackgroundCall(run_chunk, files) for files in chunks]
+
+
+def _start_extra_linter(extra_linter_filename, files, verbose, formatter,
+                        source=None, jobs=1):
+    """Start running extra_linter_filename if it exists and is executable.
 
     extra_linter_filename can start with <ancestor>, in which case
     we use the same rule we use for the blacklist: for each file
@@ -343,11 +860,16 @@ def _run_extra_linter(extra_linter_filename, files, verbose):
 
     extra_linter_filename is passed a list of files; the same list
     of files that is used for the blacklist.  We limit each run to
-    100 files at a time to avoid shell overflow.
+    100 files at a time, and run up to jobs of them for each linter at
+    once.  Each run's exit code is the number of lint errors it
+    found.  source is where the files' contents come from (see
+    content_source.py).
+
+    The linters run in the background.  We return a function that
+    waits for them to finish, reports their output to formatter (in
+    the same order no matter which run finishes first), and returns
+    a pair: (number of lint errors, number of framework errors).
     """
-    num_lint_errors = 0
-    num_framework_errors = 0
-
     # Probably all these files will use the same linter, but let's
     # make sure.
     linter_to_files = {}
@@ -356,69 +878,59 @@ def _run_extra_linter(extra_linter_filename, files, verbose):
         if linter:
             linter_to_files.setdefault(linter, set()).add(f)
 
-    for (linter_filename, files) in linter_to_files.iteritems():
+    runs = []     # (linter_filename, files, BackgroundCall) triples
+    for (linter_filename, files) in sorted(linter_to_files.iteritems()):
         if not os.access(linter_filename, os.R_OK | os.X_OK):
             continue
         files = sorted(files)
         if verbose:
             print ('--- running extra linter %s on these files: %s'
                    % (linter_filename, files))
-        p = subprocess.Popen([linter_filename, '-'], stdin=subprocess.PIPE,
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        (stdout, stderr) = p.communicate(input='\n'.join(files))
-        # If the subprocess returned 1, it's possible this was due to a
-        # raised exception rather than a lint error.  We try to detect
-        # this by checking if stdout is empty: if so, it means that there
-        # was no actual lint error found, so this must be an exception.
-        if p.returncode > 0 and not stdout:
-            print ('ERROR running the extra linter %s on these files: %s: %s'
-                   % (linter_filename, files, stderr))
-            num_framework_errors += 1
-        else:
-            print stdout + stderr   # print the lint errors seen
-            num_lint_errors += p.returncode
-
-    return (num_lint_errors, num_framework_errors)
-
-
-def _maybe_pull(verbose):
-    """If the repo hasn't been updated in 24 hours, pull. If the working copy
-    changed as a result, return True. If no pull was done or there were no
-    changes, return False.
-    """
-    # If we're not a git repo, we can't pull.
-    if not os.path.isdir(os.path.join(_CWD, '.git')):
-        return False
-
-    try:
-        last_pull_time = os.stat('/tmp/khan-linter.pull').st_mtime
-    except (IOError, OSError):
-        last_pull_time = 0
-    if last_pull_time + 24 * 60 * 60 >= time.time():
-        return False
-
-    # Update the last-pull time, and create an fd for the lockf call.
-    with open('/tmp/khan-linter.pull', 'w') as f:
-        # Phabricator often runs two linters at the same time, meaning
-        # they could both contend for the 'git pull' call.  This lock
-        # prevents that.  (It does mean that we pull twice, but that's
-        # the safest way to make sure neither linter runs before the
-        # update is complete.)
-        fcntl.lockf(f, fcntl.LOCK_EX)
-        if verbose:
-            print 'Updating the khan-linter repo'
-
-        old_sha = subprocess.check_output(
-            ['git', 'rev-parse', 'HEAD'],
-            cwd=_CWD)
-        subprocess.check_call(
-            ['git', 'pull', '-q', '--no-rebase', '--ff-only'],
-            cwd=_CWD)
-        new_sha = subprocess.check_output(
-            ['git', 'rev-parse', 'HEAD'],
-            cwd=_CWD)
-
-    return new_sha != old_sha
+        chunks = [files[i:i + _EXTRA_LINTER_FILES_PER_RUN]
+                  for i in xrange(0, len(files), _EXTRA_LINTER_FILES_PER_RUN)]
+        runs.extend(zip([linter_filename] * len(chunks), chunks,
+                        _run_extra_linter_chunks(linter_filename, chunks,
+                                                 source, jobs)))
+
+    def finish():
+        num_lint_errors = 0
+        num_framework_errors = 0
+        for (linter_filename, files, run) in runs:
+            with lint_profile.phase('subprocess wait', linter_filename):
+                (stdout, stderr, returncode) = run.result()
+            if returncode is None:
+                formatter.note('ERROR running the extra linter %s on these '
+                               'files: %s: timed out after %s seconds'
+                               % (linter_filename, files,
+                                  _EXTRA_LINTER_TIMEOUT_SECS))
+                num_framework_errors += 1
+            # If the subprocess returned 1, it's possible this was due
+            # to a raised exception rather than a lint error.  We try
+            # to detect this by checking if stdout is empty: if so, it
+            # means that there was no actual lint error found, so this
+            # must be an exception.
+            elif returncode > 0 and not stdout:
+                formatter.note('ERROR running the extra linter %s on these '
+                               'files: %s: %s'
+                               % (linter_filename, files, stderr))
+                num_framework_errors += 1
+            else:
+                # Report the lint errors seen.  The extra linter
+                # prints them as text, so that's what we parse.
+                num_unreported = 0
+                with lint_profile.phase('filter', linter_filename):
+                    for line in (stdout + stderr).splitlines():
+                        error = lint_result.parse_text(line)
+                        if error is not None:
+                            num_unreported += 1 - formatter.report([error])
+                        elif line:
+                            formatter.note(line)
+                # We don't count errors the formatter chose not to
+                # report (see lint_result.ChangedLinesFilter).
+                num_lint_errors += max(returncode - num_unreported, 0)
+        return (num_lint_errors, num_framework_errors)
+
+    return finish
 
 
 # W291 trailing whitespace
@@ -428,13 +940,14 @@ _DEFAULT_PEP8_ARGS = ['--repeat',
                       '--ignore=W291,W293,W391']
 
 
-def _find_base_eslint_config(files_to_lint, default_location):
-    """Return a .eslintrc file in the repo's root directory if it exists.
+def _find_eslint_configs(files_to_lint, default_location):
+    """Return a map from each file to the eslint config to lint it with.
 
-    If this file exists, it will replace khan-linter's `eslintrc` as the
-    config file used for javascript linting. If you'd like a repo to use
-    khan-linter's eslintrc plus other stuff, create a .eslintrc in the root
-    directory of that repo and have it include a field:
+    Each file uses the .eslintrc in its repo's root directory, if
+    that exists, and default_location (khan-linter's `eslintrc`)
+    otherwise.  If you'd like a repo to use khan-linter's eslintrc
+    plus other stuff, create a .eslintrc in the root directory of that
+    repo and have it include a field:
         "extends": "../devtoools/khan-linter/eslintrc"`
 
     If the custom eslintrc depends on any extra node modules, for plugins or
@@ -444,34 +957,80 @@ def _find_base_eslint_config(files_to_lint, default_location):
     `repo/javascript/node_modules/babel-eslint` and the custom `.eslint` file
     is in `repo/.eslint`, then the path in the eslint file should be
     `javascript/node_modules/babel-eslint`.
+
+    Files from different repos may well use different configs; the
+    caller lints each group of files with its own Eslint linter.
     """
-    if not files_to_lint:
-        return default_location
+    config_for_dir = {}    # we only need to look once per directory
+    retval = {}
+    for path in files_to_lint:
+        directory = os.path.dirname(os.path.abspath(path))
+        if directory not in config_for_dir:
+            config_for_dir[directory] = default_location
+            base_git = _resolve_ancestor('<ancestor>/.git', directory)
+            if base_git:
+                base_eslint_config = os.path.join(os.path.dirname(base_git),
+                                                  '.eslintrc')
+                if os.path.exists(base_eslint_config):
+                    config_for_dir[directory] = base_eslint_config
+        retval[path] = config_for_dir[directory]
+    return retval
 
-    def _find_eslint_for_path(path):
-        base_git = _resolve_ancestor('<ancestor>/.git', path)
-        base_directory = os.path.dirname(base_git)
 
-        base_eslint_config = os.path.join(base_directory, '.eslintrc')
-        if os.path.exists(base_eslint_config):
-            return base_eslint_config
-        return default_location
+# Map from (base_eslint_config, propose_arc_fixes) to a processor_dict
+# (see _get_processor_dict).  Constructing the linters is not free --
+# Pep8 has to process its options, for instance -- so long-running
+# processes (see lint_daemon.py) reuse them from one run to the next.
+_PROCESSOR_DICT_CACHE = {}
 
-    config_path = _find_eslint_for_path(files_to_lint[0])
-    for path in files_to_lint[1:]:
-        if _find_eslint_for_path(path) != config_path:
-            # TODO(jared): partition files_to_lint by config file, and run
-            # eslint once for each config file instead of bailing.
-            raise Exception("Files to lint depend on multiple custom eslint "
-                    "config files. This is currently unsupported.")
 
-    return config_path
+def _get_processor_dict(base_eslint_config, propose_arc_fixes):
+    """Return a dict from language (output of _lang) to a list of processors.
+
+    A language that is not in the dict is skipped.
+    """
+    key = (base_eslint_config, propose_arc_fixes)
+    if key in _PROCESSOR_DICT_CACHE:
+        return _PROCESSOR_DICT_CACHE[key]
+
+    processor_dict = {
+        'python': (linters.Pep8([sys.argv[0]] + _DEFAULT_PEP8_ARGS,
+                        propose_arc_fixes=propose_arc_fixes),
+                   linters.Pyflakes(propose_arc_fixes=propose_arc_fixes),
+                   linters.CustomPythonLinter(),
+                   linters.Git(),
+                   ),
+        'javascript': (linters.Eslint(base_eslint_config, propose_arc_fixes),
+                       linters.Git(),
+                       ),
+        'html': (linters.HtmlLinter(),
+                 linters.Git(),
+                 ),
+        'jsx': (linters.Eslint(base_eslint_config, propose_arc_fixes),
+                linters.Git(),
+                ),
+        'less': (linters.LessHint(),
+                 linters.Git(),
+                 ),
+        'unknown': (linters.Git(),
+                    ),
+        }
+    _PROCESSOR_DICT_CACHE[key] = processor_dict
+    return processor_dict
+
+
+def _init_pool_subprocess():
+    """Make pool subprocesses leave handling of control-C to the parent."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    lint_profile.reset_in_subprocess()
 
 
 def main(files_and_directories,
          blacklist='auto', blacklist_pattern=_DEFAULT_BLACKLIST_PATTERN,
          extra_linter_filename=_DEFAULT_EXTRA_LINTER, lang='', verbose=False,
-         propose_arc_fixes=False):
+         propose_arc_fixes=False, cache_dir=None, jobs=1,
+         output_format='text', changed_lines=None, source='working-tree',
+         discovery='walk', formatter=None):
     """Call the appropriate linters on all given files and directory trees.
 
     Arguments:
@@ -486,51 +1045,69 @@ def main(files_and_directories,
         we know how to automatically fix the problem. `arc lint` consumes these
         special strings and prompts the user to see if they want to accept the
         patch.
+      cache_dir: if not None, a directory holding a cache of lint results.
+        Files whose contents (and linter configuration) are unchanged since
+        they were last linted are not linted again; instead we print the
+        lint output from the last time.
+      jobs: how many processes to use to run the per-file linters (such
+        as pep8 and pyflakes), and how many copies of each external
+        linter (such as eslint) to run at once.  0 means to use one
+        process per cpu.
+      output_format: how to print the lint errors: one of the keys of
+        lint_result.FORMATTERS.
+      changed_lines: if not None, a map from filename to the set of
+        line numbers to report lint errors on.  Lint errors on any
+        other lines (or in any other files) are neither reported nor
+        counted.  The commit hook uses this to complain only about
+        lines that are being committed.
+      source: where to get the contents of the files to lint from:
+        'working-tree' (the files on disk), 'index' (the git index), or
+        a git revision, like 'HEAD'.  The files to lint (under any
+        directories given) are also taken from there.
+      discovery: how to find the files to lint under any directories
+        given, when linting the working tree: 'walk', 'git', or
+        'git-with-untracked'; see find_files_to_lint().
+      formatter: if not None, the lint_result formatter to report lint
+        errors to, instead of making one for output_format.
 
     Returns:
       A pair: (number of lint errors seen, number of unlintable files seen).
       (0, 0) means lint-cleanliness.  If the second value is non-zero, it
       means there was a problem in the lint framework itself somewhere.
     """
-    files_to_lint = find_files_to_lint(files_and_directories,
-                                       blacklist, blacklist_pattern, verbose)
+    # All the linters get file contents from here, so each file is
+    # only read once.
+    source = content_source.make_source(source)
 
-    default_eslint_config = os.path.join(_CWD, "eslintrc")
-    base_eslint_config = _find_base_eslint_config(files_to_lint,
-            default_eslint_config)
+    with lint_profile.phase('discovery'):
+        files_to_lint = find_files_to_lint(files_and_directories,
+                                           blacklist, blacklist_pattern,
+                                           verbose, source,
+                                           (extra_linter_filename,),
+                                           discovery)
 
-    # A dict that maps from language (output of _lang) to a list of processors.
-    # None means that we skip files of this language.
-    processor_dict = {
-        'python': (linters.Pep8([sys.argv[0]] + _DEFAULT_PEP8_ARGS,
-                        propose_arc_fixes=propose_arc_fixes),
-                   linters.Pyflakes(propose_arc_fixes=propose_arc_fixes),
-                   linters.CustomPythonLinter(),
-                   linters.Git(),
-                   ),
-        'javascript': (linters.Eslint(base_eslint_config, propose_arc_fixes),
-                       linters.Git(),
-                       ),
-        'html': (linters.HtmlLinter(),
-                 linters.Git(),
-                 ),
-        'jsx': (linters.Eslint(base_eslint_config, propose_arc_fixes),
-                linters.Git(),
-                ),
-        'less': (linters.LessHint(),
-                 linters.Git(),
-                 ),
-        'unknown': (linters.Git(),
-                    ),
-        }
+    default_eslint_config = os.path.join(_CWD, "eslintrc")
+    eslint_configs = _find_eslint_configs(
+        [f for f in files_to_lint if _lang(f, lang) in _ESLINT_LANGS],
+        default_eslint_config)
 
     # Dict of {lint_processor: [(filename, contents)]}
     files_by_linter = {}
 
+    if formatter is None:
+        formatter = lint_result.FORMATTERS[output_format]()
+    if changed_lines is not None:
+        formatter = lint_result.ChangedLinesFilter(formatter, changed_lines)
+    cache = lint_cache.LintCache(cache_dir) if cache_dir else None
+
     num_lint_errors = 0
     num_framework_errors = 0
     for f in files_to_lint:
         file_lang = _lang(f, lang)
+        # Files that use different eslint configs get different
+        # Eslint linters, which all run at the same time.
+        processor_dict = _get_processor_dict(
+            eslint_configs.get(f, default_eslint_config), propose_arc_fixes)
         lint_processors = processor_dict.get(file_lang, None)
         if lint_processors is None:
             if verbose:
@@ -541,39 +1118,233 @@ def main(files_and_directories,
             # To make the lint errors look nicer, let's pass in the
             # filename relative to the current-working directory,
             # rather than using the abspath.
-            files_by_linter.setdefault(lint_processor, []).append(
-                    os.path.relpath(f))
+            relpath = os.path.relpath(f)
+            files_by_linter.setdefault(lint_processor, []).append(relpath)
+            source.add_user(relpath)
+
+    if jobs == 0:
+        jobs = multiprocessing.cpu_count()
+    # We create the pool only now, after the linters have been
+    # constructed, so the subprocesses inherit all their setup.
+    if jobs > 1:
+        process_pool = multiprocessing.Pool(jobs, _init_pool_subprocess)
+        # All the in-process linters share this, so each file goes to
+        # a subprocess only once.
+        pool = linters.PoolBatch(process_pool)
+    else:
+        process_pool = pool = None
 
-    for lint_processor in files_by_linter:
+    # We start the extra linter, and all the linters that run in a
+    # subprocess (such as eslint), first.  That way they run in the
+    # background while we run the in-process linters (such as pep8),
+    # and the whole thing takes about as long as the slowest linter,
+    # rather than as long as all of them put together.
+    if extra_linter_filename:
+        finish_extra_linter = _start_extra_linter(extra_linter_filename,
+                                                  files_to_lint, verbose,
+                                                  formatter, source, jobs)
+
+    # We report each linter's errors in a fixed order, so the output
+    # is the same from one run to the next: in-process linters first
+    # (see below), then by name.  Linters of the same class (Eslint
+    # linters for different configs) go in the order of their files.
+    lint_processors = sorted(
+        files_by_linter,
+        key=lambda lint_processor: (lint_processor.runs_in_subprocess,
+                                    lint_processor.__class__.__name__,
+                                    files_by_linter[lint_processor]))
+    finishers = []
+    for lint_processor in lint_processors:
         files = files_by_linter[lint_processor]
+        try:
+            finishers.append((lint_processor, files,
+                              lint_processor.start_process_files(
+                                  files, cache, pool, source, jobs,
+                                  formatter)))
+        except Exception, why:
+            formatter.note("ERROR linting %r: %s" % (files, why))
+            num_framework_errors += 1
+
+    # Now we wait for all the linters to finish, in-process ones first.
+    for (lint_processor, files, finish) in finishers:
         try:
             if verbose:
                 print '--- Running %s:' % lint_processor.__class__.__name__
 
             start_time = time.time()
-            num_new_errors = lint_processor.process_files(files)
+            num_new_errors = finish()
             num_lint_errors += num_new_errors
             elapsed = time.time() - start_time
 
             if verbose:
                 print '%d errors (%.2f seconds)' % (num_new_errors, elapsed)
         except Exception, why:
-            print "ERROR linting %r: %s" % (files, why)
+            formatter.note("ERROR linting %r: %s" % (files, why))
             num_framework_errors += 1
             continue
 
-    # If they asked for an extra linter to run over these files, do that.
+    if process_pool is not None:
+        process_pool.close()
+        process_pool.join()
+
+    if cache:
+        cache.prune()
+
+    # If they asked for an extra linter to run over these files, wait
+    # for it too.
     if extra_linter_filename:
-        (extra_lint_errors, extra_framework_errors) = (
-            _run_extra_linter(extra_linter_filename, files_to_lint, verbose))
+        (extra_lint_errors, extra_framework_errors) = finish_extra_linter()
         num_lint_errors += extra_lint_errors
         num_framework_errors += extra_framework_errors
 
+    source.close()
+    formatter.finish()
+
     return (num_lint_errors, num_framework_errors)
 
 
-if __name__ == '__main__':
-    parser = optparse.OptionParser(USAGE)
+def _print_error_diff(old_errors, new_errors):
+    """Print '- <error>' for each error gone, and '+ <error>' for each new.
+
+    The errors are lists of LintErrors in text form.  Returns how many
+    lines we printed.
+    """
+    old_counts = collections.Counter(old_errors)
+    new_counts = collections.Counter(new_errors)
+    num_printed = 0
+    for error in sorted((old_counts - new_counts).elements()):
+        print '- %s' % error
+        num_printed += 1
+    for error in sorted((new_counts - old_counts).elements()):
+        print '+ %s' % error
+        num_printed += 1
+    return num_printed
+
+
+def watch(files_and_directories,
+          blacklist='auto', blacklist_pattern=_DEFAULT_BLACKLIST_PATTERN,
+          extra_linter_filename=_DEFAULT_EXTRA_LINTER, verbose=False,
+          discovery='walk', **main_kwargs):
+    """Lint everything, then lint files again whenever they change.
+
+    We start by linting, and printing the lint errors, just like
+    main().  Then we wait for files to change, and lint just those
+    files again -- reusing the parsed blacklists, the cache of where
+    blacklists and extra linters are, and the linters themselves --
+    and print how the lint errors have changed: '+ <error>' for each
+    new error, and '- <error>' for each one that's gone.  We only
+    notice changes to files that main() would lint.
+
+    If a blacklist, or the extra linter, changes, then which files we
+    should lint (and the errors in them) may change anywhere, so we
+    lint everything again, and print the differences as usual.
+
+    This runs until it's interrupted (with control-C).  The arguments
+    are as for main().
+    """
+    roots = [os.path.abspath(f) for f in files_and_directories]
+    dir_blacklist = blacklist_pattern if blacklist != 'no' else None
+    # These are the files that, if they change, may change everything.
+    config_basenames = set(os.path.basename(f)
+                           for f in (blacklist_pattern, extra_linter_filename)
+                           if f)
+
+    def lint(files):
+        """Lint files; return a map from absolute filename to its errors."""
+        formatter = lint_result.CollectingFormatter()
+        if files:
+            # We only keep khan-linter from being updated while we
+            # lint, not while we wait.
+            with lint_update.lint_lock():
+                code_changed = lint_update.code_changed()
+                if not code_changed:
+                    main(files, blacklist, blacklist_pattern,
+                         extra_linter_filename, verbose=verbose,
+                         discovery=discovery, formatter=formatter,
+                         **main_kwargs)
+            if code_changed:
+                # khan-linter has been updated: start over with the
+                # new code.
+                _restart()
+        errors_by_file = {}
+        for error in formatter.errors:
+            errors_by_file.setdefault(os.path.abspath(error.filename),
+                                      []).append(error.to_text())
+        return errors_by_file
+
+    def skip_dir(directory):
+        return (dir_blacklist is not None and
+                _file_in_blacklist(directory, dir_blacklist))
+
+    def list_files():
+        return find_files_to_lint(files_and_directories, blacklist,
+                                  blacklist_pattern, discovery=discovery)
+
+    errors_by_file = lint(files_and_directories)
+    for filename in sorted(errors_by_file):
+        for error in errors_by_file[filename]:
+            print error
+    print >>sys.stderr, ('--- %d lint errors; watching for changes...'
+                         % sum(len(v) for v in errors_by_file.itervalues()))
+    sys.stdout.flush()
+
+    watcher = lint_watch.make_watcher(roots, skip_dir, list_files)
+    if verbose:
+        print 'Watching with %s' % watcher.__class__.__name__
+    try:
+        while True:
+            changed = watcher.wait()
+            if changed is not None and not any(
+                    os.path.basename(f) in config_basenames for f in changed):
+                # A deleted directory means all the files under it
+                # are gone.
+                for path in list(changed):
+                    prefix = os.path.join(path, '')
+                    changed.update(f for f in errors_by_file
+                                   if f.startswith(prefix))
+                files = [f for f in find_files_to_lint(
+                             files_and_directories, blacklist,
+                             blacklist_pattern, discovery=discovery,
+                             only_files=changed)
+                         if os.path.isfile(f)]
+                new_errors_by_file = lint(files)
+                changed.update(new_errors_by_file)
+            else:
+                # We don't know what changed, or something changed
+                # that can affect anything: start over.
+                _BLACKLIST_CACHE.clear()
+                _ANCESTOR_DIR_CACHE.clear()
+                watcher.close()
+                watcher = lint_watch.make_watcher(roots, skip_dir, list_files)
+                new_errors_by_file = lint(files_and_directories)
+                changed = set(errors_by_file) | set(new_errors_by_file)
+
+            num_printed = 0
+            for filename in sorted(changed):
+                num_printed += _print_error_diff(
+                    errors_by_file.pop(filename, []),
+                    new_errors_by_file.get(filename, []))
+                if filename in new_errors_by_file:
+                    errors_by_file[filename] = new_errors_by_file[filename]
+            if num_printed:
+                print >>sys.stderr, ('--- %d lint errors'
+                                     % sum(len(v) for v
+                                           in errors_by_file.itervalues()))
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+
+def parse_commandline(argv, prog=None):
+    """Parse commandline arguments (not including argv[0]) for main().
+
+    prog is the name of the program, for --help and errors; None means
+    to use argv[0].  Returns a pair (options, args), as optparse does.
+    """
+    parser = optparse.OptionParser(USAGE, prog=prog)
     parser.add_option('--blacklist', choices=['yes', 'no', 'auto'],
                       default='auto',
                       help=('If yes, ignore files that are on the blacklist. '
@@ -604,6 +1375,11 @@ if __name__ == '__main__':
                             'language.  If empty, guess from extension.'))
     parser.add_option('--no-auto-pull', action='store_true', default=False,
                       help=("Don't try to update this repo once a day."))
+    parser.add_option('--auto-pull', type='choice',
+                      choices=['background', 'sync'], default='background',
+                      help=('How to update this repo once a day: in the '
+                            '"background", taking effect for later lints, '
+                            'or "sync", before linting. Default: %default'))
     parser.add_option('--always-exit-0', action='store_true', default=False,
                       help=('Exit 0 even if there are lint errors (though we '
                             'will still exit non-zero if there are errors in '
@@ -613,29 +1389,144 @@ if __name__ == '__main__':
                       default=False,
                       help=('Propose patches that arc can apply to fix lint'
                             'errors. Only useful when used with phabricator.'))
+    parser.add_option('--cache-dir', default=lint_cache.default_cache_dir(),
+                      help=('Where to cache lint results, so files that have '
+                            'not changed since they were last linted are not '
+                            'linted again.  Default: %default'))
+    parser.add_option('--no-cache', action='store_true', default=False,
+                      help="Don't read or write the lint-result cache.")
+    parser.add_option('--jobs', '-j', type='int', default=1,
+                      help=('How many processes to use to run each linter '
+                            '(pep8 and pyflakes share a process pool; eslint '
+                            'and lesshint run as several processes when '
+                            'there are enough files). 0 means to use one '
+                            'per cpu. Default: %default'))
+    parser.add_option('--format', type='choice',
+                      choices=sorted(lint_result.FORMATTERS), default='text',
+                      help=('How to print the lint errors: one of %s. '
+                            'Default: %%default'
+                            % ', '.join(sorted(lint_result.FORMATTERS))))
+    parser.add_option('--source', default='working-tree',
+                      help=('Where to read the files to lint from: '
+                            '"working-tree" (the files on disk), "index" '
+                            '(what git would commit), or a git revision, '
+                            'like HEAD, to lint the files as of then. '
+                            'Default: %default'))
+    parser.add_option('--discovery', type='choice',
+                      choices=['walk', 'git', 'git-with-untracked'],
+                      default='walk',
+                      help=('How to find the files to lint in directories: '
+                            '"walk" the filesystem, or ask "git" for the '
+                            'files it tracks, skipping ignored files (and, '
+                            'with "git-with-untracked", also the untracked '
+                            'files it does not ignore). Directories not in a '
+                            'git repository are always walked. '
+                            'Default: %default'))
+    parser.add_option('--watch', action='store_true', default=False,
+                      help=('After linting, keep watching the files and '
+                            'directories, and whenever files change, lint '
+                            'them again and print the lint errors that have '
+                            'appeared ("+ ...") and gone away ("- ...").'))
+    parser.add_option('--profile', metavar='OUT.JSON',
+                      help=('Print a profile of where the time went -- in '
+                            'each phase of linting, in each linter, and in '
+                            'the slowest files -- to stderr.  With '
+                            '--profile=OUT.JSON, also write it to OUT.JSON.  '
+                            'The "=" is required: "--profile OUT.JSON" '
+                            'profiles without writing a file, and lints '
+                            'OUT.JSON.'))
     parser.add_option('--verbose', '-v', action='store_true', default=False,
                       help='Print information about what is happening.')
 
-    options, args = parser.parse_args()
+    # --profile takes an optional value, which optparse can't do, so
+    # we only take the value if it's given as --profile=<value>.
+    argv = ['--profile=' if arg == '--profile' else arg for arg in argv]
+    options, args = parser.parse_args(argv)
+    if (options.source not in ('working-tree', 'index') and
+            not content_source.is_git_revision(options.source)):
+        parser.error('--source: "%s" is not a git revision' % options.source)
+    if options.watch and options.source != 'working-tree':
+        parser.error('--watch only works with --source=working-tree')
+    if options.watch and options.format != 'text':
+        parser.error('--watch only works with --format=text')
+    if options.watch and options.profile is not None:
+        parser.error('--profile does not work with --watch')
     if not args:
         args = ['.']
+    return (options, args)
 
-    # Once a day, we do a 'git pull' in our repo to make sure we are
-    # the most up-to-date khan-linter we can be.
-    if not options.no_auto_pull and _maybe_pull(options.verbose):
-        # We have to re-exec ourselves since we may have changed.
-        os.execv(sys.argv[0], sys.argv)
 
-    # normal operation
-    (num_lint_errors, num_framework_errors) = main(
-        args,
-        options.blacklist, options.blacklist_filename,
-        options.extra_linter, options.lang,
-        options.verbose, options.propose_arc_fixes)
+def _restart():
+    """Start runlint.py over, with the same arguments; we never return."""
+    os.execv(sys.argv[0], sys.argv)
+
+
+def run_from_commandline(options, args, changed_lines=None):
+    """Call main() as directed by parse_commandline(), returning exit code.
+
+    changed_lines is as for main(); it has no commandline flag, since
+    it's for the commit hook (which may lint via lint_daemon.py).
+
+    Unless we're watching, the caller should hold lint_update.lint_lock()
+    while we run.
+    """
+    if options.watch:
+        return watch(args,
+                     options.blacklist, options.blacklist_filename,
+                     options.extra_linter, options.verbose,
+                     options.discovery, lang=options.lang,
+                     propose_arc_fixes=options.propose_arc_fixes,
+                     cache_dir=None if options.no_cache else options.cache_dir,
+                     jobs=options.jobs)
+
+    if options.profile is not None:
+        lint_profile.start()
+    try:
+        (num_lint_errors, num_framework_errors) = main(
+            args,
+            options.blacklist, options.blacklist_filename,
+            options.extra_linter, options.lang,
+            options.verbose, options.propose_arc_fixes,
+            None if options.no_cache else options.cache_dir,
+            options.jobs, options.format, changed_lines=changed_lines,
+            source=options.source, discovery=options.discovery)
+    finally:
+        profiler = lint_profile.stop()
+    if profiler is not None:
+        profiler.report(sys.stderr)
+        if options.profile:
+            profiler.write_json(options.profile)
 
     if options.always_exit_0:
         # If the framework itself had an error, we want to report that.
-        sys.exit(num_framework_errors)
+        return num_framework_errors
     else:
         # Don't exit with error code of 128+, which means 'killed by a signal'
-        sys.exit(min(num_lint_errors + num_framework_errors, 127))
+        return min(num_lint_errors + num_framework_errors, 127)
+
+
+if __name__ == '__main__':
+    (options, args) = parse_commandline(sys.argv[1:])
+
+    # Once a day, we update our repo to make sure we are the most
+    # up-to-date khan-linter we can be; see lint_update.py.
+    if not options.no_auto_pull:
+        if options.auto_pull == 'sync':
+            if lint_update.maybe_update(options.verbose):
+                # We have to re-exec ourselves since we may have changed.
+                _restart()
+        else:
+            lint_update.maybe_start_background_update(options.verbose)
+
+    # normal operation
+    if options.watch:
+        # watch() holds the lock only while it lints.
+        sys.exit(run_from_commandline(options, args))
+    with lint_update.lint_lock():
+        if not lint_update.code_changed():
+            sys.exit(run_from_commandline(options, args))
+    # khan-linter was updated after we imported it, but before we got
+    # the lock, so we may have imported a mix of old and new code.
+    # (We don't restart while holding the lock, since the new process
+    # would inherit it.)
+    _restart()